@@ -1 +1 @@
-__all__ = ["run", "orchestrator", "tracer", "rpi_loop", "utils"]
+__all__ = ["run", "orchestrator", "tracer", "rpi_loop", "utils", "pool", "cache", "neardup", "singleflight", "usagelog", "usagestats", "streamjson", "metrics", "tracing", "promexport", "output", "linequeue", "httpapi", "multiplex", "ratelimit", "hostslots"]
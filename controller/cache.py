@@ -0,0 +1,1110 @@
+#!/usr/bin/env python3
+"""
+CLI Response Cache
+
+On-disk cache for CLI outputs, bounded by total bytes and entry count with
+least-recently-used eviction. Entries are small JSON documents (at least
+{"ts": ..., "output": ...}) stored one file per key.
+
+Two layouts are available:
+- FileCache: one file per key; recency is kept in file mtimes (touched on
+  every hit), so LRU order survives restarts and is shared across processes.
+- PackCache: a single append-only pack file with a key→offset index,
+  memory-mapped for reads.
+
+Entries may carry a snapshot of the workspace paths they were computed
+from (snapshot_paths); callers treat an entry whose snapshot no longer
+matches as a miss. Entries from write-capable phases may also carry the
+file changes the agent made (capture_effects), re-applied on a hit
+(apply_effects) so the workspace ends up where a real run would leave it.
+
+Both store entries through EntryCodec, which compresses them (zlib, lzma,
+or, for callers that ask, zlib with a dictionary trained on existing
+entries) behind a one-line header naming the codec. Plain JSON entries
+remain readable.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+
+# Other processes may add or evict entries; re-scan the directory this often
+# so the in-memory size accounting does not drift.
+RESCAN_SEC = 60.0
+# Streamed entries are encoded in memory up to this size, then in a temp file.
+SPOOL_BYTES = 1024 * 1024
+
+
+# ============================================================================
+# ENTRY CODECS
+# ============================================================================
+
+CODECS = ("none", "zlib", "lzma")
+CODEC_MAGIC = b"TC1 "
+ZDICT_MAX_BYTES = 32 * 1024  # zlib only looks back over a 32 KiB window
+
+
+class EntryCodec:
+    """
+    Serialize cache entries to bytes, optionally compressed.
+
+    Compressed entries start with a header line `TC1 <codec> <dict-id>`;
+    anything else is read as plain JSON. With codec "zlib", a trained
+    dictionary present in `dict_dir` and `use_dict` set, an entry is
+    compressed against the dictionary and the header records which one, so
+    retraining never breaks old entries. Decoding against a dictionary costs
+    more than plain zlib, so it is only worth it where entries are small
+    and share a lot of boilerplate.
+    """
+
+    def __init__(self, codec: str = "zlib", dict_dir: Optional[Path] = None, level: int = 6):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown cache codec: {codec}")
+        self.codec = codec
+        self.dict_dir = Path(dict_dir) if dict_dir else None
+        self.level = level
+        self._dicts: dict[str, bytes] = {}
+        self._current_dict: Optional[tuple[str, bytes]] = None
+        self._current_checked = 0.0
+
+    def encode(self, entry: dict, use_dict: bool = False) -> bytes:
+        raw = json.dumps(entry, separators=(",", ":")).encode("utf-8")
+        if self.codec == "none":
+            return raw
+        header, compressor = self._compressor(use_dict)
+        return header + compressor.compress(raw) + compressor.flush()
+
+    def encode_stream(self, entry: dict, output: Iterable[str], use_dict: bool = False) -> Iterator[bytes]:
+        """
+        Encode `entry` with its "output" taken from the `output` text blocks,
+        piece by piece, so a spilled transcript never has to be joined in memory.
+        """
+        fields = {k: v for k, v in entry.items() if k != "output"}
+        prefix = json.dumps(fields, separators=(",", ":"))[:-1] + (',"output":"' if fields else '"output":"')
+
+        def raw() -> Iterator[bytes]:
+            yield prefix.encode("utf-8")
+            for block in output:
+                yield json.dumps(block)[1:-1].encode("utf-8")
+            yield b'"}'
+
+        if self.codec == "none":
+            yield from raw()
+            return
+        header, compressor = self._compressor(use_dict)
+        yield header
+        for piece in raw():
+            body = compressor.compress(piece)
+            if body:
+                yield body
+        yield compressor.flush()
+
+    def _compressor(self, use_dict: bool = False):
+        """(header line, compressor object) for a new entry."""
+        if self.codec == "lzma":
+            return CODEC_MAGIC + b"lzma -\n", lzma.LZMACompressor(preset=self.level)
+        current = self._current() if use_dict else None
+        if current:
+            dict_id, zdict = current
+            return (CODEC_MAGIC + f"zlib-dict {dict_id}\n".encode("ascii"),
+                    zlib.compressobj(self.level, zdict=zdict))
+        return CODEC_MAGIC + b"zlib -\n", zlib.compressobj(self.level)
+
+    def decode(self, data) -> dict:
+        """Decode bytes (or a memoryview slice) produced by encode()."""
+        if data[:len(CODEC_MAGIC)] != CODEC_MAGIC:
+            return json.loads(bytes(data))
+        end = bytes(data[:64]).find(b"\n")
+        if end < 0:
+            raise ValueError("truncated cache entry header")
+        codec, dict_id = bytes(data[len(CODEC_MAGIC):end]).decode("ascii").split(" ", 1)
+        body = data[end + 1:]
+        if codec == "zlib":
+            raw = zlib.decompress(body)
+        elif codec == "lzma":
+            raw = lzma.decompress(body)
+        elif codec == "zlib-dict":
+            decompressor = zlib.decompressobj(zdict=self._load_dict(dict_id))
+            raw = decompressor.decompress(body) + decompressor.flush()
+        else:
+            raise ValueError(f"Unknown cache codec: {codec}")
+        return json.loads(raw)
+
+    def train(self, outputs: list[str]) -> Optional[str]:
+        """
+        Build a zlib dictionary from sample outputs and make it current.
+
+        The dictionary is the lines shared by the most entries (tool log
+        boilerplate, rubric text, markdown scaffolding), with the most
+        valuable last since zlib favours nearby matches.
+
+        Returns:
+            The new dictionary id, or None if the samples share nothing.
+        """
+        if not self.dict_dir:
+            return None
+        doc_freq = Counter()
+        for output in outputs:
+            doc_freq.update({line.rstrip() for line in output.splitlines() if len(line.strip()) >= 8})
+        shared = [(count * len(line), line) for line, count in doc_freq.items() if count >= 2]
+        if not shared:
+            return None
+        shared.sort()
+        zdict = "\n".join(line for _, line in shared).encode("utf-8")[-ZDICT_MAX_BYTES:]
+
+        dict_id = hashlib.sha256(zdict).hexdigest()[:12]
+        self.dict_dir.mkdir(parents=True, exist_ok=True)
+        (self.dict_dir / f"{dict_id}.bin").write_bytes(zdict)
+        (self.dict_dir / "current").write_text(dict_id)
+        self._dicts[dict_id] = zdict
+        self._current_dict = (dict_id, zdict)
+        self._current_checked = time.monotonic()
+        return dict_id
+
+    def _current(self) -> Optional[tuple[str, bytes]]:
+        if not self.dict_dir:
+            return None
+        if time.monotonic() - self._current_checked < RESCAN_SEC:
+            return self._current_dict
+        self._current_checked = time.monotonic()
+        try:
+            dict_id = (self.dict_dir / "current").read_text().strip()
+            self._current_dict = (dict_id, self._load_dict(dict_id))
+        except (OSError, ValueError):
+            self._current_dict = None
+        return self._current_dict
+
+    def _load_dict(self, dict_id: str) -> bytes:
+        if dict_id not in self._dicts:
+            if not self.dict_dir or not re.fullmatch(r"[0-9a-f]+", dict_id):
+                raise ValueError(f"Unknown cache dictionary: {dict_id}")
+            self._dicts[dict_id] = (self.dict_dir / f"{dict_id}.bin").read_bytes()
+        return self._dicts[dict_id]
+
+
+def benchmark_codecs(outputs: list[str], dict_dir: Optional[Path] = None, rounds: int = 3,
+                     cold: bool = False) -> list[dict]:
+    """
+    Compare stored size and per-hit cost of each codec on sample outputs.
+
+    Every row reads its own files per hit, as the file backend does: the
+    baseline row is the old layout (a pretty-printed JSON file), the others
+    one encoded file per entry. `read_us` is the read alone, `decode_us`
+    the decompress and parse of bytes already in memory, `hit_us` both.
+    With `cold`, each file is dropped from the page cache before it is read
+    (posix_fadvise; a no-op on filesystems that ignore it), which is what a
+    first hit after a restart or on a busy host sees.
+    """
+    entries = [{"ts": "", "output": output} for output in outputs]
+    variants = [("file read (baseline)", None, None), ("none", None, False), ("zlib", None, False),
+                ("lzma", None, False)]
+    if dict_dir:
+        variants.append(("zlib", dict_dir, True))
+    rows = []
+    raw_size = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for codec_name, variant_dir, use_dict in variants:
+            if use_dict is None:
+                codec = None
+                blobs = [json.dumps(entry, indent=2).encode("utf-8") for entry in entries]
+            else:
+                codec = EntryCodec(codec_name, dict_dir=variant_dir)
+                if use_dict and codec.train(outputs) is None:
+                    continue
+                blobs = [codec.encode(entry, use_dict=use_dict) for entry in entries]
+            decode = (lambda data: json.loads(data)) if codec is None else codec.decode
+            paths = []
+            for i, blob in enumerate(blobs):
+                path = Path(tmp) / f"{len(rows)}-{i}"
+                path.write_bytes(blob)
+                paths.append(path)
+            size = sum(len(b) for b in blobs)
+            raw_size = raw_size or size
+
+            read_time = 0.0
+            for _ in range(rounds):
+                for path in paths:
+                    if cold:
+                        _drop_page_cache(path)
+                    start = time.perf_counter()
+                    path.read_bytes()
+                    read_time += time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for blob in blobs:
+                    decode(blob)
+            decode_time = time.perf_counter() - start
+            hits = rounds * len(blobs)
+            rows.append({
+                "codec": f"{codec_name}+dict" if use_dict else codec_name,
+                "bytes": size,
+                "ratio": raw_size / size if size else 0.0,
+                "read_us": read_time / hits * 1e6,
+                "decode_us": decode_time / hits * 1e6,
+                "hit_us": (read_time + decode_time) / hits * 1e6,
+            })
+    return rows
+
+
+def _drop_page_cache(path: Path):
+    if not hasattr(os, "posix_fadvise"):
+        return
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+@dataclass
+class CacheStats:
+    """In-process cache counters."""
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class FileCache:
+    """One JSON file per key under `root`, LRU-evicted past the size limits."""
+
+    suffix = ".json"
+
+    def __init__(self, root: Path, max_bytes: int = 0, max_entries: int = 0,
+                 codec: Optional[EntryCodec] = None):
+        self.root = Path(root)
+        self.max_bytes = max(0, max_bytes)
+        self.max_entries = max(0, max_entries)
+        self.codec = codec or EntryCodec("none")
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._index: Optional[OrderedDict[str, int]] = None
+        self._total_bytes = 0
+        self._scanned_at = 0.0
+
+    def path_for(self, key: str) -> Path:
+        safe_key = re.sub(r'[^a-zA-Z0-9._-]', "_", key)
+        return self.root / f"{safe_key}{self.suffix}"
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self.path_for(key)
+        try:
+            entry = self.codec.decode(path.read_bytes())
+        except (OSError, ValueError, zlib.error, lzma.LZMAError):
+            with self._lock:
+                self.stats.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.stats.hits += 1
+            if self._index is not None and path.name in self._index:
+                self._index.move_to_end(path.name)
+        return entry
+
+    def put(self, key: str, entry: dict, output: Optional[Iterable[str]] = None, use_dict: bool = False):
+        """
+        Store `entry`; `output` text blocks, if given, stream in as its "output".
+        `use_dict` compresses it against the trained dictionary, if there is one.
+        """
+        path = self.path_for(key)
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        if output is None:
+            data = self.codec.encode(entry, use_dict)
+            tmp.write_bytes(data)
+            size = len(data)
+        else:
+            size = 0
+            with open(tmp, "wb") as f:
+                for piece in self.codec.encode_stream(entry, output, use_dict):
+                    size += f.write(piece)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self.stats.writes += 1
+            index = self._ensure_index()
+            self._total_bytes -= index.pop(path.name, 0)
+            index[path.name] = size
+            self._total_bytes += size
+            self._evict(keep=path.name)
+
+    def usage(self) -> tuple[int, int]:
+        """Return (entries, bytes) currently on disk."""
+        with self._lock:
+            self._scanned_at = 0.0
+            index = self._ensure_index()
+            return len(index), self._total_bytes
+
+    def disk_bytes(self) -> int:
+        return self.usage()[1]
+
+    def sample_outputs(self, limit: int = 500) -> list[str]:
+        """Most recently used outputs, for dictionary training and benchmarks."""
+        with self._lock:
+            self._scanned_at = 0.0
+            names = list(self._ensure_index())[-limit:]
+        outputs = []
+        for name in names:
+            try:
+                outputs.append(self.codec.decode((self.root / name).read_bytes()).get("output", ""))
+            except (OSError, ValueError, zlib.error, lzma.LZMAError):
+                continue
+        return outputs
+
+    def compact(self) -> int:
+        """Nothing to reclaim in the per-file layout."""
+        return 0
+
+    def prune(self) -> int:
+        """Evict down to the limits now; returns the number of entries removed."""
+        with self._lock:
+            self._scanned_at = 0.0
+            self._ensure_index()
+            before = self.stats.evictions
+            self._evict()
+            return self.stats.evictions - before
+
+    def clear(self) -> int:
+        with self._lock:
+            self._scanned_at = 0.0
+            index = self._ensure_index()
+            removed = 0
+            for name in list(index):
+                removed += self._remove(name)
+            return removed
+
+    def _ensure_index(self) -> OrderedDict[str, int]:
+        if self._index is not None and time.monotonic() - self._scanned_at < RESCAN_SEC:
+            return self._index
+        found = []
+        try:
+            with os.scandir(self.root) as it:
+                for item in it:
+                    if not item.name.endswith(self.suffix) or item.name.startswith("."):
+                        continue
+                    try:
+                        st = item.stat()
+                    except OSError:
+                        continue
+                    found.append((st.st_mtime, item.name, st.st_size))
+        except FileNotFoundError:
+            pass
+        found.sort()
+        self._index = OrderedDict((name, size) for _, name, size in found)
+        self._total_bytes = sum(size for _, _, size in found)
+        self._scanned_at = time.monotonic()
+        return self._index
+
+    def _over_limit(self) -> bool:
+        if self.max_entries and len(self._index) > self.max_entries:
+            return True
+        return bool(self.max_bytes and self._total_bytes > self.max_bytes)
+
+    def _evict(self, keep: Optional[str] = None):
+        for name in list(self._index):
+            if not self._over_limit():
+                break
+            if name == keep:
+                continue
+            self._remove(name)
+            self.stats.evictions += 1
+
+    def _remove(self, name: str) -> int:
+        self._total_bytes -= self._index.pop(name, 0)
+        try:
+            (self.root / name).unlink()
+            return 1
+        except FileNotFoundError:
+            return 0
+
+
+class PackCache:
+    """
+    Append-only pack file plus a key→(offset, length) index.
+
+    Values are appended to `cache.pack`; every write or eviction appends one
+    line to `cache.idx`. Lookups probe the in-memory index and slice the
+    memory-mapped pack. Evicted values stay in the pack as dead bytes until
+    `compact()` rewrites it (on a background thread once dead bytes dominate,
+    or via `tracer-orch cache compact`).
+
+    Hits are recorded too: the next write re-appends the index lines of the
+    keys read since, so eviction stays least-recently-used across restarts
+    and processes (hits not yet flushed when a process exits are lost).
+    """
+
+    pack_name = "cache.pack"
+    index_name = "cache.idx"
+    lock_name = "cache.lock"
+    # Compact in the background once the pack holds this many dead bytes
+    # and they outweigh the live ones.
+    auto_compact_bytes = 64 * 1024 * 1024
+
+    def __init__(self, root: Path, max_bytes: int = 0, max_entries: int = 0,
+                 codec: Optional[EntryCodec] = None):
+        self.root = Path(root)
+        self.max_bytes = max(0, max_bytes)
+        self.max_entries = max(0, max_entries)
+        self.codec = codec or EntryCodec("none")
+        self.stats = CacheStats()
+        self._lock = threading.RLock()
+        self._index: OrderedDict[str, tuple[int, int]] = OrderedDict()
+        self._live_bytes = 0
+        self._idx_pos = 0
+        self._idx_ino: Optional[int] = None
+        self._mm: Optional[mmap.mmap] = None
+        self._mm_ino: Optional[int] = None
+        self._flock_held = False
+        self._touched: dict[str, None] = {}
+        self._compactor: Optional[threading.Thread] = None
+
+    @property
+    def pack_path(self) -> Path:
+        return self.root / self.pack_name
+
+    @property
+    def index_path(self) -> Path:
+        return self.root / self.index_name
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            # One stat() picks up appends, clears and compactions by other processes.
+            self._refresh()
+            try:
+                entry = self._lookup(key)
+            except (ValueError, zlib.error, lzma.LZMAError):
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            return entry
+
+    def put(self, key: str, entry: dict, output: Optional[Iterable[str]] = None, use_dict: bool = False):
+        """
+        Store `entry`; `output` text blocks, if given, stream in as its "output".
+        `use_dict` compresses it against the trained dictionary, if there is one.
+        """
+        key = _index_key(key)
+        self.root.mkdir(parents=True, exist_ok=True)
+        if output is None:
+            data = self.codec.encode(entry, use_dict)
+            encoded = io.BytesIO(data)
+        else:
+            # Encode before taking the pack lock; only large entries reach disk here.
+            encoded = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, dir=self.root)
+            for piece in self.codec.encode_stream(entry, output, use_dict):
+                encoded.write(piece)
+            encoded.seek(0)
+        with encoded, self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            with open(self.pack_path, "ab") as pack:
+                offset = pack.seek(0, os.SEEK_END)
+                shutil.copyfileobj(encoded, pack)
+                length = pack.tell() - offset
+            self._append_index(self._touch_lines() + [f"{key}\t{offset}\t{length}"])
+            self._refresh()
+            self.stats.writes += 1
+            self._evict(keep=key)
+            if self._dead_bytes() > max(self._live_bytes, self.auto_compact_bytes):
+                self._schedule_compact()
+
+    def usage(self) -> tuple[int, int]:
+        """Return (live entries, live bytes)."""
+        with self._lock:
+            self._refresh()
+            return len(self._index), self._live_bytes
+
+    def sample_outputs(self, limit: int = 500) -> list[str]:
+        """Most recently used outputs, for dictionary training and benchmarks."""
+        with self._lock:
+            self._refresh()
+            outputs = []
+            for key in list(self._index)[-limit:]:
+                try:
+                    entry = self._lookup(key)
+                except (ValueError, zlib.error, lzma.LZMAError):
+                    continue
+                if entry:
+                    outputs.append(entry.get("output", ""))
+            return outputs
+
+    def disk_bytes(self) -> int:
+        total = 0
+        for path in (self.pack_path, self.index_path):
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def prune(self) -> int:
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            before = self.stats.evictions
+            self._evict()
+            return self.stats.evictions - before
+
+    def compact(self) -> int:
+        """
+        Rewrite the pack with only live values; returns bytes reclaimed.
+
+        The live values are copied without holding the lock; writers are only
+        held off while the entries appended meanwhile are carried over.
+        """
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            if self._touched:
+                self._append_index(self._touch_lines())
+                self._refresh()
+            before = self.disk_bytes()
+            snapshot = dict(self._index)
+            try:
+                pack_ino = self.pack_path.stat().st_ino
+                pack_end = self.pack_path.stat().st_size
+            except FileNotFoundError:
+                return 0
+        pack_tmp = self.pack_path.with_name(f".{self.pack_name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            moved = self._copy_live(snapshot, pack_tmp)
+            with self._lock, self._file_lock(exclusive=True):
+                self._refresh()
+                if self.pack_path.stat().st_ino != pack_ino:
+                    return 0  # cleared or compacted by someone else meanwhile
+                self._finish_compact(pack_tmp, moved, pack_end)
+                return before - self.disk_bytes()
+        finally:
+            try:
+                pack_tmp.unlink()
+            except FileNotFoundError:
+                pass
+
+    def clear(self) -> int:
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            removed = len(self._index)
+            for path in (self.pack_path, self.index_path):
+                tmp = path.with_name(f".{path.name}.tmp")
+                tmp.write_bytes(b"")
+                os.replace(tmp, path)
+            self._refresh()
+            return removed
+
+    def _lookup(self, key: str) -> Optional[dict]:
+        loc = self._index.get(_index_key(key))
+        if loc is None:
+            return None
+        offset, length = loc
+        mm = self._map(offset + length)
+        if mm is None:
+            return None
+        self._index.move_to_end(_index_key(key))
+        self._touched[_index_key(key)] = None
+        with memoryview(mm) as view:
+            return self.codec.decode(view[offset:offset + length])
+
+    def _map(self, end: int) -> Optional[mmap.mmap]:
+        if self._mm is not None and len(self._mm) >= end:
+            return self._mm
+        with self._file_lock(exclusive=False):
+            try:
+                with open(self.pack_path, "rb") as pack:
+                    st = os.fstat(pack.fileno())
+                    if self._mm_ino is not None and st.st_ino != self._mm_ino:
+                        # Compacted underneath us: offsets are stale.
+                        self._reset()
+                        return None
+                    if st.st_size < end:
+                        return None
+                    if self._mm is not None:
+                        self._mm.close()
+                    self._mm = mmap.mmap(pack.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._mm_ino = st.st_ino
+            except (FileNotFoundError, ValueError):
+                return None
+        return self._mm
+
+    def _refresh(self):
+        """Apply index lines appended since the last read (by any process)."""
+        try:
+            st = self.index_path.stat()
+        except FileNotFoundError:
+            if self._idx_ino is not None:
+                self._reset()
+            return
+        if self._idx_ino is not None and st.st_ino != self._idx_ino:
+            self._reset()
+        if st.st_size <= self._idx_pos:
+            return
+        with open(self.index_path, "rb") as idx:
+            idx.seek(self._idx_pos)
+            chunk = idx.read()
+        end = chunk.rfind(b"\n") + 1
+        self._idx_pos += end
+        self._idx_ino = st.st_ino
+        for raw in chunk[:end].decode("utf-8", errors="replace").splitlines():
+            parts = raw.split("\t")
+            if len(parts) != 3:
+                continue
+            key, offset, length = parts
+            old = self._index.pop(key, None)
+            if old:
+                self._live_bytes -= old[1]
+            if offset == "-":
+                continue
+            try:
+                self._index[key] = (int(offset), int(length))
+                self._live_bytes += int(length)
+            except ValueError:
+                continue
+
+    def _reset(self):
+        self._index = OrderedDict()
+        self._live_bytes = 0
+        self._idx_pos = 0
+        self._idx_ino = None
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = None
+        self._mm_ino = None
+
+    def _append_index(self, lines: list[str]):
+        with open(self.index_path, "ab") as idx:
+            # A torn last line (crashed writer) must not swallow ours.
+            prefix = b""
+            if idx.seek(0, os.SEEK_END) > 0:
+                with open(self.index_path, "rb") as check:
+                    check.seek(-1, os.SEEK_END)
+                    if check.read(1) != b"\n":
+                        prefix = b"\n"
+            idx.write(prefix + "".join(f"{line}\n" for line in lines).encode("utf-8"))
+
+    def _dead_bytes(self) -> int:
+        try:
+            return self.pack_path.stat().st_size - self._live_bytes
+        except FileNotFoundError:
+            return 0
+
+    def _over_limit(self) -> bool:
+        if self.max_entries and len(self._index) > self.max_entries:
+            return True
+        return bool(self.max_bytes and self._live_bytes > self.max_bytes)
+
+    def _evict(self, keep: Optional[str] = None):
+        tombstones = []
+        for key in list(self._index):
+            if not self._over_limit():
+                break
+            if key == keep:
+                continue
+            self._live_bytes -= self._index.pop(key)[1]
+            tombstones.append(f"{key}\t-\t0")
+            self.stats.evictions += 1
+        if tombstones:
+            self._append_index(tombstones)
+            self._idx_pos = self.index_path.stat().st_size
+
+    def _touch_lines(self) -> list[str]:
+        """Index lines re-stating the keys read since the last write, to persist their recency."""
+        lines = []
+        for key in self._touched:
+            loc = self._index.get(key)
+            if loc is not None:
+                lines.append(f"{key}\t{loc[0]}\t{loc[1]}")
+        self._touched = {}
+        return lines
+
+    def _schedule_compact(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="cache-compact", daemon=True)
+        self._compactor.start()
+
+    def _copy_live(self, snapshot: dict[str, tuple[int, int]], pack_tmp: Path) -> dict[tuple[int, int], int]:
+        """Copy the values in `snapshot` to `pack_tmp`; returns {(old offset, length): new offset}."""
+        moved = {}
+        with open(self.pack_path, "rb") as pack, open(pack_tmp, "wb") as out:
+            for offset, length in sorted(set(snapshot.values())):
+                pack.seek(offset)
+                moved[(offset, length)] = out.tell()
+                remaining = length
+                while remaining > 0:
+                    block = pack.read(min(remaining, 1024 * 1024))
+                    if not block:
+                        raise ValueError("cache pack shorter than its index")
+                    out.write(block)
+                    remaining -= len(block)
+        return moved
+
+    def _finish_compact(self, pack_tmp: Path, moved: dict[tuple[int, int], int], pack_end: int):
+        """Carry over values appended past `pack_end` and swap in the new pack and index (locked)."""
+        idx_tmp = self.index_path.with_name(f".{self.index_name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(self.pack_path, "rb") as pack, open(pack_tmp, "ab") as out:
+            tail_start = out.seek(0, os.SEEK_END)
+            pack.seek(pack_end)
+            shutil.copyfileobj(pack, out)
+        lines = []
+        for key, (offset, length) in self._index.items():
+            if offset >= pack_end:
+                lines.append(f"{key}\t{offset - pack_end + tail_start}\t{length}\n")
+            elif (offset, length) in moved:
+                lines.append(f"{key}\t{moved[offset, length]}\t{length}\n")
+        idx_tmp.write_text("".join(lines), encoding="utf-8")
+        os.replace(pack_tmp, self.pack_path)
+        os.replace(idx_tmp, self.index_path)
+        self._reset()
+        self._refresh()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Serialize pack/index rewrites across processes (no-op without fcntl)."""
+        # flock is per open file, so re-locking from a nested call would
+        # deadlock against ourselves; callers already hold self._lock.
+        if fcntl is None or self._flock_held:
+            yield
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / self.lock_name, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._flock_held = True
+            try:
+                yield
+            finally:
+                self._flock_held = False
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _index_key(key: str) -> str:
+    return key.replace("\t", " ").replace("\n", " ")
+
+
+CACHE_BACKENDS = {
+    "file": FileCache,
+    "pack": PackCache,
+}
+
+
+def make_cache(backend: str, root: Path, max_bytes: int = 0, max_entries: int = 0,
+               codec: str = "zlib"):
+    """Instantiate a cache backend by name ("file" or "pack") with the given codec."""
+    cls = CACHE_BACKENDS.get(backend)
+    if cls is None:
+        raise ValueError(f"Unknown cache backend: {backend}")
+    entry_codec = EntryCodec(codec, dict_dir=Path(root) / "zdict")
+    return cls(root, max_bytes=max_bytes, max_entries=max_entries, codec=entry_codec)
+
+
+# ============================================================================
+# INPUT FINGERPRINTS
+# ============================================================================
+
+# Never descend into these when fingerprinting a directory: VCS metadata,
+# orchestrator state (written on every call) and tool caches.
+FINGERPRINT_IGNORE = frozenset({
+    ".git", ".hg", ".svn", "state", "__pycache__", "node_modules",
+    ".venv", "venv", ".mypy_cache", ".pytest_cache", ".ruff_cache", ".tox",
+})
+# Larger files are tracked by mtime/size only.
+FINGERPRINT_HASH_LIMIT = 8 * 1024 * 1024
+# File hashes remembered by (path, mtime_ns, size), least recently used dropped first.
+HASH_MEMO_MAX_ENTRIES = 65536
+
+_HASH_MEMO: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+_HASH_MEMO_LOCK = threading.Lock()
+
+
+def snapshot_paths(paths: list, root: Path, ignore: frozenset = FINGERPRINT_IGNORE) -> dict:
+    """
+    Fingerprint files and directories a cache entry depends on.
+
+    Files record (mtime_ns, size, sha256); directories are walked and also
+    record a hash of their listing so added or removed files are noticed.
+
+    Returns:
+        A JSON-serializable snapshot for snapshot_matches().
+    """
+    root = Path(root)
+    entries: dict[str, list] = {}
+    for path in paths:
+        _snapshot_into(entries, Path(path), root, ignore)
+    return {"ignore": sorted(ignore), "paths": entries}
+
+
+def snapshot_matches(snapshot: dict, root: Path) -> bool:
+    """
+    True if every recorded path is unchanged.
+
+    Unchanged mtime and size are trusted; content is hashed only when they
+    differ, so touching a file without editing it does not invalidate.
+    """
+    root = Path(root)
+    ignore = frozenset(snapshot.get("ignore", ()))
+    for rel, record in snapshot.get("paths", {}).items():
+        path = root / rel
+        kind = record[0]
+        if kind == "-":
+            if path.exists():
+                return False
+        elif kind == "d":
+            try:
+                if _listing_hash(path, ignore) != record[1]:
+                    return False
+            except OSError:
+                return False
+        else:
+            try:
+                st = path.stat()
+            except OSError:
+                return False
+            _, mtime_ns, size, digest = record
+            if st.st_mtime_ns == mtime_ns and st.st_size == size:
+                continue
+            if st.st_size != size or digest is None:
+                return False
+            if _file_hash(path, st) != digest:
+                return False
+    return True
+
+
+def _snapshot_into(entries: dict, path: Path, root: Path, ignore: frozenset):
+    rel = _rel_key(path, root)
+    try:
+        st = path.stat()
+    except OSError:
+        entries[rel] = ["-"]
+        return
+    if not path.is_dir():
+        entries[rel] = ["f", st.st_mtime_ns, st.st_size, _file_hash(path, st)]
+        return
+    entries[rel] = ["d", _listing_hash(path, ignore)]
+    try:
+        children = sorted(os.scandir(path), key=lambda item: item.name)
+    except OSError:
+        return
+    for child in children:
+        if child.name in ignore or child.is_symlink():
+            continue
+        _snapshot_into(entries, Path(child.path), root, ignore)
+
+
+def _rel_key(path: Path, root: Path) -> str:
+    try:
+        return path.resolve().relative_to(root.resolve()).as_posix() or "."
+    except ValueError:
+        return str(path.resolve())
+
+
+def _listing_hash(path: Path, ignore: frozenset) -> str:
+    names = sorted(name for name in os.listdir(path) if name not in ignore)
+    return hashlib.sha256("\n".join(names).encode("utf-8")).hexdigest()
+
+
+def _file_hash(path: Path, st: os.stat_result) -> Optional[str]:
+    if st.st_size > FINGERPRINT_HASH_LIMIT:
+        return None
+    memo_key = (str(path), st.st_mtime_ns, st.st_size)
+    with _HASH_MEMO_LOCK:
+        digest = _HASH_MEMO.get(memo_key)
+        if digest is not None:
+            _HASH_MEMO.move_to_end(memo_key)
+            return digest
+    try:
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+    with _HASH_MEMO_LOCK:
+        _HASH_MEMO[memo_key] = digest
+        _HASH_MEMO.move_to_end(memo_key)
+        while len(_HASH_MEMO) > HASH_MEMO_MAX_ENTRIES:
+            _HASH_MEMO.popitem(last=False)
+    return digest
+
+
+# ============================================================================
+# SIDE EFFECTS
+# ============================================================================
+
+# Above this many bytes of changed files an entry is not worth replaying.
+EFFECTS_MAX_BYTES = 16 * 1024 * 1024
+
+
+def capture_effects(before: dict, after: dict, root: Path) -> Optional[dict]:
+    """
+    Diff two workspace snapshots into a replayable set of file changes.
+
+    Each changed or created file stores its content and the hash it had
+    before (None if it did not exist); deleted files store their old hash.
+
+    Returns:
+        The effects dict, or None if the changed content is too large.
+    """
+    root = Path(root)
+    old_files = {rel: rec for rel, rec in before.get("paths", {}).items() if rec[0] == "f"}
+    new_files = {rel: rec for rel, rec in after.get("paths", {}).items() if rec[0] == "f"}
+
+    files = {}
+    total = 0
+    for rel, rec in new_files.items():
+        old = old_files.get(rel)
+        if old is not None and old[3] is not None and old[3] == rec[3]:
+            continue
+        if old is not None and old[1:3] == rec[1:3] and old[3] == rec[3]:
+            continue
+        if old is not None and old[3] is None:
+            return None
+        path = root / rel
+        try:
+            data = path.read_bytes()
+            mode = path.stat().st_mode & 0o777
+        except OSError:
+            continue
+        total += len(data)
+        if total > EFFECTS_MAX_BYTES:
+            return None
+        change = {"before": old[3] if old else None, "after": hashlib.sha256(data).hexdigest(), "mode": mode}
+        try:
+            change["text"] = data.decode("utf-8")
+        except UnicodeDecodeError:
+            change["b64"] = base64.b64encode(data).decode("ascii")
+        files[rel] = change
+
+    deleted = {rel: rec[3] for rel, rec in old_files.items() if rel not in new_files}
+    return {"files": files, "deleted": deleted}
+
+
+def apply_effects(effects: dict, root: Path) -> bool:
+    """
+    Re-apply captured file changes to the workspace.
+
+    Every touched file must still be in its recorded "before" state (or
+    already in its "after" state); otherwise nothing is written and False is
+    returned so the caller can treat the entry as a miss.
+    """
+    root = Path(root)
+    files = effects.get("files", {})
+    deleted = effects.get("deleted", {})
+
+    for rel, change in files.items():
+        current = _current_hash(root / rel)
+        if current not in (change.get("before"), change.get("after")):
+            return False
+    for rel, before in deleted.items():
+        current = _current_hash(root / rel)
+        if current is not None and current != before:
+            return False
+
+    for rel, change in files.items():
+        path = root / rel
+        if _current_hash(path) == change.get("after"):
+            continue
+        data = base64.b64decode(change["b64"]) if "b64" in change else change.get("text", "").encode("utf-8")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.chmod(tmp, change.get("mode", 0o644))
+        os.replace(tmp, path)
+    for rel in deleted:
+        try:
+            (root / rel).unlink()
+        except FileNotFoundError:
+            pass
+    return True
+
+
+class CallWindow:
+    """
+    Marks one call as running in a workspace, across processes.
+
+    Every call bumps a generation counter in `state_dir` and holds a shared
+    flock for its duration; overlapped() then tells whether any other call
+    was running when this one started or has started since, which is when a
+    workspace diff can't be attributed to this call. Without fcntl it
+    reports no overlap (callers keep their own in-process check).
+    """
+
+    lock_name = "calls.lock"
+    generation_name = "calls.gen"
+
+    def __init__(self, state_dir: Path):
+        self.state_dir = Path(state_dir)
+        self._file = None
+        self._others = False
+        self._started = 0
+
+    def __enter__(self) -> "CallWindow":
+        if fcntl is None:
+            return self
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._started = self._generation(bump=True)
+        self._file = open(self.state_dir / self.lock_name, "a")
+        try:
+            # Taking it exclusively succeeds only if nobody else is running.
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._others = True
+        fcntl.flock(self._file, fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def overlapped(self) -> bool:
+        if fcntl is None:
+            return False
+        return self._others or self._generation(bump=False) != self._started
+
+    def _generation(self, bump: bool) -> int:
+        with open(self.state_dir / self.generation_name, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                value = int(f.read() or 0)
+            except ValueError:
+                value = 0
+            if bump:
+                value += 1
+                f.seek(0)
+                f.truncate()
+                f.write(str(value))
+            return value
+
+
+def _current_hash(path: Path) -> Optional[str]:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return None
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Host-wide Call Slots
+
+Every orchestrator process on a host (several `tracer-orch rpi` and
+`tracer-orch tracer run` loops, say) shares a fixed number of call slots
+per backend. A slot is a file under `state/slots/<name>/`, and holding a
+slot means holding an exclusive flock on that file.
+
+The kernel drops a flock when the process holding it exits, however it
+exits, so a crashed or killed loop never strands a slot. While it holds
+the slot, the process also writes its pid, label and start time into the
+file. `status()` uses that to show who is running what, and to flag a
+slot whose holder is gone but whose lock is still held.
+
+Waiters poll with backoff. They are not served in order across
+processes; within one process the rate limiter already orders calls.
+Needs fcntl (POSIX); without it, slots are unlimited.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import time
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+POLL_MIN_SEC = 0.05
+POLL_MAX_SEC = 1.0
+
+
+class SlotLease:
+    """One held slot; release() frees it for the next process."""
+
+    def __init__(self, path: Path, fd: int, waited: float = 0.0):
+        self.path = path
+        self.waited = waited
+        self._fd: Optional[int] = fd
+
+    def release(self):
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            os.ftruncate(fd, 0)
+        except OSError:
+            pass
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+class HostSemaphore:
+    """`slots` flock-guarded slot files in `directory`, shared by every process that opens it."""
+
+    def __init__(self, directory: Path, slots: int):
+        self.directory = Path(directory)
+        self.slots = max(1, int(slots))
+
+    @staticmethod
+    def supported() -> bool:
+        return fcntl is not None
+
+    def try_acquire(self, holder: dict) -> Optional[SlotLease]:
+        """Take a free slot and record `holder` in it, or None if all are taken."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Start at a per-process offset so waiters don't all fight over slot 0.
+        offset = os.getpid() % self.slots
+        for i in range(self.slots):
+            path = self._path((offset + i) % self.slots)
+            fd = _try_lock(path)
+            if fd is None:
+                continue
+            _write_holder(fd, holder)
+            return SlotLease(path, fd)
+        return None
+
+    def acquire(self, holder: dict) -> SlotLease:
+        """Block until a slot frees up."""
+        start = time.monotonic()
+        for delay in _backoff():
+            lease = self.try_acquire(holder)
+            if lease is not None:
+                lease.waited = time.monotonic() - start
+                return lease
+            time.sleep(delay)
+
+    async def aacquire(self, holder: dict) -> SlotLease:
+        """acquire() for coroutines; waits with asyncio.sleep."""
+        start = time.monotonic()
+        for delay in _backoff():
+            lease = self.try_acquire(holder)
+            if lease is not None:
+                lease.waited = time.monotonic() - start
+                return lease
+            await asyncio.sleep(delay)
+
+    def status(self) -> list[dict]:
+        """
+        One row per slot: {"slot", "state", ...holder fields}.
+
+        state is "free", "held", or "orphaned" when the lock is held but the
+        recorded holder on this host is dead (a child inherited the lock).
+        A free slot's leftover holder record is cleared on the way.
+        """
+        indexes = set(range(self.slots))
+        if self.directory.is_dir():
+            for path in self.directory.glob("slot-*.lock"):
+                try:
+                    indexes.add(int(path.stem.split("-", 1)[1]))
+                except ValueError:
+                    continue
+        rows = []
+        for i in sorted(indexes):
+            path = self._path(i)
+            row = {"slot": i, "state": "free"}
+            if path.exists():
+                fd = _try_lock(path)
+                if fd is not None:
+                    SlotLease(path, fd).release()
+                else:
+                    row.update(_read_holder(path))
+                    alive = _pid_alive(row.get("pid")) if row.get("host") == _hostname() else True
+                    row["state"] = "held" if alive else "orphaned"
+            if i >= self.slots:
+                row["extra"] = True
+            rows.append(row)
+        return rows
+
+    def _path(self, index: int) -> Path:
+        return self.directory / f"slot-{index}.lock"
+
+
+def parse_slot_counts(spec: str) -> dict[str, int]:
+    """
+    Parse ORCHESTRATOR_HOST_SLOTS: "8" (every backend) or "claude=4,api=16",
+    where a bare number sets the default ("*"). Unparseable items are skipped.
+    """
+    counts: dict[str, int] = {}
+    for item in spec.split(","):
+        name, sep, value = item.rpartition("=")
+        name = name.strip() if sep else "*"
+        try:
+            counts[name or "*"] = int(value)
+        except ValueError:
+            continue
+    return counts
+
+
+def _try_lock(path: Path) -> Optional[int]:
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _write_holder(fd: int, holder: dict):
+    data = json.dumps({**holder, "pid": os.getpid(), "host": _hostname(), "since": time.time()})
+    try:
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, data.encode("utf-8"), 0)
+    except OSError:
+        pass
+
+
+def _read_holder(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _pid_alive(pid) -> bool:
+    try:
+        os.kill(int(pid), 0)
+    except (TypeError, ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _hostname() -> str:
+    return os.uname().nodename if hasattr(os, "uname") else ""
+
+
+def _backoff():
+    delay = POLL_MIN_SEC
+    while True:
+        yield delay * random.uniform(0.5, 1.0)
+        delay = min(POLL_MAX_SEC, delay * 2)
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+HTTP Model Backend
+
+Streams completions straight from an Anthropic- or OpenAI-compatible
+endpoint instead of spawning a CLI, using only the stdlib: keep-alive
+`http.client` connections are pooled per endpoint, so a burst of short
+calls pays one TCP/TLS handshake rather than one process start and one
+handshake each, and the server-sent-event stream is parsed incrementally
+as it arrives.
+
+There is no agent loop and no tool use here: the model sees the prompt and
+nothing else, so this only suits calls whose prompt carries everything the
+answer needs.
+"""
+from __future__ import annotations
+
+import http.client
+import json
+import re
+import ssl
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
+
+READ_SIZE = 64 * 1024
+DEFAULT_POOL_SIZE = 8
+# Servers typically drop idle keep-alive connections after a minute or so;
+# reusing one past that only buys a failed request and a retry.
+DEFAULT_MAX_IDLE_SEC = 50.0
+ANTHROPIC_VERSION = "2023-06-01"
+
+
+class HTTPBackendError(Exception):
+    """The endpoint refused the request or broke off the stream."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+# ============================================================================
+# SERVER-SENT EVENTS
+# ============================================================================
+
+@dataclass
+class SSEEvent:
+    event: str
+    data: str
+
+
+_LINE_END = re.compile(rb"\r\n|\r|\n")
+
+
+class SSEParser:
+    """Incremental text/event-stream parser: feed raw bytes, get whole events."""
+
+    def __init__(self):
+        self._buffer = b""
+        self._event = ""
+        self._data: list[str] = []
+
+    def feed(self, chunk: bytes) -> list[SSEEvent]:
+        buffer = self._buffer + chunk
+        # A trailing CR may be the first half of a CRLF split across reads.
+        carry = b""
+        if buffer.endswith(b"\r"):
+            buffer, carry = buffer[:-1], b"\r"
+        lines = _LINE_END.split(buffer)
+        self._buffer = lines.pop() + carry
+        events = []
+        for raw in lines:
+            event = self._line(raw.decode("utf-8", errors="replace"))
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _line(self, line: str) -> Optional[SSEEvent]:
+        if not line:
+            if not self._data:
+                self._event = ""
+                return None
+            event = SSEEvent(self._event or "message", "\n".join(self._data))
+            self._event, self._data = "", []
+            return event
+        if line.startswith(":"):
+            return None
+        name, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if name == "data":
+            self._data.append(value)
+        elif name == "event":
+            self._event = value
+        return None
+
+
+# ============================================================================
+# CONNECTION POOL
+# ============================================================================
+
+class ConnectionPool:
+    """Idle keep-alive connections to one scheme://host:port, reused LIFO."""
+
+    def __init__(self, url: str, size: int = DEFAULT_POOL_SIZE, max_idle: float = DEFAULT_MAX_IDLE_SEC):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"unsupported URL scheme in {url!r}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port
+        self.size = max(1, size)
+        self.max_idle = max_idle
+        self.created = 0
+        self.reused = 0
+        self._idle: list[tuple[http.client.HTTPConnection, float]] = []
+        self._lock = threading.Lock()
+        self._ssl = ssl.create_default_context() if self.scheme == "https" else None
+
+    def acquire(self, timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        """An idle connection (reused=True) or a new one, with `timeout` on its socket."""
+        now = time.monotonic()
+        stale = []
+        conn = None
+        with self._lock:
+            while self._idle:
+                candidate, released = self._idle.pop()
+                if now - released < self.max_idle:
+                    conn = candidate
+                    self.reused += 1
+                    break
+                stale.append(candidate)
+            if conn is None:
+                self.created += 1
+        for old in stale:
+            old.close()
+        if conn is not None:
+            _set_timeout(conn, timeout)
+            return conn, True
+        if self._ssl is not None:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=timeout, context=self._ssl), False
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout), False
+
+    def release(self, conn: http.client.HTTPConnection):
+        """Return a connection whose last response was read to the end."""
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"created": self.created, "reused": self.reused, "idle": len(self._idle)}
+
+
+def _set_timeout(conn: http.client.HTTPConnection, timeout: float):
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+
+
+# ============================================================================
+# API FORMATS
+# ============================================================================
+
+class _AnthropicFormat:
+    """POST /v1/messages with "stream": true; batches through /v1/messages/batches."""
+    path = "/v1/messages"
+    batch_path = "/v1/messages/batches"
+
+    def headers(self, api_key: Optional[str]) -> dict:
+        headers = {"anthropic-version": ANTHROPIC_VERSION}
+        if api_key:
+            headers["x-api-key"] = api_key
+        return headers
+
+    def body(self, prompt: str, model: str, max_tokens: int) -> dict:
+        return {
+            "model": model,
+            "max_tokens": max_tokens,
+            "stream": True,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+    def event(self, event: SSEEvent, completion: "Completion") -> Optional[str]:
+        data = _json(event.data)
+        kind = data.get("type", event.event)
+        if kind == "content_block_delta":
+            delta = data.get("delta") or {}
+            if delta.get("type") == "text_delta":
+                return delta.get("text") or None
+        elif kind == "message_start":
+            usage = (data.get("message") or {}).get("usage") or {}
+            cache_read = int(usage.get("cache_read_input_tokens") or 0)
+            completion.in_tokens = (int(usage.get("input_tokens") or 0) + cache_read
+                                    + int(usage.get("cache_creation_input_tokens") or 0))
+            completion.cached_in_tokens = cache_read
+            completion.out_tokens = int(usage.get("output_tokens") or 0)
+        elif kind == "message_delta":
+            usage = data.get("usage") or {}
+            if "output_tokens" in usage:
+                completion.out_tokens = int(usage["output_tokens"] or 0)
+        elif kind == "message_stop":
+            completion.finished = True
+        elif kind == "error":
+            error = data.get("error") or {}
+            raise HTTPBackendError(f"stream error: {error.get('message') or event.data[:200]}")
+        return None
+
+    def batch_request(self, custom_id: str, prompt: str, model: str, max_tokens: int) -> dict:
+        params = self.body(prompt, model, max_tokens)
+        del params["stream"]
+        return {"custom_id": custom_id, "params": params}
+
+    def batch_result(self, record: dict) -> "BatchItemResult":
+        result = record.get("result") or {}
+        item = BatchItemResult(str(record.get("custom_id")))
+        if result.get("type") != "succeeded":
+            error = (result.get("error") or {}).get("error") or result.get("error") or {}
+            item.error = f"{result.get('type', 'failed')}: {error.get('message') or error.get('type') or ''}".rstrip(": ")
+            return item
+        message = result.get("message") or {}
+        item.text = "".join(block.get("text", "") for block in message.get("content") or []
+                            if isinstance(block, dict) and block.get("type") == "text")
+        usage = message.get("usage") or {}
+        cache_read = int(usage.get("cache_read_input_tokens") or 0)
+        item.in_tokens = (int(usage.get("input_tokens") or 0) + cache_read
+                          + int(usage.get("cache_creation_input_tokens") or 0))
+        item.cached_in_tokens = cache_read
+        item.out_tokens = int(usage.get("output_tokens") or 0)
+        return item
+
+
+class _OpenAIFormat:
+    """POST {base}/chat/completions with "stream": true (base usually ends in /v1)."""
+    path = "/chat/completions"
+    # Its batch API goes through uploaded files; not supported here.
+    batch_path = None
+
+    def headers(self, api_key: Optional[str]) -> dict:
+        return {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    def body(self, prompt: str, model: str, max_tokens: int) -> dict:
+        return {
+            "model": model,
+            "max_tokens": max_tokens,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+    def event(self, event: SSEEvent, completion: "Completion") -> Optional[str]:
+        if event.data.strip() == "[DONE]":
+            completion.finished = True
+            return None
+        data = _json(event.data)
+        if data.get("error"):
+            error = data["error"]
+            message = error.get("message") if isinstance(error, dict) else error
+            raise HTTPBackendError(f"stream error: {message}")
+        usage = data.get("usage")
+        if usage:
+            completion.in_tokens = int(usage.get("prompt_tokens") or 0)
+            completion.out_tokens = int(usage.get("completion_tokens") or 0)
+            details = usage.get("prompt_tokens_details") or {}
+            completion.cached_in_tokens = int(details.get("cached_tokens") or 0)
+        text = []
+        for choice in data.get("choices") or []:
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                text.append(content)
+        return "".join(text) or None
+
+
+API_FORMATS = {
+    "anthropic": _AnthropicFormat(),
+    "openai": _OpenAIFormat(),
+}
+
+
+def _json(data: str) -> dict:
+    try:
+        value = json.loads(data)
+    except ValueError:
+        raise HTTPBackendError(f"malformed stream event: {data[:200]}")
+    return value if isinstance(value, dict) else {}
+
+
+# ============================================================================
+# BACKEND
+# ============================================================================
+
+@dataclass
+class BatchItemResult:
+    """One answer out of a finished batch (`error` set if it didn't succeed)."""
+    custom_id: str
+    text: str = ""
+    error: Optional[str] = None
+    in_tokens: Optional[int] = None
+    out_tokens: Optional[int] = None
+    cached_in_tokens: Optional[int] = None
+
+    def usage(self) -> dict:
+        return {"in_tokens": self.in_tokens, "out_tokens": self.out_tokens,
+                "cached_in_tokens": self.cached_in_tokens}
+
+
+class Completion:
+    """
+    One streaming response: iterate for text deltas as they arrive.
+
+    The token counts the endpoint reported are filled in as the stream goes.
+    Always close() it: a response read to the end hands its connection
+    back to the pool, anything else closes the connection.
+    """
+
+    def __init__(self, pool: ConnectionPool, conn: http.client.HTTPConnection,
+                 response: http.client.HTTPResponse, api_format, reused: bool, started: float):
+        self.reused = reused
+        self.finished = False
+        self.in_tokens: Optional[int] = None
+        self.out_tokens: Optional[int] = None
+        self.cached_in_tokens: Optional[int] = None
+        self.started_at = started
+        self.first_token_at: Optional[float] = None
+        self._pool = pool
+        self._conn = conn
+        self._response = response
+        self._format = api_format
+        self._eof = False
+
+    def settimeout(self, seconds: float):
+        """Socket timeout for the next read (raises TimeoutError when it passes)."""
+        _set_timeout(self._conn, max(seconds, 0.01))
+
+    def __iter__(self) -> Iterator[str]:
+        sse = SSEParser()
+        while True:
+            chunk = self._response.read1(READ_SIZE)
+            if not chunk:
+                break
+            for event in sse.feed(chunk):
+                text = self._format.event(event, self)
+                if text:
+                    if self.first_token_at is None:
+                        self.first_token_at = time.monotonic()
+                    yield text
+        self._eof = True
+        if not self.finished:
+            raise HTTPBackendError("stream ended before the completion finished")
+
+    def usage(self) -> dict:
+        """Usage fields in the shape of StreamParser.usage()."""
+        ttft = self.first_token_at - self.started_at if self.first_token_at is not None else None
+        return {
+            "in_tokens": self.in_tokens,
+            "out_tokens": self.out_tokens,
+            "cached_in_tokens": self.cached_in_tokens,
+            "ttft_sec": round(ttft, 3) if ttft is not None else None,
+        }
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._eof and self._response.isclosed() and not self._response.will_close:
+            self._pool.release(conn)
+        else:
+            conn.close()
+
+
+class HTTPBackend:
+    """Streaming completions from one endpoint over a pool of keep-alive connections."""
+
+    def __init__(self, url: str, api_format: str = "anthropic", api_key: Optional[str] = None,
+                 model: Optional[str] = None, max_tokens: int = 8192, pool_size: int = DEFAULT_POOL_SIZE,
+                 headers: Optional[dict] = None):
+        if api_format not in API_FORMATS:
+            raise ValueError(f"unknown API format {api_format!r} (expected one of {', '.join(API_FORMATS)})")
+        self.url = url
+        self.model = model
+        self.max_tokens = max_tokens
+        self.pool = ConnectionPool(url, size=pool_size)
+        self._format = API_FORMATS[api_format]
+        self._path = urlsplit(url).path.rstrip("/") + self._format.path
+        self._headers = {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+            **self._format.headers(api_key),
+            **(headers or {}),
+        }
+
+    def stream(self, prompt: str, model: Optional[str] = None, timeout: float = 600.0) -> Completion:
+        """Send the prompt and return once the response headers are in."""
+        model = model or self.model
+        if not model:
+            raise ValueError("no model given for the HTTP backend")
+        started = time.monotonic()
+        conn, response, reused = self._send("POST", self._path, self._format.body(prompt, model, self.max_tokens),
+                                            timeout, stream=True)
+        return Completion(self.pool, conn, response, self._format, reused, started)
+
+    # -- batches -------------------------------------------------------------
+
+    @property
+    def supports_batches(self) -> bool:
+        return self._format.batch_path is not None
+
+    def submit_batch(self, requests: list[tuple[str, str]], model: Optional[str] = None,
+                     timeout: float = 120.0) -> dict:
+        """Submit (custom_id, prompt) pairs as one batch; returns the batch object."""
+        model = model or self.model
+        if not self.supports_batches:
+            raise HTTPBackendError("this API format has no batch endpoint")
+        body = {"requests": [self._format.batch_request(custom_id, prompt, model, self.max_tokens)
+                             for custom_id, prompt in requests]}
+        return self.request_json("POST", self._batch_path(), body, timeout)
+
+    def batch_status(self, batch_id: str, timeout: float = 60.0) -> dict:
+        return self.request_json("GET", f"{self._batch_path()}/{batch_id}", timeout=timeout)
+
+    def cancel_batch(self, batch_id: str, timeout: float = 60.0) -> dict:
+        return self.request_json("POST", f"{self._batch_path()}/{batch_id}/cancel", timeout=timeout)
+
+    def batch_results(self, batch: dict, timeout: float = 600.0) -> Iterator[BatchItemResult]:
+        """Results of an ended batch, read line by line from its results_url."""
+        url = batch.get("results_url") or f"{self._batch_path()}/{batch['id']}/results"
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        conn, response, _ = self._send("GET", path, None, timeout)
+        try:
+            for line in response:
+                line = line.strip()
+                if line:
+                    yield self._format.batch_result(_json(line.decode("utf-8", errors="replace")))
+            # Line iteration stops at EOF without closing the response; read() does.
+            response.read()
+        finally:
+            self._finish(conn, response)
+
+    def _batch_path(self) -> str:
+        return urlsplit(self.url).path.rstrip("/") + self._format.batch_path
+
+    def request_json(self, method: str, path: str, body: Optional[dict] = None, timeout: float = 60.0) -> dict:
+        """One plain (non-streaming) JSON request over the pool."""
+        conn, response, _ = self._send(method, path, body, timeout)
+        try:
+            return _json(response.read().decode("utf-8", errors="replace"))
+        finally:
+            self._finish(conn, response)
+
+    def _send(self, method: str, path: str, body: Optional[dict], timeout: float, stream: bool = False):
+        """
+        Send a request and return (conn, response, reused) once a 200 is in.
+
+        A pooled connection the server has meanwhile closed fails on first
+        use; the request is then retried on another one.
+        """
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = self._headers if stream else {k: v for k, v in self._headers.items() if k != "Accept"}
+        while True:
+            conn, reused = self.pool.acquire(timeout)
+            try:
+                conn.request(method, path, body=data, headers=headers)
+                response = conn.getresponse()
+            except (ConnectionError, http.client.HTTPException):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+        if response.status != 200:
+            detail = response.read(4096).decode("utf-8", errors="replace").strip()
+            conn.close()
+            raise HTTPBackendError(f"HTTP {response.status} {response.reason}: {detail[:500]}",
+                                   status=response.status)
+        return conn, response, reused
+
+    def _finish(self, conn: http.client.HTTPConnection, response: http.client.HTTPResponse):
+        if response.isclosed() and not response.will_close:
+            self.pool.release(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Line Delivery Queue
+
+Hands CLI output lines from the pipe reader to `on_line` callbacks through
+a bounded queue drained by a separate thread, so a slow consumer (a
+terminal, a log shipper, a UI) no longer stalls the reader, fills the pipe
+buffer and blocks the agent itself.
+
+What happens when the queue is full depends on the policy:
+
+    block     the reader waits for room (nothing is lost; a slow sink
+              still throttles the agent once the queue is full)
+    drop      new lines are discarded; the sink later gets one
+              "[... N line(s) dropped]" marker
+    coalesce  the oldest queued lines are discarded in favour of new ones,
+              for sinks that only show the latest progress
+
+`AsyncLineQueue` is the same for coroutines: the callback runs on the event
+loop from a consumer task, and a "block" producer awaits room() instead of
+waiting on a lock.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+LINE_POLICIES = ("block", "drop", "coalesce")
+
+
+class LineQueue:
+    """Bounded queue feeding `callback` from its own consumer thread."""
+
+    def __init__(self, callback: Callable[[str], None], maxsize: int = 4096, policy: str = "block",
+                 name: str = "on-line"):
+        if policy not in LINE_POLICIES:
+            raise ValueError(f"unknown line policy {policy!r} (expected one of {', '.join(LINE_POLICIES)})")
+        self.callback = callback
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.errors = 0
+        self._pending_drops = 0
+        self._lines: deque[str] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, line: str):
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._lines) >= self.maxsize:
+                if self.policy == "block":
+                    while len(self._lines) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+                elif self.policy == "drop":
+                    self.dropped += 1
+                    self._pending_drops += 1
+                    return
+                else:
+                    self._lines.popleft()
+                    self.dropped += 1
+            self._lines.append(line)
+            self._cond.notify_all()
+
+    def close(self, timeout: Optional[float] = None):
+        """Deliver what is queued, then stop the consumer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._lines and not self._pending_drops and not self._closed:
+                    self._cond.wait()
+                if not self._lines and not self._pending_drops:
+                    return
+                batch = list(self._lines)
+                self._lines.clear()
+                drops, self._pending_drops = self._pending_drops, 0
+                self._cond.notify_all()
+            for line in batch:
+                self._deliver(line)
+            if drops:
+                self._deliver(f"[... {drops} line(s) dropped]")
+
+    def _deliver(self, line: str):
+        try:
+            self.callback(line)
+        except Exception:
+            # A broken sink must not take down the call it is watching.
+            self.errors += 1
+
+
+class AsyncLineQueue:
+    """LineQueue for coroutines: `callback` runs on the event loop from a consumer task."""
+
+    def __init__(self, callback: Callable[[str], None], maxsize: int = 4096, policy: str = "block"):
+        if policy not in LINE_POLICIES:
+            raise ValueError(f"unknown line policy {policy!r} (expected one of {', '.join(LINE_POLICIES)})")
+        self.callback = callback
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.errors = 0
+        self._pending_drops = 0
+        self._lines: deque[str] = deque()
+        self._ready = asyncio.Event()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._closed = False
+        self._task = asyncio.ensure_future(self._run())
+
+    def put(self, line: str):
+        """Queue a line (call on the loop). Under "block" the queue may overshoot; see room()."""
+        if self._closed:
+            return
+        if len(self._lines) >= self.maxsize:
+            if self.policy == "drop":
+                self.dropped += 1
+                self._pending_drops += 1
+                self._ready.set()
+                return
+            if self.policy == "coalesce":
+                self._lines.popleft()
+                self.dropped += 1
+        self._lines.append(line)
+        if self.policy == "block" and len(self._lines) >= self.maxsize:
+            self._room.clear()
+        self._ready.set()
+
+    async def room(self):
+        """Wait until a "block" queue is below its bound again (returns at once for other policies)."""
+        await self._room.wait()
+
+    async def close(self):
+        """Deliver what is queued, then stop the consumer task."""
+        self._closed = True
+        self._ready.set()
+        await self._task
+
+    async def _run(self):
+        while True:
+            if not self._lines and not self._pending_drops:
+                if self._closed:
+                    return
+                await self._ready.wait()
+                self._ready.clear()
+                continue
+            batch = list(self._lines)
+            self._lines.clear()
+            drops, self._pending_drops = self._pending_drops, 0
+            self._room.set()
+            for line in batch:
+                self._deliver(line)
+            if drops:
+                self._deliver(f"[... {drops} line(s) dropped]")
+            # Let the producer read on before the next batch.
+            await asyncio.sleep(0)
+
+    def _deliver(self, line: str):
+        try:
+            self.callback(line)
+        except Exception:
+            self.errors += 1
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+In-process Metrics
+
+A small registry of counters and fixed-bucket histograms keyed by metric
+name and label set, plus `CallTimings`, which breaks one CLI call into the
+phases that explain where its wall time went:
+
+    start ── spawn ── first byte ─ ... lines ... ─ last byte ── EOF ── exit
+
+Spawn latency is interpreter/Node startup (or a pool acquire), first byte
+is mostly model latency, inter-line gaps expose long tool runs, and exit
+wait is the CLI tearing down after its output is done.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Seconds; wide enough for both spawn overhead and multi-minute phases.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus layout) with sum and count."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float, count: int = 1):
+        self.counts[bisect.bisect_left(self.buckets, value)] += count
+        self.sum += value * count
+        self.count += count
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "sum": round(self.sum, 6),
+            "count": self.count,
+            "max": round(self.max, 6),
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[tuple, float] = {}
+        self._gauges: dict[tuple, float] = {}
+        self._histograms: dict[tuple, Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def add(self, name: str, delta: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the wall time of a block (or, as a decorator, of each call)."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(_key(name, labels))
+
+    def snapshot(self) -> dict:
+        """Copy of every series: {"counters"|"gauges"|"histograms": [(name, labels, value)]}."""
+        with self._lock:
+            return {
+                "counters": [(n, dict(l), v) for (n, l), v in sorted(self._counters.items())],
+                "gauges": [(n, dict(l), v) for (n, l), v in sorted(self._gauges.items())],
+                "histograms": [(n, dict(l), h.to_dict()) for (n, l), h in sorted(self._histograms.items())],
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class CallTimings:
+    """Monotonic timestamps for the phases of one CLI call."""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.spawned: Optional[float] = None
+        self.first_byte: Optional[float] = None
+        self.last_byte: Optional[float] = None
+        self.eof: Optional[float] = None
+        self.exited: Optional[float] = None
+        self.lines = 0
+        self.gaps = Histogram()
+        self._last_line: Optional[float] = None
+
+    def mark_spawned(self):
+        self.spawned = time.monotonic()
+
+    def mark_bytes(self, now: Optional[float] = None):
+        now = now if now is not None else time.monotonic()
+        if self.first_byte is None:
+            self.first_byte = now
+        self.last_byte = now
+
+    def mark_line(self, now: Optional[float] = None):
+        self.mark_lines(1, now)
+
+    def mark_lines(self, count: int, now: Optional[float] = None):
+        """Record `count` lines completed by one read; all but the first arrive with no gap."""
+        if count <= 0:
+            return
+        now = now if now is not None else time.monotonic()
+        if self._last_line is not None:
+            self.gaps.observe(now - self._last_line)
+        if count > 1:
+            self.gaps.observe(0.0, count - 1)
+        self._last_line = now
+        self.lines += count
+
+    def mark_eof(self):
+        self.eof = time.monotonic()
+
+    def mark_exited(self):
+        self.exited = time.monotonic()
+
+    def phases(self) -> dict[str, float]:
+        """Phase durations in seconds (only the phases that were reached)."""
+        out = {}
+        if self.spawned is not None:
+            out["spawn_sec"] = self.spawned - self.start
+        if self.first_byte is not None:
+            out["first_byte_sec"] = self.first_byte - self.start
+        if self.last_byte is not None:
+            out["last_byte_sec"] = self.last_byte - self.start
+        if self.eof is not None and self.exited is not None:
+            out["exit_wait_sec"] = self.exited - self.eof
+        return out
+
+    def to_fields(self) -> dict:
+        """Usage-record fields."""
+        fields = {k: round(v, 3) for k, v in self.phases().items()}
+        fields["lines"] = self.lines
+        if self.gaps.count:
+            fields["line_gap_mean_sec"] = round(self.gaps.mean, 3)
+            fields["line_gap_p95_sec"] = round(self.gaps.quantile(0.95), 3)
+            fields["line_gap_max_sec"] = round(self.gaps.max, 3)
+        return fields
+
+    def observe(self, registry: MetricsRegistry, label: str):
+        """Feed the phase durations into `registry` histograms for `label`."""
+        for phase, value in self.phases().items():
+            registry.observe(f"cli_{phase[:-4]}_seconds", value, label=label)
+        if self.gaps.count:
+            registry.observe("cli_line_gap_max_seconds", self.gaps.max, label=label)
+
+
+METRICS = MetricsRegistry()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Prompt Multiplexing
+
+Folds several small requests that share one context into a single model
+call. The combined prompt states the context once, lists the
+sub-requests, and asks for one delimited section per sub-request:
+
+    <<<BEGIN spec>>>
+    ...
+    <<<END spec>>>
+
+Each section goes to its sub-request's parser. A sub-request whose
+section is missing or doesn't parse falls back to its own call, so a model
+that ignores the format costs one extra round trip, not a wrong answer.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+try:
+    from .metrics import METRICS
+except ImportError:
+    from metrics import METRICS
+
+_SECTION = re.compile(r"<<<BEGIN ([\w:.-]+)>>>[ \t]*\n?(.*?)\n?[ \t]*<<<END \1>>>", re.DOTALL)
+
+
+@dataclass
+class SubRequest:
+    """One request folded into a multiplexed call."""
+    key: str
+    instructions: str
+    # Turns the section text into the caller's result; raises if it can't.
+    parse: Callable[[str], Any]
+    # The individual call to make instead; None leaves the key out of the results.
+    fallback: Optional[Callable[[], Any]] = None
+
+
+def build_prompt(context: str, requests: list[SubRequest]) -> str:
+    """One prompt carrying `context` once and every sub-request."""
+    parts = [
+        "Answer each of the requests below. They all concern this context:",
+        "",
+        "CONTEXT:",
+        context.strip(),
+        "",
+        "REQUESTS:",
+    ]
+    for request in requests:
+        parts.append(f"[{request.key}] {request.instructions.strip()}")
+        parts.append("")
+    parts.append("Reply with exactly one section per request, in this form, and nothing outside the sections:")
+    for request in requests:
+        parts.append(f"<<<BEGIN {request.key}>>>")
+        parts.append(f"(answer to [{request.key}])")
+        parts.append(f"<<<END {request.key}>>>")
+    return "\n".join(parts) + "\n"
+
+
+def split_sections(output: str, keys: list[str]) -> dict[str, str]:
+    """The text of each complete section for `keys` (first occurrence wins)."""
+    wanted = set(keys)
+    sections: dict[str, str] = {}
+    for match in _SECTION.finditer(output or ""):
+        key = match.group(1)
+        if key in wanted and key not in sections:
+            sections[key] = match.group(2).strip()
+    return sections
+
+
+def run_multiplexed(call: Callable[[str], str], context: str, requests: list[SubRequest],
+                    label: str = "multiplex") -> dict[str, Any]:
+    """
+    Answer `requests` with one `call(prompt) -> output` and parse each section back.
+
+    Returns {key: parsed result} with fallbacks already applied; keys that
+    neither parsed nor had a fallback are missing.
+    """
+    if len(requests) < 2:
+        return {r.key: r.fallback() for r in requests if r.fallback is not None}
+
+    METRICS.inc("multiplex_calls_total", label=label)
+    output = call(build_prompt(context, requests))
+    sections = split_sections(output, [r.key for r in requests])
+    results: dict[str, Any] = {}
+    for request in requests:
+        text = sections.get(request.key)
+        try:
+            if text is None:
+                raise ValueError(f"no {request.key} section")
+            results[request.key] = request.parse(text)
+            continue
+        except Exception:
+            METRICS.inc("multiplex_fallbacks_total", label=label, key=request.key)
+        if request.fallback is not None:
+            results[request.key] = request.fallback()
+    return results
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Prompt Index
+
+Second cache tier for prompts that differ only in formatting: indentation,
+markdown decoration, or slightly different `compact_text` head/tail cuts.
+Prompts are normalized, split into word shingles and summarized as a MinHash
+signature; an LSH band index finds candidates in constant time and the
+estimated Jaccard similarity decides whether an existing exact-cache entry
+can answer the new prompt.
+
+The index only maps signatures to exact cache keys. The outputs themselves
+stay in the response cache, so eviction, dependency checks and `cache clear`
+all carry over; a stale index line simply resolves to a miss.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+BANDS = 16
+MAX_ENTRIES = 20000
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 64) - 1
+
+_FENCE_RE = re.compile(r"^\s*(```|~~~)[\w+-]*\s*$", re.MULTILINE)
+_MARKUP_RE = re.compile(r"^\s*(?:#{1,6}\s+|>\s*|[-*+]\s+|\d+[.)]\s+)", re.MULTILINE)
+_EMPHASIS_RE = re.compile(r"(\*\*|\*|`)(?=\S)(.+?)(?<=\S)\1")
+_RULE_RE = re.compile(r"^\s*([-=*_─═])\1{2,}\s*$", re.MULTILINE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Strip whitespace and markdown differences that don't change meaning."""
+    text = _FENCE_RE.sub(" ", text)
+    text = _RULE_RE.sub(" ", text)
+    text = _MARKUP_RE.sub("", text)
+    text = _EMPHASIS_RE.sub(r"\2", text)
+    text = text.replace("...", " ")
+    return _SPACE_RE.sub(" ", text).strip().lower()
+
+
+def _shingle_hashes(text: str, k: int = SHINGLE_WORDS) -> set[int]:
+    words = text.split()
+    if len(words) < k:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    return {
+        struct.unpack("<Q", hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest())[0]
+        for g in grams
+    }
+
+
+def _permutations(num_perm: int) -> list[tuple[int, int]]:
+    # Fixed seed so signatures stay comparable across processes and runs.
+    perms = []
+    for i in range(num_perm):
+        digest = hashlib.sha256(f"minhash:{i}".encode()).digest()
+        a, b = struct.unpack("<QQ", digest[:16])
+        perms.append(((a % (_PRIME - 1)) + 1, b % _PRIME))
+    return perms
+
+
+_PERMS = _permutations(NUM_PERM)
+
+
+def minhash(text: str) -> tuple[int, ...]:
+    """MinHash signature of a normalized prompt."""
+    hashes = _shingle_hashes(text)
+    if not hashes:
+        return tuple([_MASK] * NUM_PERM)
+    return tuple(min(((a * h + b) % _PRIME) for h in hashes) for a, b in _PERMS)
+
+
+def similarity(sig_a: tuple[int, ...], sig_b: tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class NearDupIndex:
+    """
+    Persistent MinHash/LSH index from prompt signatures to exact cache keys.
+
+    Entries are grouped by scope (label, cli and model) and never match
+    across scopes. The index is an append-only JSON-lines file rewritten
+    once it holds twice `max_entries` lines.
+    """
+
+    def __init__(self, path: Path, threshold: float = 0.9, max_entries: int = MAX_ENTRIES):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Optional[OrderedDict[str, tuple[str, tuple[int, ...]]]] = None
+        self._bands: dict[tuple, set[str]] = {}
+        self._lines = 0
+        self._offset = 0
+
+    def lookup(self, scope: str, prompt: str) -> Optional[tuple[str, float]]:
+        """
+        Find the most similar indexed prompt in the same scope.
+
+        Returns:
+            Tuple of (cache_key, similarity), or None below the threshold
+        """
+        sig = minhash(normalize_prompt(prompt))
+        with self._lock:
+            self._load()
+            candidates = set()
+            for band in self._band_keys(scope, sig):
+                candidates |= self._bands.get(band, set())
+            best = None
+            for key in candidates:
+                score = similarity(sig, self._entries[key][1])
+                if score >= self.threshold and (best is None or score > best[1]):
+                    best = (key, score)
+            return best
+
+    def add(self, scope: str, cache_key: str, prompt: str):
+        """Index a prompt whose output was stored under `cache_key`."""
+        sig = minhash(normalize_prompt(prompt))
+        with self._lock:
+            self._load()
+            self._insert(scope, cache_key, sig)
+            line = json.dumps({"scope": scope, "key": cache_key, "sig": list(sig)}) + "\n"
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+                self._offset = f.tell()
+            self._lines += 1
+            if self._lines > 2 * self.max_entries:
+                self._rewrite()
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()
+            self._bands = {}
+            self._lines = 0
+            self._offset = 0
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+    def _load(self):
+        # Pick up lines appended by other processes; a shrunken file means
+        # it was rewritten or cleared, so start over.
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if self._entries is not None and size == self._offset:
+            return
+        if self._entries is None or size < self._offset:
+            self._entries = OrderedDict()
+            self._bands = {}
+            self._lines = 0
+            self._offset = 0
+        if size == 0:
+            return
+        with self.path.open("rb") as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        for line in data[:end].splitlines():
+            self._lines += 1
+            try:
+                record = json.loads(line)
+                sig = tuple(int(x) for x in record["sig"])
+                scope, key = record["scope"], record["key"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if len(sig) == NUM_PERM:
+                self._insert(scope, key, sig)
+
+    def _insert(self, scope: str, cache_key: str, sig: tuple[int, ...]):
+        if cache_key in self._entries:
+            self._drop(cache_key)
+        self._entries[cache_key] = (scope, sig)
+        for band in self._band_keys(scope, sig):
+            self._bands.setdefault(band, set()).add(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, cache_key: str):
+        scope, sig = self._entries.pop(cache_key)
+        for band in self._band_keys(scope, sig):
+            keys = self._bands.get(band)
+            if keys is not None:
+                keys.discard(cache_key)
+                if not keys:
+                    del self._bands[band]
+
+    @staticmethod
+    def _band_keys(scope: str, sig: tuple[int, ...]) -> list[tuple]:
+        rows = len(sig) // BANDS
+        return [(scope, i, sig[i * rows:(i + 1) * rows]) for i in range(BANDS)]
+
+    def _rewrite(self):
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for key, (scope, sig) in self._entries.items():
+                f.write(json.dumps({"scope": scope, "key": key, "sig": list(sig)}) + "\n")
+        os.replace(tmp, self.path)
+        self._lines = len(self._entries)
+        self._offset = self.path.stat().st_size
@@ -12,23 +12,41 @@ from __future__ import annotations
 
 import json
 import sys
+import asyncio
 import signal
 from pathlib import Path
 from datetime import datetime
 from dataclasses import dataclass, field
-from typing import Optional, Callable
+from typing import Optional, Callable, Union
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 
 try:
     from .utils import (
         Colors, WORKSPACE, AGENTS_DIR, COMMANDS_DIR,
-        run_cli, load_agent_prompt, print_header,
+        run_cli, arun_cli, load_agent_prompt, print_header, terminate_active_processes,
     )
+    from .metrics import METRICS
+    from .output import OutputHandle
+    from .tracing import span, traced
 except ImportError:
     from utils import (
         Colors, WORKSPACE, AGENTS_DIR, COMMANDS_DIR,
-        run_cli, load_agent_prompt, print_header,
+        run_cli, arun_cli, load_agent_prompt, print_header, terminate_active_processes,
     )
+    from metrics import METRICS
+    from output import OutputHandle
+    from tracing import span, traced
+
+@contextmanager
+def _active_worker(mode: str):
+    """Count a parallel worker as busy (exported as parallel_workers_active)."""
+    METRICS.add("parallel_workers_active", 1, mode=mode)
+    try:
+        yield
+    finally:
+        METRICS.add("parallel_workers_active", -1, mode=mode)
+
 
 # ============================================================================
 # DATA STRUCTURES
@@ -52,7 +70,8 @@ class Task:
     agent: str
     prompt: str
     status: str = "pending"
-    output: Optional[str] = None
+    # Bounded in memory: large transcripts are spilled to state/outputs/.
+    output: Optional[Union[str, OutputHandle]] = None
     error: Optional[str] = None
 
 
@@ -145,12 +164,14 @@ class Orchestrator:
         task.status = "running"
         self._print_task_start(task, agent)
 
-        output, code = run_cli(
-            self.cli,
-            task.prompt,
-            timeout=timeout,
-            usage_label=f"orch:{task.agent}",
-        )
+        with span(f"task:{task.name}", "task", agent=task.agent):
+            output, code = run_cli(
+                self.cli,
+                task.prompt,
+                timeout=timeout,
+                usage_label=f"orch:{task.agent}",
+                as_handle=True,
+            )
 
         task.output = output
         if code == 0:
@@ -163,12 +184,13 @@ class Orchestrator:
 
         return task
 
+    @traced("orch:parallel", "orch")
     def run_parallel(self, tasks: list[Task], max_workers: int = 3, timeout: int = 600) -> list[Task]:
         """Run tasks in parallel."""
         print(f"\n  {Colors.CYAN}Running {len(tasks)} tasks in parallel...{Colors.RESET}")
 
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {executor.submit(self.run_task, t, timeout): t for t in tasks}
+            futures = {executor.submit(self._run_worker, t, timeout): t for t in tasks}
             results = []
             for future in as_completed(futures):
                 try:
@@ -181,6 +203,63 @@ class Orchestrator:
 
         return results
 
+    def _run_worker(self, task: Task, timeout: int) -> Task:
+        with _active_worker("thread"):
+            return self.run_task(task, timeout)
+
+    async def arun_task(self, task: Task, timeout: int = 600) -> Task:
+        """Run a single task on the event loop."""
+        agent = self.registry.get(task.agent)
+        if not agent:
+            task.status = "failed"
+            task.error = f"Agent '{task.agent}' not found"
+            return task
+
+        task.status = "running"
+        self._print_task_start(task, agent)
+
+        with span(f"task:{task.name}", "task", agent=task.agent):
+            output, code = await arun_cli(
+                self.cli,
+                task.prompt,
+                timeout=timeout,
+                usage_label=f"orch:{task.agent}",
+                as_handle=True,
+            )
+
+        task.output = output
+        if code == 0:
+            task.status = "completed"
+            print(f"  {Colors.GREEN}✓ Completed{Colors.RESET}")
+        else:
+            task.status = "failed"
+            task.error = f"Exit code: {code}"
+            print(f"  {Colors.RED}✗ Failed{Colors.RESET}")
+
+        return task
+
+    @traced("orch:parallel", "orch")
+    async def arun_parallel(self, tasks: list[Task], max_concurrency: int = 50, timeout: int = 600) -> list[Task]:
+        """Run tasks concurrently on one event loop, without a thread per task."""
+        print(f"\n  {Colors.CYAN}Running {len(tasks)} tasks concurrently...{Colors.RESET}")
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def _run(task: Task) -> Task:
+            async with semaphore:
+                with _active_worker("async"):
+                    try:
+                        return await self.arun_task(task, timeout)
+                    except Exception as e:
+                        task.status = "failed"
+                        task.error = str(e)
+                        return task
+
+        results = []
+        for coro in asyncio.as_completed([_run(t) for t in tasks]):
+            results.append(await coro)
+        return results
+
     def _print_task_start(self, task: Task, agent: AgentConfig):
         """Print task start."""
         color_map = {
@@ -227,7 +306,7 @@ def main():
 
     orch = Orchestrator(cli=args.cli)
 
-    signal.signal(signal.SIGINT, lambda s, f: (print(f"\n{Colors.YELLOW}Interrupted.{Colors.RESET}"), sys.exit(130)))
+    signal.signal(signal.SIGINT, lambda s, f: (print(f"\n{Colors.YELLOW}Interrupted.{Colors.RESET}"), terminate_active_processes(), sys.exit(130)))
 
     if args.command == "status":
         orch.print_status()
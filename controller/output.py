@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Bounded-Memory CLI Output
+
+An `OutputHandle` collects one CLI transcript as it streams in. Small
+transcripts stay in memory; once one grows past a threshold it is spilled
+to a file and only a head and a tail are kept in memory, so a hundred
+parallel tasks dumping diffs and test logs don't each hold megabytes.
+
+The handle behaves like a read-only string where callers need it to:
+`len()`, slicing (`output[:2000]` and `output[-4000:]` come from memory),
+`in`, iteration over lines and `str()` for the whole text. `mmap()` maps
+the transcript for byte-level scanning without reading it into memory.
+The spill file is removed when the handle is closed or garbage collected.
+"""
+from __future__ import annotations
+
+import io
+import mmap as _mmap
+import os
+import uuid
+import weakref
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+DEFAULT_SPILL_CHARS = 1024 * 1024
+DEFAULT_HEAD_CHARS = 64 * 1024
+DEFAULT_TAIL_CHARS = 64 * 1024
+READ_CHARS = 1024 * 1024
+
+
+class OutputHandle:
+    """One CLI transcript: in memory while small, spilled to `spill_dir` when large."""
+
+    def __init__(self, spill_dir: Optional[Path] = None, spill_chars: int = DEFAULT_SPILL_CHARS,
+                 head_chars: int = DEFAULT_HEAD_CHARS, tail_chars: int = DEFAULT_TAIL_CHARS):
+        self.spill_dir = Path(spill_dir) if spill_dir is not None else None
+        self.spill_chars = spill_chars
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self.path: Optional[Path] = None
+        self._buffer: Optional[io.StringIO] = io.StringIO()
+        self._file = None
+        self._head = ""
+        self._tail: list[str] = []
+        self._tail_len = 0
+        self._length = 0
+        self._finalizer = None
+
+    @classmethod
+    def from_text(cls, text: str, **kwargs) -> "OutputHandle":
+        handle = cls(**kwargs)
+        handle.write(text)
+        return handle
+
+    # -- writing -----------------------------------------------------------
+
+    def write(self, text: str) -> int:
+        if not text:
+            return 0
+        self._length += len(text)
+        if self._buffer is not None:
+            self._buffer.write(text)
+            if self._length > self.spill_chars and self.spill_dir is not None:
+                self.spill()
+            return len(text)
+        self._file.write(text)
+        self._push_tail(text)
+        return len(text)
+
+    def spill(self) -> Optional[Path]:
+        """Move the transcript to a file (no-op if already spilled); returns its path."""
+        if self._buffer is None:
+            return self.path
+        if self.spill_dir is None:
+            return None
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.spill_dir / f"output-{os.getpid()}-{uuid.uuid4().hex[:12]}.txt"
+        self._file = open(self.path, "w", encoding="utf-8", newline="\n")
+        self._finalizer = weakref.finalize(self, _discard, self._file, self.path)
+        text = self._buffer.getvalue()
+        self._buffer = None
+        self._file.write(text)
+        self._head = text[:self.head_chars]
+        self._tail, self._tail_len = [], 0
+        self._push_tail(text[-self.tail_chars:] if self.tail_chars else "")
+        return self.path
+
+    def _push_tail(self, text: str):
+        if not text or not self.tail_chars:
+            return
+        self._tail.append(text)
+        self._tail_len += len(text)
+        if self._tail_len > 2 * self.tail_chars:
+            joined = "".join(self._tail)[-self.tail_chars:]
+            self._tail, self._tail_len = [joined], len(joined)
+
+    def close(self):
+        """Drop the spill file; the handle is unusable afterwards if it had spilled."""
+        if self._finalizer is not None:
+            self._finalizer()
+
+    # -- reading -----------------------------------------------------------
+
+    @property
+    def spilled(self) -> bool:
+        return self._buffer is None
+
+    def text(self) -> str:
+        """The whole transcript as one string (reads the spill file)."""
+        if self._buffer is not None:
+            return self._buffer.getvalue()
+        self._file.flush()
+        return self.path.read_text(encoding="utf-8")
+
+    getvalue = text
+
+    def head(self, n: int) -> str:
+        if self._buffer is not None:
+            return self._buffer.getvalue()[:n]
+        if n <= len(self._head):
+            return self._head[:n]
+        return self._read(0, n)
+
+    def tail(self, n: int) -> str:
+        if n <= 0:
+            return ""
+        if self._buffer is not None:
+            return self._buffer.getvalue()[-n:]
+        tail = self._tail_text()
+        if n <= len(tail):
+            return tail[-n:]
+        return self._read(max(0, self._length - n), self._length)
+
+    def _tail_text(self) -> str:
+        if len(self._tail) > 1:
+            self._tail = ["".join(self._tail)[-self.tail_chars:]]
+            self._tail_len = len(self._tail[0])
+        return self._tail[0] if self._tail else ""
+
+    def _read(self, start: int, stop: int) -> str:
+        """Characters [start, stop) from the spill file."""
+        self._file.flush()
+        with open(self.path, "r", encoding="utf-8", newline="\n") as f:
+            while start > 0:
+                skipped = len(f.read(min(start, READ_CHARS)))
+                if not skipped:
+                    return ""
+                start -= skipped
+                stop -= skipped
+            return f.read(max(0, stop))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return self.text()
+
+    def __repr__(self) -> str:
+        where = f"spilled to {self.path}" if self.spilled else "in memory"
+        return f"<OutputHandle {self._length} chars, {where}>"
+
+    def __getitem__(self, key: Union[int, slice]) -> str:
+        if isinstance(key, int):
+            index = key + self._length if key < 0 else key
+            if not 0 <= index < self._length:
+                raise IndexError("output index out of range")
+            return self[index:index + 1]
+        if self._buffer is not None:
+            return self._buffer.getvalue()[key]
+        start, stop, step = key.indices(self._length)
+        if step != 1:
+            return self.text()[key]
+        if stop <= start:
+            return ""
+        if stop <= len(self._head):
+            return self._head[start:stop]
+        tail = self._tail_text()
+        tail_start = self._length - len(tail)
+        if start >= tail_start:
+            return tail[start - tail_start:stop - tail_start]
+        return self._read(start, stop)
+
+    def __iter__(self) -> Iterator[str]:
+        """Lines (newline-terminated except possibly the last), streamed from disk if spilled."""
+        if self._buffer is not None:
+            yield from io.StringIO(self._buffer.getvalue(), newline="\n")
+            return
+        self._file.flush()
+        with open(self.path, "r", encoding="utf-8", newline="\n") as f:
+            yield from f
+
+    def chunks(self, size: int = READ_CHARS) -> Iterator[str]:
+        """The transcript in blocks of up to `size` characters, streamed from disk if spilled."""
+        if self._buffer is not None:
+            text = self._buffer.getvalue()
+            for start in range(0, len(text), size):
+                yield text[start:start + size]
+            return
+        self._file.flush()
+        with open(self.path, "r", encoding="utf-8", newline="\n") as f:
+            while True:
+                block = f.read(size)
+                if not block:
+                    return
+                yield block
+
+    def __contains__(self, needle: str) -> bool:
+        if self._buffer is not None:
+            return needle in self._buffer.getvalue()
+        self._file.flush()
+        overlap = max(0, len(needle) - 1)
+        carry = ""
+        with open(self.path, "r", encoding="utf-8", newline="\n") as f:
+            while True:
+                block = f.read(READ_CHARS)
+                if not block:
+                    return False
+                window = carry + block
+                if needle in window:
+                    return True
+                carry = window[-overlap:] if overlap else ""
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def mmap(self) -> Union[_mmap.mmap, memoryview]:
+        """
+        Read-only view of the UTF-8 transcript.
+
+        Spills first if needed and maps the file; close the returned map when
+        done. An empty transcript (which cannot be mapped) gives an empty view.
+        """
+        if self.spill() is None or self._length == 0:
+            return memoryview(self.text().encode("utf-8"))
+        self._file.flush()
+        with open(self.path, "rb") as f:
+            return _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+
+
+def _discard(file, path: Path):
+    try:
+        file.close()
+    except OSError:
+        pass
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+def sweep_stale(spill_dir: Path) -> int:
+    """Remove spill files left behind by processes that no longer exist."""
+    removed = 0
+    try:
+        paths = list(Path(spill_dir).glob("output-*-*.txt"))
+    except OSError:
+        return 0
+    for path in paths:
+        try:
+            pid = int(path.name.split("-")[1])
+        except (IndexError, ValueError):
+            continue
+        if pid == os.getpid() or _pid_alive(pid):
+            continue
+        try:
+            path.unlink()
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def as_text(output: Union[str, OutputHandle, None]) -> str:
+    """The full text of either a plain string or a handle."""
+    if output is None:
+        return ""
+    return output if isinstance(output, str) else output.text()
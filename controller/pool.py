@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Pre-warmed CLI Worker Pool
+
+Keeps a few idle CLI processes per (cli, model, workspace) already started
+and blocked on stdin, so a call only has to write its prompt instead of
+paying interpreter/Node startup, auth and config loading first.
+
+Print-mode CLIs answer exactly one prompt and exit, so every worker is
+single-use: taking one schedules a replacement in the background. Idle
+workers older than `max_age` are recycled so long-lived pools never hand
+out a process with stale auth or config, and every `max_uses` hand-outs
+the whole idle set is respawned, so a busy pool whose workers never get
+old still starts fresh processes on a fixed schedule.
+"""
+from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+
+@dataclass
+class PoolStats:
+    """Counters for one pool."""
+    hits: int = 0
+    misses: int = 0
+    spawned: int = 0
+    recycled: int = 0
+    dead: int = 0
+    generations: int = 1
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class _Worker:
+    process: subprocess.Popen
+    started_at: float
+
+
+class WorkerPool:
+    """A fixed-size set of idle CLI processes waiting for a prompt on stdin."""
+
+    def __init__(self, cmd: list[str], cwd: Path, size: int = 2, max_age: float = 600.0,
+                 max_uses: int = 0):
+        self.cmd = list(cmd)
+        self.cwd = Path(cwd)
+        self.size = max(0, size)
+        self.max_age = max_age
+        self.max_uses = max(0, max_uses)
+        self.stats = PoolStats()
+        self._idle: list[_Worker] = []
+        self._uses = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._wakeup.set()  # fill the pool right away, not on the first acquire
+        self._closed = False
+        self._refiller = threading.Thread(target=self._refill_loop, name="cli-pool-refill", daemon=True)
+        self._refiller.start()
+
+    def acquire(self) -> tuple[subprocess.Popen, bool]:
+        """
+        Take a warm process, or spawn a cold one if none is ready.
+
+        The returned process has stdin, stdout (stderr merged) as byte pipes
+        and runs in its own session. The caller owns it from here on.
+
+        Returns:
+            Tuple of (process, was_warm)
+        """
+        stale: list[_Worker] = []
+        with self._lock:
+            worker = self._take_idle()
+            if worker:
+                self.stats.hits += 1
+            else:
+                self.stats.misses += 1
+            self._uses += 1
+            if self.max_uses and self._uses >= self.max_uses:
+                stale, self._idle = self._idle, []
+                self._uses = 0
+                self.stats.recycled += len(stale)
+                self.stats.generations += 1
+        self._wakeup.set()
+        for old in stale:
+            _kill(old.process)
+        if worker:
+            return worker.process, True
+        process = self._spawn()
+        with self._lock:
+            self.stats.spawned += 1
+        return process, False
+
+    def close(self):
+        """Stop refilling and kill all idle workers."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        self._wakeup.set()
+        for worker in idle:
+            _kill(worker.process)
+
+    def _take_idle(self) -> Optional[_Worker]:
+        now = time.monotonic()
+        while self._idle:
+            worker = self._idle.pop(0)
+            if worker.process.poll() is not None:
+                self.stats.dead += 1
+                _kill(worker.process)
+                continue
+            if self.max_age and now - worker.started_at > self.max_age:
+                self.stats.recycled += 1
+                _kill(worker.process)
+                continue
+            return worker
+        return None
+
+    def _spawn(self) -> subprocess.Popen:
+        return subprocess.Popen(
+            self.cmd,
+            cwd=str(self.cwd),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+
+    def _refill_loop(self):
+        while True:
+            self._wakeup.wait(timeout=self.max_age / 2 if self.max_age else None)
+            self._wakeup.clear()
+            while True:
+                with self._lock:
+                    if self._closed:
+                        return
+                    self._recycle_stale()
+                    missing = self.size - len(self._idle)
+                if missing <= 0:
+                    break
+                try:
+                    process = self._spawn()
+                except Exception:
+                    break
+                with self._lock:
+                    if self._closed:
+                        _kill(process)
+                        return
+                    self.stats.spawned += 1
+                    self._idle.append(_Worker(process, time.monotonic()))
+
+    def _recycle_stale(self):
+        now = time.monotonic()
+        keep = []
+        for worker in self._idle:
+            if worker.process.poll() is not None:
+                self.stats.dead += 1
+                _kill(worker.process)
+            elif self.max_age and now - worker.started_at > self.max_age:
+                self.stats.recycled += 1
+                _kill(worker.process)
+            else:
+                keep.append(worker)
+        self._idle = keep
+
+
+def _kill(process: subprocess.Popen):
+    if process.poll() is None:
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+    for pipe in (process.stdin, process.stdout):
+        if pipe:
+            pipe.close()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Prometheus Textfile Exporter
+
+Renders the in-process metrics registry in the Prometheus text exposition
+format and rewrites a `.prom` file periodically, for node_exporter's
+textfile collector. The file is replaced atomically so a scrape never sees
+a half-written file.
+
+Several processes on a host each write their own file; `labels` (say, an
+instance name) are added to every series so node_exporter doesn't see the
+same series in two files.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+try:
+    from .metrics import MetricsRegistry
+except ImportError:
+    from metrics import MetricsRegistry
+
+PREFIX = "orchestrator_"
+
+
+def render_prometheus(registry: MetricsRegistry, prefix: str = PREFIX,
+                      common: Optional[dict] = None) -> str:
+    """Text exposition of every series in `registry`, each also carrying the `common` labels."""
+    snap = registry.snapshot()
+    common = common or {}
+    lines: list[str] = []
+    typed: set[str] = set()
+
+    def _type(name: str, kind: str):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for name, labels, value in snap["counters"]:
+        metric = prefix + name
+        _type(metric, "counter")
+        lines.append(f"{metric}{_labels({**common, **labels})} {_num(value)}")
+
+    for name, labels, value in snap["gauges"]:
+        metric = prefix + name
+        _type(metric, "gauge")
+        lines.append(f"{metric}{_labels({**common, **labels})} {_num(value)}")
+
+    for name, labels, hist in snap["histograms"]:
+        metric = prefix + name
+        _type(metric, "histogram")
+        labels = {**common, **labels}
+        cumulative = 0
+        for bound, count in zip(hist["buckets"], hist["counts"]):
+            cumulative += count
+            lines.append(f"{metric}_bucket{_labels(labels, le=_num(bound))} {cumulative}")
+        lines.append(f"{metric}_bucket{_labels(labels, le='+Inf')} {hist['count']}")
+        lines.append(f"{metric}_sum{_labels(labels)} {_num(hist['sum'])}")
+        lines.append(f"{metric}_count{_labels(labels)} {hist['count']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _labels(labels: dict, **extra) -> str:
+    items = {**labels, **extra}
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{_escape(str(v))}"' for k, v in items.items())
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(value) -> str:
+    if isinstance(value, float):
+        return repr(value) if not value.is_integer() else str(int(value))
+    return str(value)
+
+
+class TextfileExporter:
+    """
+    Rewrites `path` from `registry` every `interval` seconds and on demand.
+
+    `labels` are added to every series; with `remove_on_close` the file is
+    deleted at close instead of written a last time (for per-run files that
+    would otherwise pile up in the textfile directory).
+    """
+
+    def __init__(self, path: Path, registry: MetricsRegistry, interval: float = 15.0,
+                 labels: Optional[dict] = None, remove_on_close: bool = False):
+        self.path = Path(path)
+        self.registry = registry
+        self.interval = max(1.0, interval)
+        self.labels = dict(labels or {})
+        self.remove_on_close = remove_on_close
+        self._stop = threading.Event()
+        self._dirty = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prom-textfile", daemon=True)
+            self._thread.start()
+
+    def touch(self):
+        """Note that metrics changed; the next tick will write them."""
+        self._dirty.set()
+
+    def write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(render_prometheus(self.registry, common=self.labels), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def close(self):
+        self._stop.set()
+        try:
+            if self.remove_on_close:
+                self.path.unlink(missing_ok=True)
+            else:
+                self.write()
+        except OSError:
+            pass
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self._dirty.is_set():
+                continue
+            self._dirty.clear()
+            try:
+                self.write()
+            except OSError:
+                pass
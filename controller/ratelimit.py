@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Rate Limiting per Backend and Model
+
+A `RateLimiter` holds three limits for one (CLI, model) pair: requests per
+minute and tokens per minute (token buckets that refill continuously and
+allow at most a minute's worth of burst) and a cap on concurrent calls.
+
+Callers queue instead of failing, and they queue fairly: waiters are
+served strictly in arrival order, so a large request at the head is not
+starved by a stream of small ones slipping past it. Tokens are reserved
+from an estimate when a call starts and settled against the real count
+when it ends; an underestimate leaves the bucket in debt, which delays
+the calls after it.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+# How often an async waiter re-checks a slot it is waiting on; bucket
+# refills are computed exactly instead.
+ASYNC_POLL_SEC = 0.05
+
+
+class Lease:
+    """One admitted call; release() it when the call ends."""
+
+    def __init__(self, limiter: "RateLimiter", tokens: int, waited: float):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.waited = waited
+        self._released = False
+
+    def release(self, used_tokens: Optional[int] = None):
+        if not self._released:
+            self._released = True
+            self.limiter._release(self.tokens, used_tokens)
+
+
+class RateLimiter:
+    """Requests/min, tokens/min and max-concurrent limits (0 = unlimited) with FIFO admission."""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, max_concurrent: int = 0):
+        self.rpm = max(0.0, float(rpm))
+        self.tpm = max(0.0, float(tpm))
+        self.max_concurrent = max(0, int(max_concurrent))
+        self._requests = self.rpm
+        self._tokens = self.tpm
+        self._stamp = time.monotonic()
+        self._active = 0
+        self._queue: deque[int] = deque()
+        self._tickets = 0
+        self._cond = threading.Condition()
+
+    @property
+    def unlimited(self) -> bool:
+        return not (self.rpm or self.tpm or self.max_concurrent)
+
+    def acquire(self, tokens: int = 0) -> Lease:
+        """Block until this call may start (in arrival order)."""
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue()
+            try:
+                while True:
+                    wait = self._admit(ticket, tokens)
+                    if wait == 0:
+                        return Lease(self, tokens, time.monotonic() - start)
+                    self._cond.wait(wait)
+            finally:
+                self._dequeue(ticket)
+
+    async def aacquire(self, tokens: int = 0) -> Lease:
+        """acquire() for coroutines: waits with asyncio.sleep, so the loop keeps running."""
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue()
+        try:
+            while True:
+                with self._cond:
+                    wait = self._admit(ticket, tokens)
+                if wait == 0:
+                    return Lease(self, tokens, time.monotonic() - start)
+                await asyncio.sleep(ASYNC_POLL_SEC if wait is None else min(wait, 1.0))
+        finally:
+            with self._cond:
+                self._dequeue(ticket)
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "rpm": self.rpm, "tpm": self.tpm, "max_concurrent": self.max_concurrent,
+                "active": self._active, "queued": len(self._queue),
+                "requests_left": round(self._requests, 1), "tokens_left": round(self._tokens),
+            }
+
+    # -- internals (called with the condition held) ----------------------------
+
+    def _enqueue(self) -> int:
+        self._tickets += 1
+        self._queue.append(self._tickets)
+        return self._tickets
+
+    def _dequeue(self, ticket: int):
+        try:
+            self._queue.remove(ticket)
+        except ValueError:
+            pass
+        self._cond.notify_all()
+
+    def _admit(self, ticket: int, tokens: int) -> Optional[float]:
+        """0 if `ticket` starts now (taking its share), else seconds to wait (None: until a release)."""
+        if self._queue[0] != ticket:
+            return None
+        if self.max_concurrent and self._active >= self.max_concurrent:
+            return None
+        now = time.monotonic()
+        self._refill(now)
+        wait = 0.0
+        if self.rpm and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60.0 / self.rpm)
+        # A request bigger than the whole bucket goes once the bucket is full.
+        need = min(tokens, self.tpm)
+        if self.tpm and self._tokens < need:
+            wait = max(wait, (need - self._tokens) * 60.0 / self.tpm)
+        if wait > 0:
+            return wait
+        if self.rpm:
+            self._requests -= 1
+        if self.tpm:
+            self._tokens -= tokens
+        self._active += 1
+        return 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._stamp
+        self._stamp = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def _release(self, reserved: int, used: Optional[int]):
+        with self._cond:
+            self._active = max(0, self._active - 1)
+            if self.tpm and used is not None:
+                self._tokens -= used - reserved
+            self._cond.notify_all()
+
+
+def parse_limits(spec: str) -> dict[str, dict]:
+    """
+    Parse ORCHESTRATOR_RATE_LIMITS: "target:key=value,...;target:...".
+
+    A target is a CLI_CONFIGS entry, optionally with a model ("claude",
+    "copilot@gpt-5.1-codex-mini"); keys are rpm, tpm and concurrent.
+    Unparseable pieces are skipped.
+    """
+    limits: dict[str, dict] = {}
+    for item in spec.split(";"):
+        target, sep, body = item.partition(":")
+        target = target.strip()
+        if not sep or not target:
+            continue
+        values = {}
+        for pair in body.split(","):
+            key, _, value = pair.partition("=")
+            key = {"concurrent": "max_concurrent"}.get(key.strip(), key.strip())
+            if key not in ("rpm", "tpm", "max_concurrent"):
+                continue
+            try:
+                values[key] = float(value)
+            except ValueError:
+                continue
+        if values:
+            limits[target] = values
+    return limits
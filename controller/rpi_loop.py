@@ -17,14 +17,20 @@ try:
         run_cli, extract_score, load_command_prompt, load_project_context,
         LoopState, load_state, save_state,
         get_current_story, print_header, print_phase, print_score,
+        terminate_active_processes,
     )
+    from .metrics import METRICS
+    from .tracing import span, traced
 except ImportError:
     from utils import (
         Colors, WORKSPACE, STATE_DIR,
         run_cli, extract_score, load_command_prompt, load_project_context,
         LoopState, load_state, save_state,
         get_current_story, print_header, print_phase, print_score,
+        terminate_active_processes,
     )
+    from metrics import METRICS
+    from tracing import span, traced
 
 # ============================================================================
 # CONFIGURATION
@@ -42,6 +48,7 @@ RUBRIC_FILE = WORKSPACE / "rubric.md"
 
 MAX_ITERATIONS = 10
 DEFAULT_TIMEOUT = 600
+SCORE_BUCKETS = (10, 20, 30, 40, 50, 60, 70, 80, 90, 99, 100)
 
 
 # ============================================================================
@@ -185,22 +192,29 @@ GRADE NOW.
 # ============================================================================
 
 def run_phase(cli: str, phase: str, prompt: str, output_file: Path,
-              timeout: int = DEFAULT_TIMEOUT) -> tuple[str, bool]:
-    """Run a single phase."""
+              timeout: int = DEFAULT_TIMEOUT, inputs: tuple[Path, ...] = ()) -> tuple[str, bool]:
+    """Run a single phase; `inputs` are artifacts it reads besides the workspace sources."""
     print_phase(phase)
 
-    output, code = run_cli(cli, prompt, timeout=timeout, usage_label=f"rpi:{phase.lower()}")
-
-    if output_file.exists():
-        print(f"  {Colors.GREEN}✓ {output_file.name} created{Colors.RESET}")
-        return output_file.read_text(), True
-    else:
-        print(f"  {Colors.YELLOW}⚠ Output file not created, saving raw output{Colors.RESET}")
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-        output_file.write_text(output)
-        return output, code == 0
-
-
+    with span(f"rpi:{phase.lower()}", "rpi", output=output_file.name) as sp, \
+            METRICS.timer("phase_duration_seconds", loop="rpi", phase=phase.lower()):
+        output, code = run_cli(
+            cli, prompt, timeout=timeout, usage_label=f"rpi:{phase.lower()}",
+            depends_on=[WORKSPACE, *inputs],
+        )
+        sp.set(exit_code=code)
+
+        if output_file.exists():
+            print(f"  {Colors.GREEN}✓ {output_file.name} created{Colors.RESET}")
+            return output_file.read_text(), True
+        else:
+            print(f"  {Colors.YELLOW}⚠ Output file not created, saving raw output{Colors.RESET}")
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            output_file.write_text(output)
+            return output, code == 0
+
+
+@traced("rpi:iteration", "rpi")
 def run_rpi_iteration(cli: str, story: dict, version: int,
                       timeout: int, prev_grading: str = "") -> int:
     """Run one full RPI iteration."""
@@ -213,11 +227,14 @@ def run_rpi_iteration(cli: str, story: dict, version: int,
     for d in [RESEARCH_DIR, PLANS_DIR, SUBMISSION_DIR / f"V{version}", GRADING_DIR]:
         d.mkdir(parents=True, exist_ok=True)
 
+    research_file = RESEARCH_DIR / f"{story.get('id', 'US-1')}_research.md"
+    plan_file = PLANS_DIR / f"{story.get('id', 'US-1')}_plan.md"
+
     # Phase 1: Research
     run_phase(
         cli, "RESEARCH",
         get_researcher_prompt(story, prev_grading),
-        RESEARCH_DIR / f"{story.get('id', 'US-1')}_research.md",
+        research_file,
         timeout
     )
 
@@ -225,8 +242,9 @@ def run_rpi_iteration(cli: str, story: dict, version: int,
     run_phase(
         cli, "PLAN",
         get_planner_prompt(story),
-        PLANS_DIR / f"{story.get('id', 'US-1')}_plan.md",
-        timeout
+        plan_file,
+        timeout,
+        inputs=(research_file,)
     )
 
     # Phase 3: Implement
@@ -234,7 +252,8 @@ def run_rpi_iteration(cli: str, story: dict, version: int,
         cli, "IMPLEMENT",
         get_implementer_prompt(story, version),
         SUBMISSION_DIR / f"V{version}" / "SUBMISSION.md",
-        timeout
+        timeout,
+        inputs=(plan_file,)
     )
 
     # Phase 4: Grade
@@ -242,7 +261,8 @@ def run_rpi_iteration(cli: str, story: dict, version: int,
         cli, "GRADE",
         get_grader_prompt(story, version),
         GRADING_DIR / f"V{version}.md",
-        timeout
+        timeout,
+        inputs=(plan_file, SUBMISSION_DIR / f"V{version}")
     )
 
     score = extract_score(grading_output)
@@ -288,6 +308,7 @@ def run_loop(cli: str, max_iter: int = MAX_ITERATIONS, timeout: int = DEFAULT_TI
         score = run_rpi_iteration(cli, story, iteration, timeout, prev_grading)
 
         state.score = score
+        METRICS.observe("rpi_iteration_score", score, buckets=SCORE_BUCKETS)
         state.history.append({
             "version": iteration,
             "score": score,
@@ -370,7 +391,7 @@ def main():
 
     args = parser.parse_args()
 
-    signal.signal(signal.SIGINT, lambda s, f: (print(f"\n{Colors.YELLOW}Interrupted.{Colors.RESET}"), sys.exit(130)))
+    signal.signal(signal.SIGINT, lambda s, f: (print(f"\n{Colors.YELLOW}Interrupted.{Colors.RESET}"), terminate_active_processes(), sys.exit(130)))
 
     if args.command == "start":
         if STATE_FILE.exists():
@@ -7,7 +7,10 @@ Simple interface to run agents, workflows, and the RPI loop.
 from __future__ import annotations
 
 import argparse
+import json
+import signal
 import sys
+import time
 from pathlib import Path
 
 # Add controller to path
@@ -15,12 +18,26 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 try:
     from .orchestrator import Orchestrator
-    from .utils import Colors
+    from .utils import (
+        Colors, terminate_active_processes, get_cache, get_neardup_index, USAGE_LOG, benchmark_output_reader,
+        run_cli_batch, BatchRequest, host_slot_status,
+    )
+    from .cache import benchmark_codecs
+    from .usagelog import usage_log_files
+    from .usagestats import build_report, DIMENSIONS
+    from .tracing import trace_run
     from .rpi_loop import run_loop, show_status, load_state, get_current_story
     from .tracer import Tracer
 except ImportError:
     from orchestrator import Orchestrator
-    from utils import Colors
+    from utils import (
+        Colors, terminate_active_processes, get_cache, get_neardup_index, USAGE_LOG, benchmark_output_reader,
+        run_cli_batch, BatchRequest, host_slot_status,
+    )
+    from cache import benchmark_codecs
+    from usagelog import usage_log_files
+    from usagestats import build_report, DIMENSIONS
+    from tracing import trace_run
     from rpi_loop import run_loop, show_status, load_state, get_current_story
     from tracer import Tracer
 
@@ -194,6 +211,185 @@ def cmd_tracer(args):
         print()
 
 
+def cmd_cache(args):
+    """Inspect or trim the CLI response cache."""
+    cache = get_cache()
+
+    if args.subcommand == "stats":
+        entries, size = cache.usage()
+        max_entries = cache.max_entries or "unlimited"
+        max_mb = f"{cache.max_bytes / 1024 / 1024:.0f} MB" if cache.max_bytes else "unlimited"
+        print()
+        print(f"{Colors.CYAN}═══ Cache ═══{Colors.RESET}")
+        print()
+        print(f"  Path:    {cache.root} ({type(cache).__name__})")
+        print(f"  Entries: {entries} (max {max_entries})")
+        print(f"  Size:    {size / 1024 / 1024:.1f} MB (max {max_mb})")
+        print(f"  On disk: {cache.disk_bytes() / 1024 / 1024:.1f} MB")
+        print(f"  Near-duplicate index: {len(get_neardup_index())} prompts")
+        print()
+
+    elif args.subcommand == "prune":
+        removed = cache.prune()
+        print(f"{Colors.GREEN}✓ Evicted {removed} entries{Colors.RESET}")
+
+    elif args.subcommand == "compact":
+        reclaimed = cache.compact()
+        print(f"{Colors.GREEN}✓ Reclaimed {reclaimed / 1024 / 1024:.1f} MB{Colors.RESET}")
+
+    elif args.subcommand == "train":
+        dict_id = cache.codec.train(cache.sample_outputs(args.samples))
+        if dict_id:
+            print(f"{Colors.GREEN}✓ Trained dictionary {dict_id}; new zlib entries for "
+                  f"ORCHESTRATOR_CACHE_DICT_LABELS will use it{Colors.RESET}")
+        else:
+            print(f"{Colors.YELLOW}Not enough shared content in the cache to train a dictionary{Colors.RESET}")
+
+    elif args.subcommand == "bench":
+        outputs = cache.sample_outputs(args.samples)
+        if not outputs:
+            print(f"{Colors.YELLOW}Cache is empty; nothing to benchmark{Colors.RESET}")
+            return
+        import tempfile
+        with tempfile.TemporaryDirectory() as dict_dir:
+            rows = benchmark_codecs(outputs, dict_dir=Path(dict_dir), cold=args.cold)
+        print()
+        print(f"  {'Codec':<22} {'Size':>10} {'Ratio':>7} {'read µs':>9} {'decode µs':>10} {'µs/hit':>9}")
+        for row in rows:
+            print(f"  {row['codec']:<22} {row['bytes'] / 1024:>8.0f}KB {row['ratio']:>6.1f}x "
+                  f"{row['read_us']:>9.1f} {row['decode_us']:>10.1f} {row['hit_us']:>9.1f}")
+        cache_state = "cold (dropped before each read)" if args.cold else "warm"
+        print(f"  {Colors.GRAY}Reads are {cache_state} page-cache reads of each codec's own files.{Colors.RESET}")
+        print()
+
+    elif args.subcommand == "clear":
+        removed = cache.clear()
+        get_neardup_index().clear()
+        print(f"{Colors.GREEN}✓ Removed {removed} entries{Colors.RESET}")
+
+
+def cmd_usage(args):
+    """Summarize state/usage.jsonl and its rotated segments."""
+    files = usage_log_files(USAGE_LOG)
+    if not files:
+        print(f"{Colors.YELLOW}No usage recorded yet ({USAGE_LOG}){Colors.RESET}")
+        return
+    index_path = USAGE_LOG.with_name("usage.idx.json")
+    report = build_report(files, active=USAGE_LOG, index_path=index_path, rescan=args.rescan)
+
+    totals = report.totals
+    print()
+    print(f"{Colors.CYAN}═══ Usage ═══{Colors.RESET}")
+    print()
+    print(f"  Calls:    {totals.calls} ({totals.failures} failed)")
+    print(f"  Tokens:   in≈{totals.in_tokens} out≈{totals.out_tokens} total≈{totals.total_tokens}")
+    print(f"  CLI time: {totals.elapsed / 60:.1f} min")
+    if totals.queue_wait:
+        print(f"  Queued:   {totals.queue_wait / 60:.1f} min waiting on rate limits and host slots")
+    print(f"  {Colors.GRAY}{len(files)} segment(s), scanned {report.scanned_bytes / 1024 / 1024:.1f} MB new"
+          f"{f', {report.bad_lines} unreadable lines' if report.bad_lines else ''}{Colors.RESET}")
+
+    dims = [d.strip() for d in args.by.split(",") if d.strip() in DIMENSIONS] if args.by else DIMENSIONS
+    for dim in dims:
+        groups = sorted(report.groups[dim].items(), key=lambda kv: kv[1].total_tokens, reverse=True)
+        print()
+        print(f"  {Colors.BOLD}By {dim}{Colors.RESET}")
+        print(f"  {dim:<34} {'calls':>7} {'tokens':>10} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7}"
+              f" {'p50 tok':>8} {'p95 tok':>8} {'p99 tok':>8}")
+        for key, stats in groups[:args.top]:
+            e, t = stats.elapsed_hist, stats.tokens_hist
+            print(f"  {key[:34]:<34} {stats.calls:>7} {stats.total_tokens:>10}"
+                  f" {e.quantile(0.5):>7.1f} {e.quantile(0.95):>7.1f} {e.quantile(0.99):>7.1f}"
+                  f" {t.quantile(0.5):>8.0f} {t.quantile(0.95):>8.0f} {t.quantile(0.99):>8.0f}")
+
+    cached = [(label, hits, misses) for label, (hits, misses) in report.cache.items() if hits]
+    if cached:
+        print()
+        print(f"  {Colors.BOLD}Cache hit ratio{Colors.RESET}")
+        for label, hits, misses in sorted(cached, key=lambda row: row[1] + row[2], reverse=True)[:args.top]:
+            print(f"  {label[:34]:<34} {hits:>7}/{hits + misses:<7} {100 * hits / (hits + misses):>5.1f}%")
+
+    print()
+    print(f"  {Colors.BOLD}Throughput per {args.bucket}{Colors.RESET}")
+    for bucket, calls, tokens, seconds in report.throughput(args.bucket, args.last):
+        print(f"  {bucket:<16} {calls:>7} calls {tokens:>10} tokens {seconds / 60:>8.1f} CLI min")
+    print()
+
+
+def cmd_bench(args):
+    """Measure CLI output reader throughput."""
+    print()
+    print(f"  Child writes {args.mb} MB of ~{args.line_bytes}-byte lines; best of {args.rounds}")
+    print()
+    print(f"  {'Reader':<20} {'MB/s':>8} {'lines/s':>12} {'Output':>8}")
+    for row in benchmark_output_reader(args.mb, args.line_bytes, args.rounds):
+        same = "same" if row["identical"] else f"{Colors.RED}DIFFERS{Colors.RESET}"
+        print(f"  {row['reader']:<20} {row['mb_per_sec']:>8.0f} {row['lines_per_sec']:>12,.0f} {same:>8}")
+    print()
+
+
+def cmd_batch(args):
+    """Run a JSONL file of independent prompts as one batch."""
+    source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    items, ids = [], []
+    with source:
+        for n, line in enumerate(source, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"{Colors.RED}Line {n}: not JSON{Colors.RESET}")
+                sys.exit(1)
+            if isinstance(record, str):
+                record = {"prompt": record}
+            if not isinstance(record, dict) or not isinstance(record.get("prompt"), str):
+                print(f"{Colors.RED}Line {n}: expected a string or an object with a \"prompt\" string{Colors.RESET}")
+                sys.exit(1)
+            items.append(BatchRequest(record["prompt"], usage_label=record.get("label")))
+            ids.append(record.get("id", len(ids)))
+
+    out_path = Path(args.out or (f"{args.file}.results.jsonl" if args.file != "-" else "batch-results.jsonl"))
+    print(f"  {len(items)} prompt(s) -> {out_path}")
+    failed = 0
+    with open(out_path, "w", encoding="utf-8") as out:
+        for done, result in enumerate(run_cli_batch(args.cli, items, timeout=args.timeout,
+                                                    usage_label=args.label), 1):
+            failed += result.code != 0
+            out.write(json.dumps({"id": ids[result.index], "output": result.output, "code": result.code,
+                                  "source": result.source}, ensure_ascii=False) + "\n")
+            out.flush()
+            mark = f"{Colors.GREEN}✓{Colors.RESET}" if result.code == 0 else f"{Colors.RED}✗{Colors.RESET}"
+            print(f"  {mark} [{done}/{len(items)}] {ids[result.index]} ({result.source})")
+    if failed:
+        print(f"  {Colors.YELLOW}{failed} item(s) failed{Colors.RESET}")
+        sys.exit(1)
+
+
+def cmd_slots(args):
+    """Show host-wide call slots and the processes holding them."""
+    status = host_slot_status()
+    print()
+    print(f"{Colors.CYAN}═══ Host Slots ═══{Colors.RESET}")
+    if not status:
+        print()
+        print(f"  {Colors.GRAY}No slots configured (ORCHESTRATOR_HOST_SLOTS){Colors.RESET}")
+    now = time.time()
+    for name, entry in status.items():
+        rows = entry["rows"]
+        held = [row for row in rows if row["state"] != "free"]
+        limit = entry["slots"] or "unlimited"
+        print()
+        print(f"  {Colors.BOLD}{name}{Colors.RESET}: {len(held)}/{limit} held")
+        for row in held:
+            color = Colors.RED if row["state"] == "orphaned" else Colors.GREEN
+            age = now - float(row.get("since") or now)
+            print(f"    slot {row['slot']:<3} {color}{row['state']:<8}{Colors.RESET} pid {row.get('pid', '?'):<7}"
+                  f" {age:>6.0f}s  {row.get('label', '')}  {Colors.GRAY}{row.get('command', '')}{Colors.RESET}")
+    print()
+
+
 def cmd_workflow(args):
     """Run a predefined workflow."""
     # NOTE: Workflow feature is not yet implemented
@@ -218,11 +414,16 @@ Examples:
   ./run.py workflow rpi                     # Run RPI workflow
   ./run.py tracer start "Fix the CSV bug"   # Start Tracer workflow
   ./run.py tracer status                    # Show Tracer status
+  ./run.py cache stats                      # Show cache size and limits
+  ./run.py usage --by label                 # Token/latency breakdown per label
+  ./run.py bench --mb 64                    # Output reader throughput
+  ./run.py batch prompts.jsonl --label tracer:execute:review  # Bulk offline prompts
+  ./run.py slots                            # Host-wide call slot holders
         """
     )
 
     # Global options
-    parser.add_argument("--cli", choices=["claude", "copilot"], default="claude",
+    parser.add_argument("--cli", choices=["claude", "copilot", "api"], default="claude",
                        help="CLI to use (default: claude)")
     parser.add_argument("--timeout", type=int, default=600,
                        help="Timeout in seconds (default: 600)")
@@ -274,8 +475,46 @@ Examples:
     tracer_resume.add_argument("ticket_id", help="Ticket ID")
     tracer_sub.add_parser("list", help="List specs and tickets")
 
+    # Cache command
+    cache_p = subparsers.add_parser("cache", help="CLI response cache")
+    cache_sub = cache_p.add_subparsers(dest="subcommand", required=True)
+    cache_sub.add_parser("stats", help="Show cache size and limits")
+    cache_sub.add_parser("prune", help="Evict entries down to the configured limits")
+    cache_sub.add_parser("compact", help="Rewrite the pack file without evicted entries")
+    cache_train = cache_sub.add_parser("train", help="Train a zlib dictionary on cached outputs")
+    cache_train.add_argument("--samples", type=int, default=500)
+    cache_bench = cache_sub.add_parser("bench", help="Compare codec size and per-hit decode cost")
+    cache_bench.add_argument("--samples", type=int, default=200)
+    cache_bench.add_argument("--cold", action="store_true", help="Drop each file from the page cache before reading it")
+    cache_sub.add_parser("clear", help="Remove all cache entries")
+
+    # Usage command
+    usage_p = subparsers.add_parser("usage", help="Summarize token usage and latency")
+    usage_p.add_argument("--by", help="Comma-separated breakdowns: label,model,cli (default: all)")
+    usage_p.add_argument("--bucket", choices=["hour", "day"], default="hour", help="Throughput bucket width")
+    usage_p.add_argument("--last", type=int, default=24, help="Throughput buckets to show (0 = all)")
+    usage_p.add_argument("--top", type=int, default=20, help="Rows per breakdown")
+    usage_p.add_argument("--rescan", action="store_true", help="Ignore the saved index and re-read all logs")
+
+    # Bench command
+    bench_p = subparsers.add_parser("bench", help="Measure CLI output reader throughput")
+    bench_p.add_argument("--mb", type=int, default=64, help="Output size in MB")
+    bench_p.add_argument("--line-bytes", type=int, default=120, help="Approximate line length")
+    bench_p.add_argument("--rounds", type=int, default=3)
+
+    # Batch command
+    batch_p = subparsers.add_parser("batch", help="Run a JSONL file of independent prompts")
+    batch_p.add_argument("file", help='JSONL of {"prompt": ..., "label": ..., "id": ...} ("-" for stdin)')
+    batch_p.add_argument("--label", default="batch", help="Usage label for items without one")
+    batch_p.add_argument("--out", help="Results JSONL (default: <file>.results.jsonl)")
+
+    # Slots command
+    subparsers.add_parser("slots", help="Show host-wide call slots and their holders")
+
     args = parser.parse_args()
 
+    signal.signal(signal.SIGINT, lambda s, f: (print(f"\n{Colors.YELLOW}Interrupted.{Colors.RESET}"), terminate_active_processes(), sys.exit(130)))
+
     # Route to command handler
     handlers = {
         "status": cmd_status,
@@ -285,11 +524,17 @@ Examples:
         "parallel": cmd_parallel,
         "workflow": cmd_workflow,
         "tracer": cmd_tracer,
+        "cache": cmd_cache,
+        "usage": cmd_usage,
+        "bench": cmd_bench,
+        "batch": cmd_batch,
+        "slots": cmd_slots,
     }
 
     handler = handlers.get(args.command)
     if handler:
-        handler(args)
+        with trace_run(args.command):
+            handler(args)
     else:
         parser.print_help()
 
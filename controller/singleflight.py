@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+In-flight Call Coalescing
+
+When several threads (or coroutines) issue the same CLI call at once, they
+all miss the cache, which is only filled once the first call finishes. A
+`FlightGroup` lets the first caller for a key lead the call while later
+callers attach to it as followers: they wait for the leader's result and can
+receive its output lines as they are produced.
+
+A flight with no followers keeps nothing: the leader's output is split into
+lines only once someone follows, and only the last REPLAY_LINES lines since
+the first follower joined are kept for replay to later ones.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Callable, Optional
+
+try:
+    from .streamjson import split_lines
+except ImportError:
+    from streamjson import split_lines
+
+REPLAY_LINES = 1000
+
+
+class Flight:
+    """One in-progress call shared by a leader and any number of followers."""
+
+    def __init__(self):
+        self.result: Any = None
+        self.followers = 0
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._listeners: list[Callable[[str], None]] = []
+        self._replay: deque[str] = deque(maxlen=REPLAY_LINES)
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def publish(self, text: str):
+        """Forward a block of whole lines from the leader to followers (a no-op without any)."""
+        if not self.followers:
+            return
+        lines = split_lines(text)
+        with self._lock:
+            self._replay.extend(lines)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            for line in lines:
+                try:
+                    listener(line)
+                except Exception:
+                    pass
+
+    def subscribe(self, listener: Callable[[str], None]):
+        """Replay the recent lines kept for followers to `listener`, then stream the rest."""
+        with self._lock:
+            for line in self._replay:
+                try:
+                    listener(line)
+                except Exception:
+                    pass
+            if not self._done.is_set():
+                self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[str], None]):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the leader finishes; returns False on timeout."""
+        return self._done.wait(timeout)
+
+    async def wait_async(self, timeout: Optional[float] = None) -> bool:
+        """Await the leader without holding a thread; returns False on timeout."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._done.is_set():
+                return True
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _finish(self, result: Any):
+        with self._lock:
+            self.result = result
+            self._done.set()
+            self._listeners = []
+            self._replay.clear()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class FlightGroup:
+    """Process-wide registry of in-flight calls keyed by request identity."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict[str, Flight] = {}
+
+    def join(self, key: str) -> tuple[Flight, bool]:
+        """
+        Attach to the in-flight call for `key`, or start one.
+
+        Returns:
+            Tuple of (flight, is_leader)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                return flight, False
+            flight = Flight()
+            self._flights[key] = flight
+            return flight, True
+
+    def finish(self, key: str, flight: Flight, result: Any,
+               share: Optional[Callable[[Any], Any]] = None):
+        """
+        Publish the leader's result and release the key for new calls.
+
+        `share`, if given, turns the result into what followers receive
+        (say, a copy of an object the leader keeps using); it is only
+        called when the flight had followers.
+        """
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if share is not None and flight.followers:
+            result = share(result)
+        flight._finish(result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Structured CLI Output Parsing
+
+CLIs that can emit a machine-readable event stream (one JSON object per
+line) report the tokens they actually used. A parser consumes that stream
+line by line as it arrives, hands human-readable text back for display,
+and at the end yields the final answer plus the reported usage, so callers
+no longer have to guess tokens from `len(text) / 4`.
+
+Anything that isn't a JSON event (warnings on the merged stderr, a crash
+trace) is passed through as plain text.
+"""
+from __future__ import annotations
+
+import io
+import json
+import time
+from typing import Optional
+
+
+class StreamParser:
+    """Base parser: every line is plain text and no usage or TTFT is reported."""
+
+    def __init__(self, sink=None):
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.in_tokens: Optional[int] = None
+        self.out_tokens: Optional[int] = None
+        self.cached_in_tokens: Optional[int] = None
+        self.cost_usd: Optional[float] = None
+        # Anything with write() and getvalue(): a StringIO or an OutputHandle.
+        self._text = sink if sink is not None else io.StringIO()
+        self._result: Optional[str] = None
+
+    def feed(self, text: str) -> str:
+        """Consume one or more raw output lines; return the text to display."""
+        self._text.write(text)
+        return text
+
+    @property
+    def output_text(self) -> str:
+        """The answer: the reported final result, else the text seen so far."""
+        if self._result is not None:
+            return self._result
+        return self._text.getvalue()
+
+    @property
+    def output(self):
+        """Like output_text, but the sink itself rather than a copy of its text."""
+        if self._result is not None:
+            return self._result
+        return self._text
+
+    @property
+    def ttft(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    def usage(self) -> dict:
+        """Reported usage fields (None where the CLI didn't report them)."""
+        return {
+            "in_tokens": self.in_tokens,
+            "out_tokens": self.out_tokens,
+            "cached_in_tokens": self.cached_in_tokens,
+            "cost_usd": self.cost_usd,
+            "ttft_sec": round(self.ttft, 3) if self.ttft is not None else None,
+        }
+
+    def _mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+
+
+class ClaudeStreamParser(StreamParser):
+    """
+    Parser for `claude --print --output-format stream-json --verbose`.
+
+    Assistant text blocks are displayed as they arrive, tool calls as a
+    one-line summary; the closing `result` event carries the final answer
+    and the session's token usage.
+    """
+
+    def feed(self, text: str) -> str:
+        shown: list[str] = []
+        for line in split_lines(text):
+            shown.extend(self._event(line))
+        return "".join(shown)
+
+    def _event(self, line: str) -> list[str]:
+        stripped = line.strip()
+        if not stripped:
+            return []
+        # Non-JSON lines are stderr noise here, not model output.
+        try:
+            event = json.loads(stripped)
+        except ValueError:
+            return self._plain(line)
+        if not isinstance(event, dict):
+            return self._plain(line)
+
+        kind = event.get("type")
+        if kind == "assistant":
+            return self._assistant(event.get("message") or {})
+        if kind == "result":
+            self._finish(event)
+        return []
+
+    def _plain(self, line: str) -> list[str]:
+        self._text.write(line)
+        return [line]
+
+    def _assistant(self, message: dict) -> list[str]:
+        shown = []
+        for block in message.get("content") or []:
+            if not isinstance(block, dict):
+                continue
+            if block.get("type") == "text" and block.get("text"):
+                self._mark_first_token()
+                text = block["text"]
+                self._text.write(text if text.endswith("\n") else text + "\n")
+                shown.extend(line + "\n" for line in text.splitlines())
+            elif block.get("type") == "tool_use":
+                self._mark_first_token()
+                shown.append(f"[tool] {block.get('name', '?')}\n")
+        return shown
+
+    def _finish(self, event: dict):
+        if isinstance(event.get("result"), str):
+            self._result = event["result"]
+        usage = event.get("usage") or {}
+        if usage:
+            fresh = int(usage.get("input_tokens") or 0)
+            cache_read = int(usage.get("cache_read_input_tokens") or 0)
+            cache_write = int(usage.get("cache_creation_input_tokens") or 0)
+            self.in_tokens = fresh + cache_read + cache_write
+            self.cached_in_tokens = cache_read
+            self.out_tokens = int(usage.get("output_tokens") or 0)
+        cost = event.get("total_cost_usd", event.get("cost_usd"))
+        if isinstance(cost, (int, float)):
+            self.cost_usd = float(cost)
+
+
+def split_lines(text: str) -> list[str]:
+    """Split on "\n" only, keeping the newlines (str.splitlines also splits on \r and others)."""
+    lines = text.split("\n")
+    last = lines.pop()
+    out = [line + "\n" for line in lines]
+    if last:
+        out.append(last)
+    return out
+
+
+STREAM_PARSERS = {
+    "claude-stream-json": ClaudeStreamParser,
+}
+
+
+def make_parser(stream_format: Optional[str], sink=None) -> StreamParser:
+    """Parser for a CLI_CONFIGS `stream_format` (plain text if unknown)."""
+    return STREAM_PARSERS.get(stream_format or "", StreamParser)(sink)
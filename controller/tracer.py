@@ -10,6 +10,7 @@ Features:
 from __future__ import annotations
 
 import json
+import os
 import re
 import sys
 import signal
@@ -20,20 +21,28 @@ from dataclasses import dataclass, field
 from typing import Optional
 from enum import Enum
 
-    try:
-        from .utils import (
-            Colors, WORKSPACE, STATE_DIR,
-            run_cli, extract_score, compact_text, load_project_context,
-            LoopState, load_state, save_state,
-            print_header, print_phase, print_progress,
-        )
-    except ImportError:
-        from utils import (
-            Colors, WORKSPACE, STATE_DIR,
-            run_cli, extract_score, compact_text, load_project_context,
-            LoopState, load_state, save_state,
-            print_header, print_phase, print_progress,
-        )
+try:
+    from .utils import (
+        Colors, WORKSPACE, STATE_DIR,
+        run_cli, extract_score, compact_text, load_project_context,
+        LoopState, load_state, save_state,
+        print_header, print_phase, print_progress, terminate_active_processes,
+    )
+    from .metrics import METRICS
+    from .output import OutputHandle
+    from .multiplex import SubRequest, run_multiplexed
+    from .tracing import traced
+except ImportError:
+    from utils import (
+        Colors, WORKSPACE, STATE_DIR,
+        run_cli, extract_score, compact_text, load_project_context,
+        LoopState, load_state, save_state,
+        print_header, print_phase, print_progress, terminate_active_processes,
+    )
+    from metrics import METRICS
+    from output import OutputHandle
+    from multiplex import SubRequest, run_multiplexed
+    from tracing import traced
 
 # ============================================================================
 # CONFIGURATION
@@ -43,6 +52,10 @@ SPECS_DIR = WORKSPACE / "specs"
 TICKETS_DIR = WORKSPACE / "tickets"
 STATE_FILE = STATE_DIR / "tracer_state.json"
 
+SPEC_JSON = ('{"title": "...", "description": "...", "requirements": [...], "acceptance_criteria": [...], '
+             '"constraints": [...], "out_of_scope": [...]}')
+TASKS_JSON = '[{"name": "Task name", "type": "research|code|test"}]'
+
 
 # ============================================================================
 # ENUMS
@@ -108,13 +121,68 @@ class Ticket:
     iterations: list[dict] = field(default_factory=list)
 
 
+# ============================================================================
+# RESPONSE PARSING
+# ============================================================================
+
+def _parse_json_object(text: str) -> dict:
+    """The outermost {...} in a model answer; ValueError if there is none."""
+    match = re.search(r'\{[\s\S]*\}', text or "")
+    if not match:
+        raise ValueError("no JSON object in output")
+    data = json.loads(match.group())
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    return data
+
+
+def _parse_tasks(text: str) -> list[dict]:
+    """Task list (possibly empty) from a [{"name", "type"}] answer; ValueError if there is none."""
+    match = re.search(r'\[[\s\S]*\]', text or "")
+    if not match:
+        raise ValueError("no JSON array in output")
+    try:
+        return [{"name": t["name"], "type": t.get("type", "code"), "done": False}
+                for t in json.loads(match.group())]
+    except (TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"malformed task list: {e}")
+
+
+def _checked_spec_answer(text: str) -> str:
+    """A multiplexed spec section, if it holds a JSON object; ValueError otherwise."""
+    _parse_json_object(text)
+    return text
+
+
+def _apply_spec_answer(spec: "Spec", output: str):
+    """
+    Fill `spec` from a spec answer. An answer without a JSON object leaves
+    it as is; one whose JSON doesn't parse only retitles it "Untitled".
+    """
+    try:
+        match = re.search(r'\{[\s\S]*\}', output or "")
+        if match:
+            data = json.loads(match.group())
+            spec.title = data.get("title", "Untitled")
+            spec.description = data.get("description", spec.description)
+            spec.requirements = data.get("requirements", [])
+            spec.acceptance_criteria = data.get("acceptance_criteria", [])
+            spec.constraints = data.get("constraints", [])
+            spec.out_of_scope = data.get("out_of_scope", [])
+    except Exception:
+        spec.title = "Untitled"
+
+
 # ============================================================================
 # TRAYCER
 # ============================================================================
 
 class Tracer:
-    def __init__(self, cli: str = "claude"):
+    def __init__(self, cli: str = "claude", multiplex: Optional[bool] = None):
         self.cli = cli
+        # Fold the spec and its task breakdown into one call (ORCHESTRATOR_MULTIPLEX=1).
+        self.multiplex = os.getenv("ORCHESTRATOR_MULTIPLEX") == "1" if multiplex is None else multiplex
+        self._task_drafts: dict[str, list[dict]] = {}
         self.state = load_state(STATE_FILE)
         self.state.mode = "tracer"
         self.specs: dict[str, Spec] = {}
@@ -199,6 +267,8 @@ class Tracer:
     # CLARIFICATION PHASE
     # =========================================================================
 
+    @traced("tracer:clarify", "tracer")
+    @METRICS.timer("phase_duration_seconds", loop="tracer", phase="clarify")
     def clarify(self, request: str) -> Spec:
         """Refine request through clarifying questions."""
         print_phase("CLARIFY", "Refining your request")
@@ -238,6 +308,7 @@ class Tracer:
 
         return spec
 
+    @traced("tracer:clarify:questions", "tracer")
     def _generate_questions(self, request: str) -> list[Clarification]:
         """Generate clarifying questions."""
         request_text = compact_text(request, 2000)
@@ -276,8 +347,9 @@ Only output the JSON.
             Clarification("How will you verify it works?", category="acceptance"),
         ]
 
+    @traced("tracer:clarify:spec", "tracer")
     def _refine_spec(self, spec: Spec) -> Spec:
-        """Refine spec from clarifications."""
+        """Refine spec from clarifications (and, multiplexed, draft its tasks in the same call)."""
         clarifications = "\n".join([
             f"Q: {c.question}\nA: {c.answer or '[skipped]'}"
             for c in spec.clarifications
@@ -285,6 +357,33 @@ Only output the JSON.
         clarifications = compact_text(clarifications, 2000)
         request_text = compact_text(spec.description, 2000)
 
+        if self.multiplex:
+            results = run_multiplexed(
+                self._multiplex_call,
+                f"REQUEST: {request_text}\n\nCLARIFICATIONS:\n{clarifications}",
+                [
+                    SubRequest("spec", f"Create a specification from the request and clarifications. "
+                                       f"Output JSON:\n{SPEC_JSON}",
+                               parse=_checked_spec_answer,
+                               fallback=lambda: self._spec_answer(request_text, clarifications)),
+                    # No fallback: create_ticket asks for the tasks itself.
+                    SubRequest("tasks", f"Break the specification from the [spec] section into tasks. "
+                                        f"Output JSON array:\n{TASKS_JSON}",
+                               parse=_parse_tasks),
+                ],
+                label="tracer:clarify",
+            )
+            answer = results["spec"]
+            if "tasks" in results:
+                self._task_drafts[spec.id] = results["tasks"]
+        else:
+            answer = self._spec_answer(request_text, clarifications)
+
+        _apply_spec_answer(spec, answer)
+        return spec
+
+    def _spec_answer(self, request_text: str, clarifications: str) -> str:
+        """Ask for the spec on its own."""
         prompt = f'''
 Create a specification from this request and clarifications.
 
@@ -294,7 +393,7 @@ REQUEST: {request_text}
         {clarifications}
 
 Output JSON:
-{{"title": "...", "description": "...", "requirements": [...], "acceptance_criteria": [...], "constraints": [...], "out_of_scope": [...]}}
+{SPEC_JSON}
 
 Only output JSON.
 '''
@@ -305,26 +404,24 @@ Only output JSON.
             show_output=False,
             usage_label="tracer:clarify:spec",
         )
+        return output
 
-        try:
-            match = re.search(r'\{[\s\S]*\}', output)
-            if match:
-                data = json.loads(match.group())
-                spec.title = data.get("title", "Untitled")
-                spec.description = data.get("description", spec.description)
-                spec.requirements = data.get("requirements", [])
-                spec.acceptance_criteria = data.get("acceptance_criteria", [])
-                spec.constraints = data.get("constraints", [])
-                spec.out_of_scope = data.get("out_of_scope", [])
-        except:
-            spec.title = "Untitled"
-
-        return spec
+    def _multiplex_call(self, prompt: str) -> str:
+        output, _ = run_cli(
+            self.cli,
+            prompt,
+            timeout=180,
+            show_output=False,
+            usage_label="tracer:clarify:multiplex",
+        )
+        return output
 
     # =========================================================================
     # TICKET CREATION
     # =========================================================================
 
+    @traced("tracer:ticket", "tracer")
+    @METRICS.timer("phase_duration_seconds", loop="tracer", phase="ticket")
     def create_ticket(self, spec: Spec) -> Ticket:
         """Create ticket from spec."""
         print_phase("TICKET", "Creating work ticket")
@@ -337,7 +434,25 @@ Only output JSON.
             status=TicketStatus.REFINED,
         )
 
-        # Generate tasks
+        # Generate tasks (already drafted if the spec came from a multiplexed call)
+        drafted = self._task_drafts.pop(spec.id, None)
+        if drafted is not None:
+            ticket.tasks = drafted
+        else:
+            ticket.tasks = self._generate_tasks(spec)
+
+        self.state.ticket_id = ticket.id
+        save_state(self.state, STATE_FILE)
+        self._save_ticket(ticket)
+
+        print(f"\n  {Colors.GREEN}✓ Ticket created: {ticket.id}{Colors.RESET}")
+        for t in ticket.tasks:
+            print(f"    • {t['name']}")
+
+        return ticket
+
+    def _generate_tasks(self, spec: Spec) -> list[dict]:
+        """Break a spec into tasks; a malformed answer gets the default three, no answer none."""
         spec_context = self._spec_context(spec, ("title", "requirements"), 2000)
         prompt = f'''
 Break this spec into tasks:
@@ -345,7 +460,7 @@ Break this spec into tasks:
 {spec_context}
 
 Output JSON array:
-[{{"name": "Task name", "type": "research|code|test"}}]
+{TASKS_JSON}
 '''
         output, _ = run_cli(
             self.cli,
@@ -355,33 +470,22 @@ Output JSON array:
             usage_label="tracer:ticket:tasks",
         )
 
+        if not re.search(r'\[[\s\S]*\]', output or ""):
+            return []
         try:
-            match = re.search(r'\[[\s\S]*\]', output)
-            if match:
-                tasks = json.loads(match.group())
-                ticket.tasks = [{"name": t["name"], "type": t.get("type", "code"), "done": False}
-                               for t in tasks]
-        except:
-            ticket.tasks = [
+            return _parse_tasks(output)
+        except ValueError:
+            return [
                 {"name": "Research", "type": "research", "done": False},
                 {"name": "Implement", "type": "code", "done": False},
                 {"name": "Test", "type": "test", "done": False},
             ]
 
-        self.state.ticket_id = ticket.id
-        save_state(self.state, STATE_FILE)
-        self._save_ticket(ticket)
-
-        print(f"\n  {Colors.GREEN}✓ Ticket created: {ticket.id}{Colors.RESET}")
-        for t in ticket.tasks:
-            print(f"    • {t['name']}")
-
-        return ticket
-
     # =========================================================================
     # EXECUTION WITH DEVIATION DETECTION
     # =========================================================================
 
+    @traced("tracer:execute", "tracer")
     def execute(self, ticket: Ticket) -> Ticket:
         """Execute ticket with deviation detection."""
         print_phase("EXECUTE", f"Working on {ticket.id}")
@@ -409,6 +513,7 @@ Output JSON array:
 
             if deviations:
                 self.state.deviations_detected += len(deviations)
+                METRICS.inc("tracer_deviations_detected_total", len(deviations))
                 ticket.deviations.extend(deviations)
                 self._save_ticket(ticket)
 
@@ -417,6 +522,7 @@ Output JSON array:
                 # Try correction
                 if self._correct_deviations(spec, deviations):
                     self.state.deviations_corrected += 1
+                    METRICS.inc("tracer_deviations_corrected_total")
                     print(f"  {Colors.GREEN}✓ Corrected{Colors.RESET}")
                 else:
                     ticket.status = TicketStatus.BLOCKED
@@ -444,6 +550,10 @@ Output JSON array:
         save_state(self.state, STATE_FILE)
         return ticket
 
+    def _execution_inputs(self, spec: Spec) -> list[Path]:
+        """What execution-phase answers depend on: workspace sources plus the spec."""
+        return [WORKSPACE, SPECS_DIR / f"{spec.id}.md"]
+
     def _stream_updates(self, label: str):
         """Stream live updates during execution."""
         def _on_line(line: str):
@@ -455,7 +565,9 @@ Output JSON array:
             print(f"  {Colors.GRAY}[{label}]{Colors.RESET} {display}")
         return _on_line
 
-    def _run_implementation(self, spec: Spec, ticket: Ticket) -> str:
+    @traced("tracer:execute:implement", "tracer")
+    @METRICS.timer("phase_duration_seconds", loop="tracer", phase="implement")
+    def _run_implementation(self, spec: Spec, ticket: Ticket) -> "str | OutputHandle":
         """Run implementation."""
         pending = [t for t in ticket.tasks if not t.get("done")]
         if not pending:
@@ -478,8 +590,11 @@ TASK: {task["name"]}
             prompt,
             timeout=600,
             on_line=self._stream_updates("IMPLEMENT"),
+            line_policy="coalesce",
             show_output=False,
             usage_label="tracer:execute:implement",
+            depends_on=self._execution_inputs(spec),
+            as_handle=True,
         )
 
         if code == 0:
@@ -488,7 +603,9 @@ TASK: {task["name"]}
 
         return output
 
-    def _detect_deviations(self, spec: Spec, output: str) -> list[dict]:
+    @traced("tracer:execute:review", "tracer")
+    @METRICS.timer("phase_duration_seconds", loop="tracer", phase="review")
+    def _detect_deviations(self, spec: Spec, output: "str | OutputHandle") -> list[dict]:
         """Detect deviations from spec."""
         if not output or len(output) < 100:
             return []
@@ -511,8 +628,10 @@ Look for: OFF_TOPIC, WRONG_APPROACH, INCOMPLETE, OVER_ENGINEERED, SPEC_VIOLATION
             prompt,
             timeout=120,
             on_line=self._stream_updates("REVIEW"),
+            line_policy="coalesce",
             show_output=False,
             usage_label="tracer:execute:review",
+            depends_on=self._execution_inputs(spec),
         )
 
         try:
@@ -524,6 +643,8 @@ Look for: OFF_TOPIC, WRONG_APPROACH, INCOMPLETE, OVER_ENGINEERED, SPEC_VIOLATION
             pass
         return []
 
+    @traced("tracer:execute:correct", "tracer")
+    @METRICS.timer("phase_duration_seconds", loop="tracer", phase="correct")
     def _correct_deviations(self, spec: Spec, deviations: list[dict]) -> bool:
         """Attempt to correct deviations."""
         corrections = [d.get("correction", "") for d in deviations if d.get("correction")]
@@ -544,11 +665,15 @@ CORRECTIONS: {corrections}
             prompt,
             timeout=600,
             on_line=self._stream_updates("CORRECT"),
+            line_policy="coalesce",
             show_output=False,
             usage_label="tracer:execute:correct",
+            depends_on=self._execution_inputs(spec),
         )
         return code == 0
 
+    @traced("tracer:execute:verify", "tracer")
+    @METRICS.timer("phase_duration_seconds", loop="tracer", phase="verify")
     def _verify_completion(self, spec: Spec) -> bool:
         """Verify acceptance criteria are met."""
         acceptance = compact_text("\n".join(spec.acceptance_criteria), 1500)
@@ -565,8 +690,10 @@ Verify all acceptance criteria are met:
             prompt,
             timeout=300,
             on_line=self._stream_updates("VERIFY"),
+            line_policy="coalesce",
             show_output=False,
             usage_label="tracer:execute:verify",
+            depends_on=self._execution_inputs(spec),
         )
 
         try:
@@ -671,7 +798,7 @@ def main():
 
     tracer = Tracer(cli=args.cli)
 
-    signal.signal(signal.SIGINT, lambda s, f: (print(f"\n{Colors.YELLOW}Interrupted.{Colors.RESET}"), sys.exit(130)))
+    signal.signal(signal.SIGINT, lambda s, f: (print(f"\n{Colors.YELLOW}Interrupted.{Colors.RESET}"), terminate_active_processes(), sys.exit(130)))
 
     if args.command == "start":
         if args.request:
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Run Timelines (Chrome Trace Events)
+
+A minimal span API for seeing where a long RPI iteration or Tracer run
+spends its time. Spans nest by time on a lane per thread (or per asyncio
+task), so `run_parallel` workers show up side by side. Each run is written
+to `state/traces/<timestamp>-<name>-<pid>.json`, which loads directly in
+chrome://tracing or https://ui.perfetto.dev.
+
+Tracing is off unless ORCHESTRATOR_TRACE=1 (or `enable_tracing()`); when
+off, `span()` returns a shared no-op object and `traced` functions run
+after a single flag check.
+"""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+_ENABLED = os.getenv("ORCHESTRATOR_TRACE") == "1"
+_TRACE_DIR: Optional[Path] = None
+_RUN: Optional["_Trace"] = None
+_RUN_LOCK = threading.Lock()
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "cat", "args", "start", "lane")
+
+    def __init__(self, trace: "_Trace", name: str, cat: str, args: dict):
+        self.trace = trace
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.lane = self.trace.lane()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.trace.complete(self.name, self.cat, self.start, end, self.lane, self.args)
+        return False
+
+    def set(self, **args):
+        """Attach arguments (shown in the trace viewer's detail pane)."""
+        self.args.update(args)
+
+
+class _Trace:
+    def __init__(self, name: str, directory: Path):
+        self.name = name
+        self.directory = directory
+        self.pid = os.getpid()
+        self.t0 = time.perf_counter_ns()
+        self.started = datetime.now()
+        self.events: list[dict] = []
+        self._lanes: dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self.path: Optional[Path] = None
+
+    def lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            key, label = ("task", id(task)), task.get_name()
+        else:
+            thread = threading.current_thread()
+            key, label = ("thread", thread.ident), thread.name
+        tid = self._lanes.get(key)
+        if tid is None:
+            with self._lock:
+                tid = self._lanes.get(key)
+                if tid is None:
+                    tid = self._lanes[key] = len(self._lanes) + 1
+                    self.events.append({"ph": "M", "name": "thread_name", "pid": self.pid, "tid": tid,
+                                        "args": {"name": label}})
+        return tid
+
+    def complete(self, name: str, cat: str, start: int, end: int, lane: int, args: dict):
+        event = {"ph": "X", "name": name, "cat": cat, "pid": self.pid, "tid": lane,
+                 "ts": (start - self.t0) / 1000, "dur": (end - start) / 1000}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def instant(self, name: str, cat: str, args: dict):
+        event = {"ph": "i", "s": "t", "name": name, "cat": cat, "pid": self.pid, "tid": self.lane(),
+                 "ts": (time.perf_counter_ns() - self.t0) / 1000}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def write(self) -> Optional[Path]:
+        if not self.events:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if self.path is None:
+            stamp = self.started.strftime("%Y%m%d-%H%M%S")
+            safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in self.name)
+            self.path = self.directory / f"{stamp}-{safe}-{self.pid}.json"
+        meta = [{"ph": "M", "name": "process_name", "pid": self.pid, "args": {"name": self.name}}]
+        data = {
+            "traceEvents": meta + list(self.events),
+            "displayTimeUnit": "ms",
+            "otherData": {"run": self.name, "started": self.started.isoformat()},
+        }
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, self.path)
+        return self.path
+
+
+def enable_tracing(directory: Optional[Path] = None, enabled: bool = True):
+    """Turn tracing on or off for this process; `directory` overrides state/traces/."""
+    global _ENABLED, _TRACE_DIR
+    _ENABLED = enabled
+    if directory is not None:
+        _TRACE_DIR = Path(directory)
+
+
+def tracing_enabled() -> bool:
+    return _ENABLED
+
+
+def _trace_dir() -> Path:
+    if _TRACE_DIR is not None:
+        return _TRACE_DIR
+    try:
+        from .utils import STATE_DIR
+    except ImportError:
+        from utils import STATE_DIR
+    return STATE_DIR / "traces"
+
+
+def _current() -> _Trace:
+    # Spans outside any trace_run() (library use) go to one per-process trace
+    # written at exit.
+    global _RUN
+    if _RUN is None:
+        with _RUN_LOCK:
+            if _RUN is None:
+                _RUN = _Trace("process", _trace_dir())
+    return _RUN
+
+
+def span(name: str, cat: str = "orch", **args):
+    """Context manager timing a block as a span; no-op unless tracing is on."""
+    if not _ENABLED:
+        return _NOOP
+    return _Span(_current(), name, cat, args)
+
+
+def instant(name: str, cat: str = "orch", **args):
+    """Mark a point in time (e.g. a cache hit) on the current lane."""
+    if _ENABLED:
+        _current().instant(name, cat, {k: v for k, v in args.items() if v is not None})
+
+
+def traced(name: str, cat: str = "orch"):
+    """Decorator form of span() for functions and methods."""
+    def decorate(fn: Callable):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*a, **kw):
+                if not _ENABLED:
+                    return await fn(*a, **kw)
+                with _Span(_current(), name, cat, {}):
+                    return await fn(*a, **kw)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            if not _ENABLED:
+                return fn(*a, **kw)
+            with _Span(_current(), name, cat, {}):
+                return fn(*a, **kw)
+        return wrapper
+    return decorate
+
+
+class trace_run:
+    """
+    Scope one run (a CLI command, an RPI loop) to its own trace file.
+
+    Nested trace_run blocks join the outer run; the file is written when the
+    outermost block exits.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._owner = False
+        self._span = _NOOP
+
+    def __enter__(self):
+        global _RUN
+        if _ENABLED:
+            with _RUN_LOCK:
+                if _RUN is None or not _RUN.events:
+                    _RUN = _Trace(self.name, _trace_dir())
+                    self._owner = True
+            self._span = _Span(_RUN, self.name, "run", {})
+            self._span.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _RUN
+        self._span.__exit__(exc_type, exc, tb)
+        if self._owner:
+            with _RUN_LOCK:
+                trace, _RUN = _RUN, None
+            path = trace.write() if trace else None
+            if path:
+                print(f"  [trace] {path}")
+        return False
+
+
+def _flush_at_exit():
+    if _RUN is not None:
+        try:
+            _RUN.write()
+        except OSError:
+            pass
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Buffered Usage Log Writer
+
+Usage records are queued by the calling thread and written by one
+background thread in batches, so CLI calls never wait on log I/O and lines
+from concurrent `run_parallel` workers never interleave. A batch is flushed
+once it reaches `flush_records` records or `flush_interval` seconds, and on
+exit.
+
+The active log is rotated when it grows past `max_bytes` or, with
+`rotate_daily`, when its day ends. Rotated segments are named
+`usage-<YYYYmmdd-HHMMSS>.jsonl` next to it and optionally gzipped. An flock
+on a sibling `.lock` file keeps rotation safe across processes sharing the
+workspace.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+
+class UsageLogWriter:
+    """Background, batching JSON-lines writer with size/day rotation."""
+
+    def __init__(
+        self,
+        path: Path,
+        flush_records: int = 64,
+        flush_interval: float = 1.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        rotate_daily: bool = True,
+        compress: bool = False,
+    ):
+        self.path = Path(path)
+        self.flush_records = max(1, flush_records)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    def write(self, record: dict):
+        """Queue a record; returns immediately."""
+        if self._closed:
+            self._write_batch([json.dumps(record) + "\n"])
+            return
+        self._ensure_thread()
+        self._queue.put(record)
+
+    def flush(self, timeout: Optional[float] = 10.0):
+        """Block until everything queued so far is on disk."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """Flush and stop the writer thread."""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10.0)
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="usage-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        pending: list[str] = []
+        waiters: list[threading.Event] = []
+        first_at = 0.0
+        stop = False
+        while not stop:
+            timeout = None
+            if pending:
+                timeout = max(0.0, first_at + self.flush_interval - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ...
+            if item is None:
+                stop = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not ...:
+                if not pending:
+                    first_at = time.monotonic()
+                try:
+                    pending.append(json.dumps(item) + "\n")
+                except (TypeError, ValueError) as e:
+                    self._error(e)
+
+            due = pending and (
+                len(pending) >= self.flush_records
+                or time.monotonic() - first_at >= self.flush_interval
+            )
+            if (due or waiters or stop) and pending:
+                self._write_batch(pending)
+                pending = []
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+
+    def _write_batch(self, lines: list[str]):
+        data = "".join(lines).encode("utf-8")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._lock_file():
+                rotated = self._maybe_rotate(len(data))
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+            if rotated and self.compress:
+                self._compress(rotated)
+        except Exception as e:
+            self._error(e)
+
+    def _maybe_rotate(self, incoming: int) -> Optional[Path]:
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        if st.st_size == 0:
+            return None
+        too_big = self.max_bytes and st.st_size + incoming > self.max_bytes
+        stale = self.rotate_daily and date.fromtimestamp(st.st_mtime) != date.today()
+        if not (too_big or stale):
+            return None
+        stamp = datetime.fromtimestamp(st.st_mtime).strftime("%Y%m%d-%H%M%S")
+        target = self.path.with_name(f"{self.path.stem}-{stamp}{self.path.suffix}")
+        n = 1
+        while target.exists() or target.with_name(target.name + ".gz").exists():
+            target = self.path.with_name(f"{self.path.stem}-{stamp}.{n}{self.path.suffix}")
+            n += 1
+        os.replace(self.path, target)
+        return target
+
+    def _compress(self, path: Path):
+        gz_path = path.with_name(path.name + ".gz")
+        tmp = gz_path.with_name(f".{gz_path.name}.tmp")
+        try:
+            with path.open("rb") as src, gzip.open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp, gz_path)
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _lock_file(self):
+        return _FileLock(self.path.with_name(f".{self.path.name}.lock"))
+
+    def _error(self, exc: Exception):
+        self.errors += 1
+        self.last_error = str(exc)
+        print(f"  [usage] log write failed: {exc}")
+
+
+class _FileLock:
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return self
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+def usage_log_files(path: Path) -> list[Path]:
+    """Rotated segments (oldest first) followed by the active log, if present."""
+    path = Path(path)
+    pattern = re.compile(rf"{re.escape(path.stem)}-(\d{{8}}-\d{{6}})(?:\.(\d+))?{re.escape(path.suffix)}(?:\.gz)?$")
+    rotated = []
+    for candidate in path.parent.glob(f"{path.stem}-*"):
+        match = pattern.match(candidate.name)
+        if match:
+            rotated.append(((match.group(1), int(match.group(2) or 0)), candidate))
+    rotated = [p for _, p in sorted(rotated)]
+    if path.exists():
+        rotated.append(path)
+    return rotated
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Usage Log Analytics
+
+Streams `state/usage.jsonl` and its rotated segments into a fixed-size
+summary: totals, per label/model/cli counts and token sums, p50/p95/p99 of
+`elapsed_sec` and `total_tokens`, time spent queued for rate limits and
+host slots (`queue_wait_sec`, `host_slot_wait_sec`), cache hit ratios (`<label>:cache`
+records against their base label) and hourly throughput. A call counts as
+failed when it was killed (`kill_reason`) or exited non-zero (`exit_code`).
+
+Percentiles come from log-bucketed histograms (about 2% relative error), so
+memory depends on the number of distinct labels, not on the log length;
+hourly buckets are kept for the last HOURS_RETAINED hours seen.
+The summary is saved to a sidecar index together with how far each segment
+was read. Segments are identified by a hash of their first line, which
+survives rotation and gzip, so a repeated report only parses bytes appended
+since the last one.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+from typing import Optional
+
+INDEX_VERSION = 1
+READ_BLOCK = 1024 * 1024
+DIMENSIONS = ("label", "model", "cli")
+HOURS_RETAINED = 24 * 90
+
+_GROWTH = 1.02
+_LOG_GROWTH = math.log(_GROWTH)
+
+
+class Histogram:
+    """Log-bucketed histogram of non-negative values with quantile estimates."""
+
+    def __init__(self):
+        self.zero = 0
+        self.buckets: dict[int, int] = {}
+
+    def add(self, value: float):
+        if value <= 0:
+            self.zero += 1
+            return
+        index = math.floor(math.log(value) / _LOG_GROWTH)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other: "Histogram"):
+        self.zero += other.zero
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def quantile(self, q: float) -> float:
+        total = self.zero + sum(self.buckets.values())
+        if total == 0:
+            return 0.0
+        rank = q * (total - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # Geometric midpoint of the bucket.
+                return _GROWTH ** (index + 0.5)
+        return _GROWTH ** (max(self.buckets) + 0.5)
+
+    def to_dict(self) -> dict:
+        return {"zero": self.zero, "buckets": {str(k): v for k, v in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Histogram":
+        hist = cls()
+        hist.zero = data.get("zero", 0)
+        hist.buckets = {int(k): v for k, v in data.get("buckets", {}).items()}
+        return hist
+
+
+class GroupStats:
+    """Counters and latency/token histograms for one label, model or cli."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.in_tokens = 0
+        self.out_tokens = 0
+        self.elapsed = 0.0
+        self.queue_wait = 0.0
+        self.elapsed_hist = Histogram()
+        self.tokens_hist = Histogram()
+
+    def merge(self, other: "GroupStats"):
+        self.calls += other.calls
+        self.failures += other.failures
+        self.in_tokens += other.in_tokens
+        self.out_tokens += other.out_tokens
+        self.elapsed += other.elapsed
+        self.queue_wait += other.queue_wait
+        self.elapsed_hist.merge(other.elapsed_hist)
+        self.tokens_hist.merge(other.tokens_hist)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.in_tokens + self.out_tokens
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "in_tokens": self.in_tokens,
+            "out_tokens": self.out_tokens,
+            "elapsed": self.elapsed,
+            "queue_wait": self.queue_wait,
+            "elapsed_hist": self.elapsed_hist.to_dict(),
+            "tokens_hist": self.tokens_hist.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GroupStats":
+        stats = cls()
+        stats.calls = data.get("calls", 0)
+        stats.failures = data.get("failures", 0)
+        stats.in_tokens = data.get("in_tokens", 0)
+        stats.out_tokens = data.get("out_tokens", 0)
+        stats.elapsed = data.get("elapsed", 0.0)
+        stats.queue_wait = data.get("queue_wait", 0.0)
+        stats.elapsed_hist = Histogram.from_dict(data.get("elapsed_hist", {}))
+        stats.tokens_hist = Histogram.from_dict(data.get("tokens_hist", {}))
+        return stats
+
+
+class UsageReport:
+    """Incrementally maintained summary of the usage log."""
+
+    def __init__(self, keep_hours: int = HOURS_RETAINED):
+        self.keep_hours = keep_hours
+        self.totals = GroupStats()
+        self.groups: dict[str, dict[str, GroupStats]] = {dim: {} for dim in DIMENSIONS}
+        self.cache: dict[str, list[int]] = {}
+        self.hours: dict[str, list[float]] = {}
+        self.segments: dict[str, dict] = {}
+        self.bad_lines = 0
+        self.scanned_bytes = 0
+
+    def add(self, record: dict):
+        """Fold one usage record into the summary."""
+        acc: dict[tuple, GroupStats] = {}
+        self._accumulate(acc, record)
+        self._fold(acc)
+
+    def _accumulate(self, acc: dict, record: dict):
+        # Records are first summed per (label, model, cli) triple; the much
+        # smaller set of triples is merged into each breakdown in _fold.
+        in_tokens = int(record.get("in_tokens") or 0)
+        out_tokens = int(record.get("out_tokens") or 0)
+        elapsed = float(record.get("elapsed_sec") or 0.0)
+        key = (str(record.get("label") or "cli"), str(record.get("model")), str(record.get("cli")))
+        stats = acc.get(key)
+        if stats is None:
+            stats = acc[key] = GroupStats()
+        stats.calls += 1
+        if record.get("kill_reason") or record.get("exit_code") not in (None, 0):
+            stats.failures += 1
+        stats.in_tokens += in_tokens
+        stats.out_tokens += out_tokens
+        stats.elapsed += elapsed
+        stats.queue_wait += float(record.get("queue_wait_sec") or 0.0)
+        stats.queue_wait += float(record.get("host_slot_wait_sec") or 0.0)
+        stats.elapsed_hist.add(elapsed)
+        stats.tokens_hist.add(in_tokens + out_tokens)
+
+        hour = str(record.get("ts", ""))[:13]
+        if hour:
+            bucket = self.hours.get(hour)
+            if bucket is None:
+                bucket = self.hours[hour] = [0, 0, 0.0]
+            bucket[0] += 1
+            bucket[1] += in_tokens + out_tokens
+            bucket[2] += elapsed
+
+    def _fold(self, acc: dict):
+        for (label, model, cli), stats in acc.items():
+            self.totals.merge(stats)
+            for dim, key in zip(DIMENSIONS, (label, model, cli)):
+                group = self.groups[dim].get(key)
+                if group is None:
+                    group = self.groups[dim][key] = GroupStats()
+                group.merge(stats)
+            if label.endswith(":cache"):
+                self.cache.setdefault(label[:-len(":cache")], [0, 0])[0] += stats.calls
+            else:
+                self.cache.setdefault(label, [0, 0])[1] += stats.calls
+        acc.clear()
+
+    def scan(self, files: list[Path], active: Optional[Path] = None):
+        """Parse the unread part of each segment; `active` may still grow."""
+        for path in files:
+            fingerprint = _fingerprint(path)
+            if fingerprint is None:
+                continue
+            state = self.segments.setdefault(fingerprint, {"offset": 0, "complete": False})
+            if state["complete"]:
+                continue
+            state["offset"] = self._scan_file(path, state["offset"])
+            state["name"] = path.name
+            if active is None or path != active:
+                state["complete"] = True
+        self._prune_hours()
+
+    def _prune_hours(self):
+        if self.keep_hours and len(self.hours) > self.keep_hours:
+            for hour in sorted(self.hours)[:-self.keep_hours]:
+                del self.hours[hour]
+
+    def _scan_file(self, path: Path, offset: int) -> int:
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rb") as f:
+            if offset:
+                if path.suffix == ".gz":
+                    _skip(f, offset)
+                else:
+                    f.seek(offset)
+            decode = json.JSONDecoder().decode
+            acc: dict[tuple, GroupStats] = {}
+            pending = b""
+            while True:
+                block = f.read(READ_BLOCK)
+                if not block:
+                    break
+                data = pending + block
+                end = data.rfind(b"\n") + 1
+                pending = data[end:]
+                for line in data[:end].decode("utf-8", errors="replace").splitlines():
+                    if not line:
+                        continue
+                    try:
+                        self._accumulate(acc, decode(line))
+                    except (ValueError, TypeError, AttributeError):
+                        self.bad_lines += 1
+                offset += end
+                self.scanned_bytes += end
+            self._fold(acc)
+        return offset
+
+    def to_dict(self) -> dict:
+        return {
+            "version": INDEX_VERSION,
+            "totals": self.totals.to_dict(),
+            "groups": {dim: {k: v.to_dict() for k, v in groups.items()} for dim, groups in self.groups.items()},
+            "cache": self.cache,
+            "hours": self.hours,
+            "segments": self.segments,
+            "bad_lines": self.bad_lines,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, keep_hours: int = HOURS_RETAINED) -> "UsageReport":
+        report = cls(keep_hours)
+        report.totals = GroupStats.from_dict(data.get("totals", {}))
+        for dim in DIMENSIONS:
+            report.groups[dim] = {
+                k: GroupStats.from_dict(v) for k, v in data.get("groups", {}).get(dim, {}).items()
+            }
+        report.cache = data.get("cache", {})
+        report.hours = data.get("hours", {})
+        report.segments = data.get("segments", {})
+        report.bad_lines = data.get("bad_lines", 0)
+        return report
+
+    def throughput(self, bucket: str = "hour", last: int = 24) -> list[tuple[str, int, int, float]]:
+        """(bucket, calls, tokens, cli_seconds) for the most recent buckets."""
+        width = 10 if bucket == "day" else 13
+        merged: dict[str, list[float]] = {}
+        for hour, (calls, tokens, elapsed) in self.hours.items():
+            row = merged.setdefault(hour[:width], [0, 0, 0.0])
+            row[0] += calls
+            row[1] += tokens
+            row[2] += elapsed
+        keys = sorted(merged)[-last:] if last else sorted(merged)
+        return [(k, int(merged[k][0]), int(merged[k][1]), merged[k][2]) for k in keys]
+
+
+def build_report(files: list[Path], active: Optional[Path], index_path: Optional[Path],
+                 rescan: bool = False, keep_hours: int = HOURS_RETAINED) -> UsageReport:
+    """
+    Load the saved summary, fold in anything new, and save it back.
+
+    Args:
+        files: Log segments, oldest first (see usage_log_files)
+        active: The segment still being appended to
+        index_path: Sidecar index location (None disables it)
+        rescan: Ignore the saved summary and read everything again
+        keep_hours: Hourly throughput buckets to keep (0 = all)
+    """
+    report = None
+    if index_path is not None and not rescan:
+        try:
+            data = json.loads(Path(index_path).read_text(encoding="utf-8"))
+            if data.get("version") == INDEX_VERSION:
+                report = UsageReport.from_dict(data, keep_hours)
+        except (OSError, ValueError):
+            report = None
+    if report is None:
+        report = UsageReport(keep_hours)
+
+    report.scan(files, active)
+
+    if index_path is not None:
+        index_path = Path(index_path)
+        tmp = index_path.with_name(f".{index_path.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(report.to_dict()), encoding="utf-8")
+            os.replace(tmp, index_path)
+        except OSError:
+            pass
+    return report
+
+
+def _fingerprint(path: Path) -> Optional[str]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    try:
+        with opener(path, "rb") as f:
+            first = f.readline()
+    except (OSError, EOFError):
+        return None
+    if not first.endswith(b"\n"):
+        return None
+    return hashlib.sha1(first).hexdigest()
+
+
+def _skip(f, count: int):
+    while count > 0:
+        chunk = f.read(min(count, READ_BLOCK))
+        if not chunk:
+            break
+        count -= len(chunk)
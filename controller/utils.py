@@ -11,17 +11,69 @@ Consolidates common code used across all controllers:
 from __future__ import annotations
 
 import os
+import asyncio
+import atexit
+import codecs
+import contextvars
+import functools
+import selectors
+import signal
+import socket
 import subprocess
+import sys
 import json
+import queue
 import re
 import time
 import hashlib
+import http.client
+import tempfile
+import threading
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager, contextmanager
 from dataclasses import dataclass, field
-from typing import Optional, Callable
+from typing import Optional, Callable, Iterator
 from enum import Enum
 
+try:
+    from .cache import (
+        make_cache, snapshot_paths, snapshot_matches, capture_effects, apply_effects,
+        CallWindow, FINGERPRINT_IGNORE,
+    )
+    from .neardup import NearDupIndex
+    from .pool import WorkerPool
+    from .singleflight import Flight, FlightGroup
+    from .usagelog import UsageLogWriter
+    from .streamjson import StreamParser, make_parser, split_lines
+    from .metrics import METRICS, CallTimings
+    from .promexport import TextfileExporter
+    from .output import OutputHandle, as_text, sweep_stale
+    from .linequeue import AsyncLineQueue, LineQueue, LINE_POLICIES
+    from .httpapi import HTTPBackend, HTTPBackendError, DEFAULT_POOL_SIZE as DEFAULT_HTTP_POOL_SIZE
+    from .ratelimit import Lease, RateLimiter, parse_limits
+    from .hostslots import HostSemaphore, parse_slot_counts
+    from .tracing import span, instant
+except ImportError:
+    from cache import (
+        make_cache, snapshot_paths, snapshot_matches, capture_effects, apply_effects,
+        CallWindow, FINGERPRINT_IGNORE,
+    )
+    from neardup import NearDupIndex
+    from pool import WorkerPool
+    from singleflight import Flight, FlightGroup
+    from usagelog import UsageLogWriter
+    from streamjson import StreamParser, make_parser, split_lines
+    from metrics import METRICS, CallTimings
+    from promexport import TextfileExporter
+    from output import OutputHandle, as_text, sweep_stale
+    from linequeue import AsyncLineQueue, LineQueue, LINE_POLICIES
+    from httpapi import HTTPBackend, HTTPBackendError, DEFAULT_POOL_SIZE as DEFAULT_HTTP_POOL_SIZE
+    from ratelimit import Lease, RateLimiter, parse_limits
+    from hostslots import HostSemaphore, parse_slot_counts
+    from tracing import span, instant
+
 
 # ============================================================================
 # PATHS
@@ -59,6 +111,10 @@ AGENTS_DIR = CLAUDE_DIR / "agents"
 USAGE_LOG = STATE_DIR / "usage.jsonl"
 CACHE_DIR = STATE_DIR / "cache"
 
+# Directories the loops write their own artifacts to. Directory fingerprints
+# skip them; phases list the specific artifacts they read instead.
+ARTIFACT_DIRS = ("state", "research", "plans", "submission", "grading", "specs", "tickets")
+
 
 # ============================================================================
 # COLORS
@@ -88,7 +144,17 @@ CLI_CONFIGS = {
         "cmd": "claude",
         "args": ["--print", "--dangerously-skip-permissions"],
         "prompt_flag": "-p",
+        # Reads the prompt from stdin when no prompt argument is given,
+        # which is what lets pre-warmed workers wait for one.
+        "stdin_prompt": True,
+        # JSON event stream with real token usage (ORCHESTRATOR_STRUCTURED_OUTPUT=1).
+        "stream_args": ["--output-format", "stream-json", "--verbose"],
+        "stream_format": "claude-stream-json",
     },
+    # "prompt_transport" picks how the prompt reaches the CLI: "argv" (after
+    # prompt_flag), "stdin" (needs stdin_prompt), "file" (a temp file under
+    # state/prompts/ named in the argument) or "auto" (the default: argv
+    # unless the prompt is too big for one argument).
     "copilot": {
         "cmd": "copilot",
         "args": ["--yolo"],
@@ -97,7 +163,25 @@ CLI_CONFIGS = {
         "cheap_model": "gpt-5.1-codex-mini",
         "prompt_flag": "--prompt",
     },
+    # "backend" picks how an entry runs a call (see BACKENDS): "process"
+    # (the default) spawns the CLI above; "http" streams from an API
+    # endpoint over pooled keep-alive connections. That skips the process
+    # start, but the model gets no tools and sees only the prompt.
+    "api": {
+        "backend": "http",
+        "url": os.getenv("ORCHESTRATOR_API_URL", "https://api.anthropic.com"),
+        # "anthropic" (/v1/messages) or "openai" (/chat/completions under the URL)
+        "api_format": os.getenv("ORCHESTRATOR_API_FORMAT", "anthropic"),
+        "api_key_env": "ANTHROPIC_API_KEY",
+        "model": os.getenv("ORCHESTRATOR_API_MODEL", "claude-sonnet-4-5"),
+        "max_tokens": 8192,
+    },
 }
+# Any entry may also carry "rate_limits": {"rpm": ..., "tpm": ...,
+# "max_concurrent": ...}, applied per model, with per-model overrides under
+# "models": {name: {...}}. ORCHESTRATOR_RATE_LIMITS overrides both; see
+# _rate_limits. "host_slots": N caps its calls across every orchestrator
+# process on the host; see _host_slot_count.
 
 DEFAULT_CHEAP_LABELS = (
     "rpi:research",
@@ -122,96 +206,1675 @@ def run_cli(
     show_output: bool = True,
     usage_label: Optional[str] = None,
     cache_key: Optional[str] = None,
+    stall_timeout: Optional[int] = None,
+    depends_on: Optional[list] = None,
+    as_handle: bool = False,
+    line_policy: Optional[str] = None,
 ) -> tuple[str, int]:
     """
     Execute CLI with streaming output.
 
     Args:
-        cli: CLI name ("claude" or "copilot")
+        cli: CLI_CONFIGS entry ("claude", "copilot" or "api"); ORCHESTRATOR_API_ROUTE
+            may send the label to another entry
         prompt: Prompt to send
-        timeout: Timeout in seconds
+        timeout: Timeout in seconds (wall clock, enforced even mid-line)
         workspace: Working directory
         on_line: Callback for each output line
         show_output: Whether to print output lines
         usage_label: Label for usage tracking output/logs
         cache_key: Optional cache key; if provided, caches output for reuse
+        stall_timeout: Kill the CLI after this many seconds without output
+            (default: ORCHESTRATOR_STALL_TIMEOUT, 0 disables)
+        depends_on: Workspace files/directories the answer depends on; the
+            cached entry is invalidated once any of them changes
+        as_handle: Return the output as an OutputHandle (bounded memory,
+            spilled to state/outputs/ when large) instead of a string
+        line_policy: What to do when on_line falls behind: "block", "drop"
+            or "coalesce" (default: ORCHESTRATOR_LINE_POLICY, else "block");
+            see linequeue.py
 
     Returns:
         Tuple of (output_text, return_code)
     """
+    usage_label = usage_label or "cli"
+    cli = _route_cli(cli, usage_label)
     config = CLI_CONFIGS.get(cli)
     if not config:
-        return f"[ERROR] Unknown CLI: {cli}", -1
+        return _as_output(f"[ERROR] Unknown CLI: {cli}", -1, as_handle)
+    backend = _backend(config)
+    if not backend:
+        return _as_output(f"[ERROR] Unknown backend for CLI {cli}: {config.get('backend')}", -1, as_handle)
+
+    with span(usage_label, "cli", cli=cli) as sp:
+        model = _select_model(config, usage_label)
+        cache_key = cache_key or _default_cache_key(prompt, model, usage_label)
+        stall_timeout = _stall_timeout(stall_timeout)
+
+        cache_mode = _cache_mode(usage_label)
+        cached = _cached_output(cache_key, usage_label, cli, model, prompt, workspace, cache_mode)
+        if cached is not None:
+            sp.set(cache="hit")
+            return _as_output(cached, 0, as_handle)
+        if cache_mode != "off":
+            METRICS.inc("cli_cache_misses_total", label=usage_label)
+        flight_key = _flight_key(cli, workspace, cache_key, cache_mode)
+        if flight_key:
+            flight, leader = _FLIGHTS.join(flight_key)
+            if not leader:
+                sp.set(coalesced=True)
+                return _as_output(*_follow_flight(flight, usage_label, cli, model, prompt, timeout, on_line,
+                                                  line_policy),
+                                  as_handle)
+        cache_fields = _cache_inputs(depends_on, workspace, cache_mode)
+
+        result = ("[ERROR] interrupted", -1)
+        try:
+            with _rate_limited(cli, config, model, prompt, usage_label), _host_slot(cli, config, usage_label), \
+                    _workspace_call(workspace, cache_fields) as cache_fields:
+                result = backend[0](cli, config, model, prompt, timeout, workspace, on_line, show_output,
+                                    usage_label, cache_key, stall_timeout, cache_fields,
+                                    flight.publish if flight_key else None, line_policy)
+            return _as_output(*result, as_handle)
+        finally:
+            if flight_key:
+                _FLIGHTS.finish(flight_key, flight, result, share=_shared_result)
+
+
+def _execute_cli(cli: str, config: dict, model: Optional[str], prompt: str, timeout: int, workspace: Path,
+                 on_line: Optional[Callable[[str], None]], show_output: bool, usage_label: str,
+                 cache_key: str, stall_timeout: float, cache_fields: Optional[dict],
+                 publish: Optional[Callable[[str], None]], line_policy: Optional[str] = None) -> tuple[str, int]:
+    """Spawn (or take a pooled) CLI process and stream its output for run_cli."""
+    pool = _pool_for(cli, config, model, workspace, usage_label)
+
+    parser = _stream_parser(config, _new_output())
+    timings = CallTimings()
+    start_time = time.time()
+    prompt_tokens = _estimate_tokens(prompt)
+    stdin_data = None
+    pool_result = None
+    delivery = _NO_DELIVERY
 
-    usage_label = usage_label or "cli"
-    model = _select_model(config, usage_label)
-    cache_key = cache_key or _default_cache_key(prompt, model, usage_label)
+    try:
+        if pool:
+            process, warm = pool.acquire()
+            stdin_data = prompt.encode("utf-8")
+            pool_result = "hit" if warm else "miss"
+        else:
+            delivery = _prepare_prompt(config, prompt)
+            stdin_data = delivery.stdin_data
+            process = subprocess.Popen(
+                _build_command(config, model, delivery.argv_prompt, delivery.path),
+                cwd=str(workspace),
+                stdin=subprocess.PIPE if stdin_data is not None else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+    except FileNotFoundError:
+        delivery.cleanup()
+        return f"[ERROR] CLI '{cli}' not found", -1
+    except Exception as e:
+        delivery.cleanup()
+        return f"[ERROR] {e}", -1
+    timings.mark_spawned()
 
-    cached = _load_cache(cache_key)
-    if cached is not None:
-        _log_usage(f"{usage_label}:cache", cli, model, _estimate_tokens(prompt), _estimate_tokens(cached), 0.0)
-        print_usage(f"{usage_label}:cache", model, _estimate_tokens(prompt), _estimate_tokens(cached))
-        return cached, 0
+    lines_out = _line_queue(on_line, line_policy, usage_label)
+    _on_text = _output_sink(parser, lines_out.put if lines_out else _line_consumer(on_line, show_output), publish)
 
-    cmd = [config["cmd"]] + config["args"]
-    if "model_flag" in config and model:
-        cmd.extend([config["model_flag"], model])
-    cmd.extend([config["prompt_flag"], prompt])
+    _ACTIVE_PROCESSES.add(process)
+    try:
+        kill_reason = _read_process_output(
+            process,
+            deadline=time.monotonic() + timeout,
+            stall_timeout=stall_timeout,
+            on_text=_on_text,
+            stdin_data=stdin_data,
+            timings=timings,
+        )
+        if kill_reason:
+            _kill_process_group(process)
+            _observe_call(usage_label, time.time() - start_time, timings, kill_reason)
+            return _killed_result(kill_reason, usage_label, cli, model, prompt_tokens,
+                                  time.time() - start_time, stall_timeout, pool=pool_result,
+                                  **timings.to_fields())
+
+        output = parser.output
+        cache_fields = _cache_effects(cache_fields, workspace)
+        _observe_call(usage_label, time.time() - start_time, timings, exit_code=process.returncode)
+        _record_output(cache_key, usage_label, cli, model, prompt, output, time.time() - start_time,
+                       cache_fields, reported=parser.usage(), pool=pool_result, exit_code=process.returncode,
+                       **timings.to_fields())
+        return output, process.returncode
+
+    except Exception as e:
+        _kill_process_group(process)
+        return f"[ERROR] {e}", -1
+    except BaseException:
+        _kill_process_group(process)
+        raise
+    finally:
+        _ACTIVE_PROCESSES.discard(process)
+        process.stdout.close()
+        if process.stdin:
+            process.stdin.close()
+        delivery.cleanup()
+        _close_line_queue(lines_out, usage_label)
+
+
+async def arun_cli(
+    cli: str,
+    prompt: str,
+    timeout: int = 600,
+    workspace: Path = WORKSPACE,
+    on_line: Optional[Callable[[str], None]] = None,
+    show_output: bool = True,
+    usage_label: Optional[str] = None,
+    cache_key: Optional[str] = None,
+    stall_timeout: Optional[int] = None,
+    depends_on: Optional[list] = None,
+    as_handle: bool = False,
+    line_policy: Optional[str] = None,
+) -> tuple[str, int]:
+    """
+    Async counterpart of run_cli built on asyncio subprocesses.
+
+    Shares the cache, usage logging, deadlines, on_line semantics and
+    line_policy of run_cli, but holds no OS thread while waiting, so a
+    single event loop can drive many concurrent CLI sessions. on_line runs
+    on the event loop.
 
-    output_lines = []
+    Returns:
+        Tuple of (output_text, return_code)
+    """
+    usage_label = usage_label or "cli"
+    cli = _route_cli(cli, usage_label)
+    config = CLI_CONFIGS.get(cli)
+    if not config:
+        return _as_output(f"[ERROR] Unknown CLI: {cli}", -1, as_handle)
+    backend = _backend(config)
+    if not backend:
+        return _as_output(f"[ERROR] Unknown backend for CLI {cli}: {config.get('backend')}", -1, as_handle)
+
+    with span(usage_label, "cli", cli=cli) as sp:
+        model = _select_model(config, usage_label)
+        cache_key = cache_key or _default_cache_key(prompt, model, usage_label)
+        stall_timeout = _stall_timeout(stall_timeout)
+
+        cache_mode = _cache_mode(usage_label)
+        cached = _cached_output(cache_key, usage_label, cli, model, prompt, workspace, cache_mode)
+        if cached is not None:
+            sp.set(cache="hit")
+            return _as_output(cached, 0, as_handle)
+        if cache_mode != "off":
+            METRICS.inc("cli_cache_misses_total", label=usage_label)
+        flight_key = _flight_key(cli, workspace, cache_key, cache_mode)
+        if flight_key:
+            flight, leader = _FLIGHTS.join(flight_key)
+            if not leader:
+                sp.set(coalesced=True)
+                return _as_output(*await _afollow_flight(flight, usage_label, cli, model, prompt, timeout,
+                                                         on_line, line_policy),
+                                  as_handle)
+        cache_fields = _cache_inputs(depends_on, workspace, cache_mode)
+
+        result = ("[ERROR] interrupted", -1)
+        try:
+            async with _arate_limited(cli, config, model, prompt, usage_label), \
+                    _ahost_slot(cli, config, usage_label):
+                with _workspace_call(workspace, cache_fields) as cache_fields:
+                    result = await backend[1](cli, config, model, prompt, timeout, workspace, on_line,
+                                              show_output, usage_label, cache_key, stall_timeout, cache_fields,
+                                              flight.publish if flight_key else None, line_policy)
+            return _as_output(*result, as_handle)
+        finally:
+            if flight_key:
+                _FLIGHTS.finish(flight_key, flight, result, share=_shared_result)
+
+
+async def _aexecute_cli(cli: str, config: dict, model: Optional[str], prompt: str, timeout: int,
+                        workspace: Path, on_line: Optional[Callable[[str], None]], show_output: bool,
+                        usage_label: str, cache_key: str, stall_timeout: float, cache_fields: Optional[dict],
+                        publish: Optional[Callable[[str], None]],
+                        line_policy: Optional[str] = None) -> tuple[str, int]:
+    """Spawn the CLI as an asyncio subprocess and stream its output for arun_cli."""
+    parser = _stream_parser(config, _new_output())
+    timings = CallTimings()
     start_time = time.time()
+    prompt_tokens = _estimate_tokens(prompt)
 
+    delivery = _prepare_prompt(config, prompt)
     try:
-        prompt_tokens = _estimate_tokens(prompt)
-        process = subprocess.Popen(
-            cmd,
+        return await _arun_process(cli, config, model, prompt, timeout, workspace, on_line, show_output,
+                                   usage_label, cache_key, stall_timeout, cache_fields, publish,
+                                   delivery, parser, timings, start_time, prompt_tokens, line_policy)
+    finally:
+        delivery.cleanup()
+
+
+async def _arun_process(cli: str, config: dict, model: Optional[str], prompt: str, timeout: int,
+                        workspace: Path, on_line: Optional[Callable[[str], None]], show_output: bool,
+                        usage_label: str, cache_key: str, stall_timeout: float, cache_fields: Optional[dict],
+                        publish: Optional[Callable[[str], None]], delivery: "_PromptDelivery",
+                        parser: StreamParser, timings: CallTimings, start_time: float,
+                        prompt_tokens: int, line_policy: Optional[str] = None) -> tuple[str, int]:
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *_build_command(config, model, delivery.argv_prompt, delivery.path),
             cwd=str(workspace),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
+            stdin=asyncio.subprocess.PIPE if delivery.stdin_data is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True,
         )
+    except FileNotFoundError:
+        return f"[ERROR] CLI '{cli}' not found", -1
+    except Exception as e:
+        return f"[ERROR] {e}", -1
+    timings.mark_spawned()
+    feeder = None
+    if delivery.stdin_data is not None:
+        feeder = asyncio.ensure_future(_afeed_stdin(process, delivery.stdin_data))
+
+    deadline = time.monotonic() + timeout
+    last_output = time.monotonic()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    lines = _LineAssembler()
+    kill_reason = None
+    # Callbacks stay on the event loop here; the queue only decides what a
+    # backed-up on_line gets to see.
+    lines_out = _aline_queue(on_line, line_policy)
+    on_text = _output_sink(parser, lines_out.put if lines_out else _line_consumer(on_line, show_output), publish)
 
+    try:
         while True:
-            elapsed = time.time() - start_time
-            if elapsed > timeout:
-                process.kill()
-                _log_usage(usage_label, cli, model, prompt_tokens, 0, elapsed)
-                return "[TIMEOUT]", -1
-
-            line = process.stdout.readline()
-            if line:
-                output_lines.append(line)
-                if on_line:
-                    on_line(line.rstrip())
-                elif show_output:
-                    display = line.rstrip()[:100]
-                    print(f"  {Colors.GRAY}│{Colors.RESET} {display}")
-            elif process.poll() is not None:
+            now = time.monotonic()
+            kill_reason = _deadline_reason(now, deadline, last_output, stall_timeout)
+            if kill_reason:
+                break
+            try:
+                chunk = await asyncio.wait_for(
+                    process.stdout.read(READ_CHUNK_SIZE),
+                    _next_wakeup(now, deadline, last_output, stall_timeout),
+                )
+            except asyncio.TimeoutError:
+                continue
+            if not chunk:
                 break
+            last_output = time.monotonic()
+            timings.mark_bytes(last_output)
+            _deliver_text(lines.feed(decoder.decode(chunk)), on_text, timings, last_output)
+            if lines_out:
+                await lines_out.room()
+
+        if not kill_reason:
+            tail = lines.feed(decoder.decode(b"", final=True)) + lines.flush()
+            _deliver_text(tail, on_text, timings, last_output)
+            timings.mark_eof()
+            try:
+                await asyncio.wait_for(process.wait(), max(deadline - time.monotonic(), 0.1))
+                timings.mark_exited()
+            except asyncio.TimeoutError:
+                kill_reason = "timeout"
+
+    except asyncio.CancelledError:
+        await _akill(process)
+        raise
+    except Exception as e:
+        await _akill(process)
+        return f"[ERROR] {e}", -1
+    finally:
+        if feeder is not None and not feeder.done():
+            feeder.cancel()
+        if lines_out:
+            await _aclose_line_queue(lines_out, usage_label)
+
+    if kill_reason:
+        await _akill(process)
+        _observe_call(usage_label, time.time() - start_time, timings, kill_reason)
+        return _killed_result(kill_reason, usage_label, cli, model, prompt_tokens,
+                              time.time() - start_time, stall_timeout, **timings.to_fields())
+
+    output = parser.output
+    cache_fields = _cache_effects(cache_fields, workspace)
+    _observe_call(usage_label, time.time() - start_time, timings, exit_code=process.returncode)
+    _record_output(cache_key, usage_label, cli, model, prompt, output, time.time() - start_time,
+                   cache_fields, reported=parser.usage(), exit_code=process.returncode, **timings.to_fields())
+    return output, process.returncode
 
-        remaining = process.stdout.read()
-        if remaining:
-            output_lines.append(remaining)
-            if on_line:
-                for line in remaining.split('\n'):
-                    if line.strip():
-                        on_line(line)
-
-        output_text = ''.join(output_lines)
-        output_tokens = _estimate_tokens(output_text)
-        _save_cache(cache_key, output_text)
-        _log_usage(usage_label, cli, model, prompt_tokens, output_tokens, time.time() - start_time)
-        print_usage(usage_label, model, prompt_tokens, output_tokens)
-        return output_text, process.returncode
 
-    except FileNotFoundError:
-        return f"[ERROR] CLI '{cli}' not found", -1
+# ============================================================================
+# MODEL BACKENDS
+# ============================================================================
+
+# Labels ORCHESTRATOR_API_ROUTE sends to the HTTP backend by default: calls
+# that only read and answer, where a process per call is pure overhead.
+DEFAULT_API_LABELS = (
+    "rpi:research",
+    "tracer:clarify",
+    "orch:locator",
+)
+
+_HTTP_BACKENDS: dict[str, HTTPBackend] = {}
+_HTTP_LOCK = threading.Lock()
+
+
+def _route_cli(cli: str, usage_label: str) -> str:
+    """
+    The CLI_CONFIGS entry that serves a call.
+
+    ORCHESTRATOR_API_ROUTE names an entry (1 means "api") that takes over
+    the labels in ORCHESTRATOR_API_LABELS (default: DEFAULT_API_LABELS)
+    from whatever CLI the caller asked for. Off by default.
+    """
+    target = os.getenv("ORCHESTRATOR_API_ROUTE")
+    if not target or target == "0":
+        return cli
+    target = "api" if target == "1" else target
+    if target not in CLI_CONFIGS:
+        return cli
+    if not _label_matches(usage_label, "ORCHESTRATOR_API_LABELS", DEFAULT_API_LABELS):
+        return cli
+    return target
+
+
+def _backend(config: dict) -> Optional[tuple[Callable, Callable]]:
+    return BACKENDS.get(config.get("backend", "process"))
+
+
+def _http_backend(cli: str, config: dict) -> HTTPBackend:
+    """The shared backend (and connection pool) for an "http" entry, created on first use."""
+    with _HTTP_LOCK:
+        backend = _HTTP_BACKENDS.get(cli)
+        if backend is None:
+            backend = HTTPBackend(
+                config["url"],
+                api_format=config.get("api_format", "anthropic"),
+                api_key=os.getenv(config.get("api_key_env") or "") or None,
+                model=config.get("model"),
+                max_tokens=config.get("max_tokens", 8192),
+                pool_size=_env_int("ORCHESTRATOR_API_POOL_SIZE", DEFAULT_HTTP_POOL_SIZE),
+                headers=config.get("headers"),
+            )
+            _HTTP_BACKENDS[cli] = backend
+        return backend
+
+
+def http_pool_stats() -> dict[str, dict]:
+    """Connections created/reused per HTTP backend, keyed by CLI_CONFIGS entry."""
+    with _HTTP_LOCK:
+        return {cli: backend.pool.stats() for cli, backend in _HTTP_BACKENDS.items()}
+
+
+def shutdown_http_backends():
+    """Close every pooled HTTP connection."""
+    with _HTTP_LOCK:
+        backends = list(_HTTP_BACKENDS.values())
+        _HTTP_BACKENDS.clear()
+    for backend in backends:
+        backend.close()
+
+
+atexit.register(shutdown_http_backends)
+
+
+def _execute_http(cli: str, config: dict, model: Optional[str], prompt: str, timeout: int, workspace: Path,
+                  on_line: Optional[Callable[[str], None]], show_output: bool, usage_label: str,
+                  cache_key: str, stall_timeout: float, cache_fields: Optional[dict],
+                  publish: Optional[Callable[[str], None]], line_policy: Optional[str] = None) -> tuple[str, int]:
+    """
+    Stream one completion from an HTTP endpoint for run_cli.
+
+    Deadlines work as for a process: the socket timeout is re-armed after
+    every delta to whichever of the wall clock and stall timeout is nearer.
+    "spawn" in the timings is the time to the response headers.
+    """
+    parser = make_parser(None, _new_output())
+    timings = CallTimings()
+    start_time = time.time()
+    prompt_tokens = _estimate_tokens(prompt)
+    deadline = time.monotonic() + timeout
+    last_output = time.monotonic()
+
+    lines_out = _line_queue(on_line, line_policy, usage_label)
+    on_text = _output_sink(parser, lines_out.put if lines_out else _line_consumer(on_line, show_output), publish)
+    lines = _LineAssembler()
+    completion = None
+    kill_reason = None
+    try:
+        try:
+            completion = _http_backend(cli, config).stream(
+                prompt, model, _next_wakeup(last_output, deadline, last_output, stall_timeout))
+            timings.mark_spawned()
+            METRICS.inc("http_requests_total", label=usage_label,
+                        connection="reused" if completion.reused else "new")
+            for text in completion:
+                last_output = time.monotonic()
+                timings.mark_bytes(last_output)
+                _deliver_text(lines.feed(text), on_text, timings, last_output)
+                kill_reason = _deadline_reason(last_output, deadline, last_output, stall_timeout)
+                if kill_reason:
+                    break
+                completion.settimeout(_next_wakeup(last_output, deadline, last_output, stall_timeout))
+        except socket.timeout:
+            kill_reason = _deadline_reason(time.monotonic(), deadline, last_output, stall_timeout) or "timeout"
+        except (HTTPBackendError, http.client.HTTPException, OSError, ValueError) as e:
+            _observe_call(usage_label, time.time() - start_time, timings, exit_code=-1)
+            return f"[ERROR] {e}", -1
+
+        if kill_reason:
+            _observe_call(usage_label, time.time() - start_time, timings, kill_reason)
+            return _killed_result(kill_reason, usage_label, cli, model, prompt_tokens,
+                                  time.time() - start_time, stall_timeout, backend="http",
+                                  **timings.to_fields())
+
+        _deliver_text(lines.flush(), on_text, timings, last_output)
+        timings.mark_eof()
+        output = parser.output
+        cache_fields = _cache_effects(cache_fields, workspace)
+        _observe_call(usage_label, time.time() - start_time, timings)
+        _record_output(cache_key, usage_label, cli, model, prompt, output, time.time() - start_time,
+                       cache_fields, reported=completion.usage(), backend="http",
+                       connection="reused" if completion.reused else "new", **timings.to_fields())
+        return output, 0
+    finally:
+        if completion is not None:
+            completion.close()
+        _close_line_queue(lines_out, usage_label)
+
+
+async def _aexecute_http(cli: str, config: dict, model: Optional[str], prompt: str, timeout: int,
+                         workspace: Path, on_line: Optional[Callable[[str], None]], show_output: bool,
+                         usage_label: str, cache_key: str, stall_timeout: float, cache_fields: Optional[dict],
+                         publish: Optional[Callable[[str], None]],
+                         line_policy: Optional[str] = None) -> tuple[str, int]:
+    """
+    Run _execute_http on a worker thread for arun_cli; on_line still fires on the event loop.
+
+    The worker's line queue waits for each line to be handled on the loop,
+    so line_policy applies to a loop that falls behind.
+    """
+    loop = asyncio.get_running_loop()
+    if on_line:
+        callback = on_line
+
+        def on_line(line: str):
+            handled = threading.Event()
+
+            def call():
+                try:
+                    callback(line)
+                finally:
+                    handled.set()
+            loop.call_soon_threadsafe(call)
+            while not handled.wait(0.5):
+                if loop.is_closed():
+                    return
+    # Copy the context so the usage record still sees this call's queue wait.
+    return await loop.run_in_executor(None, functools.partial(
+        contextvars.copy_context().run,
+        _execute_http, cli, config, model, prompt, timeout, workspace, on_line, show_output,
+        usage_label, cache_key, stall_timeout, cache_fields, publish, line_policy))
+
+
+# How a CLI_CONFIGS entry runs a call, keyed by its "backend": a pair of
+# (sync, async) executors with the signatures of _execute_cli/_aexecute_cli.
+BACKENDS: dict[str, tuple[Callable, Callable]] = {
+    "process": (_execute_cli, _aexecute_cli),
+    "http": (_execute_http, _aexecute_http),
+}
+
+
+def register_backend(name: str, execute: Callable, aexecute: Callable):
+    """Add a backend that CLI_CONFIGS entries can select with "backend": name."""
+    BACKENDS[name] = (execute, aexecute)
+
+
+# ============================================================================
+# RATE LIMITS
+# ============================================================================
+
+_RATE_LIMITERS: dict[tuple[str, Optional[str]], Optional[RateLimiter]] = {}
+_RATE_LOCK = threading.Lock()
+
+
+@dataclass
+class _CallContext:
+    """The backend call in progress on this thread or task, as seen by _log_usage."""
+    queue_wait_sec: Optional[float] = None
+    host_wait_sec: Optional[float] = None
+    # in + out tokens of the call's usage record, to settle its reservation
+    tokens: Optional[int] = None
+
+
+_CALL: contextvars.ContextVar[Optional[_CallContext]] = contextvars.ContextVar("orchestrator_call", default=None)
+
+
+def _rate_limits(cli: str, config: dict, model: Optional[str]) -> dict:
+    """
+    Limits for one CLI_CONFIGS entry and model, most specific last:
+    the entry's "rate_limits", its "models" override for `model`, then
+    ORCHESTRATOR_RATE_LIMITS for "<cli>" and "<cli>@<model>", e.g.
+    "claude:rpm=50,tpm=400000,concurrent=4;copilot@gpt-5.1-codex-mini:rpm=100".
+    """
+    base = dict(config.get("rate_limits") or {})
+    per_model = base.pop("models", None) or {}
+    limits = {k: v for k, v in base.items() if k in ("rpm", "tpm", "max_concurrent")}
+    limits.update(per_model.get(model) or {})
+    overrides = parse_limits(os.getenv("ORCHESTRATOR_RATE_LIMITS", ""))
+    limits.update(overrides.get(cli, {}))
+    if model:
+        limits.update(overrides.get(f"{cli}@{model}", {}))
+    return limits
+
+
+def _rate_limiter(cli: str, config: dict, model: Optional[str]) -> Optional[RateLimiter]:
+    """The shared limiter for (cli, model), or None when nothing limits it."""
+    key = (cli, model)
+    with _RATE_LOCK:
+        if key not in _RATE_LIMITERS:
+            limiter = RateLimiter(**_rate_limits(cli, config, model))
+            _RATE_LIMITERS[key] = None if limiter.unlimited else limiter
+        return _RATE_LIMITERS[key]
+
+
+def rate_limit_stats() -> dict[str, dict]:
+    """Limits, active calls, queue length and bucket levels per "<cli>@<model>"."""
+    with _RATE_LOCK:
+        limiters = [(key, limiter) for key, limiter in _RATE_LIMITERS.items() if limiter]
+    return {f"{cli}@{model or 'default'}": limiter.stats() for (cli, model), limiter in limiters}
+
+
+def _admitted(lease: Lease, cli: str, model: Optional[str], usage_label: str) -> _CallContext:
+    METRICS.observe("rate_limit_wait_seconds", lease.waited, cli=cli, model=model or "default")
+    if lease.waited >= 1:
+        print(f"  {Colors.GRAY}[rate]{Colors.RESET} {usage_label}: queued {lease.waited:.1f}s "
+              f"for {cli}{f'@{model}' if model else ''}")
+    return _CallContext(queue_wait_sec=round(lease.waited, 3))
+
+
+@contextmanager
+def _rate_limited(cli: str, config: dict, model: Optional[str], prompt: str, usage_label: str):
+    """Hold a rate-limit slot for one backend call, queueing until one frees up."""
+    limiter = _rate_limiter(cli, config, model)
+    if limiter is None:
+        yield
+        return
+    lease = limiter.acquire(_estimate_tokens(prompt))
+    call = _admitted(lease, cli, model, usage_label)
+    token = _CALL.set(call)
+    try:
+        yield
+    finally:
+        _CALL.reset(token)
+        lease.release(call.tokens)
+
+
+@asynccontextmanager
+async def _arate_limited(cli: str, config: dict, model: Optional[str], prompt: str, usage_label: str):
+    """_rate_limited for coroutines; waiting does not block the event loop."""
+    limiter = _rate_limiter(cli, config, model)
+    if limiter is None:
+        yield
+        return
+    lease = await limiter.aacquire(_estimate_tokens(prompt))
+    call = _admitted(lease, cli, model, usage_label)
+    token = _CALL.set(call)
+    try:
+        yield
+    finally:
+        _CALL.reset(token)
+        lease.release(call.tokens)
+
+
+# ============================================================================
+# HOST SLOTS
+# ============================================================================
+
+_HOST_SEMAPHORES: dict[str, Optional[HostSemaphore]] = {}
+_HOST_LOCK = threading.Lock()
+
+
+def _host_slot_dir() -> Path:
+    return Path(os.getenv("ORCHESTRATOR_HOST_SLOTS_DIR") or STATE_DIR / "slots")
+
+
+def _host_slot_count(cli: str, config: dict) -> int:
+    """
+    Host-wide slots for a CLI_CONFIGS entry (0 = unlimited): its name in
+    ORCHESTRATOR_HOST_SLOTS ("claude=4,api=16"), else the entry's
+    "host_slots", else a bare number in the variable ("8") if one was set.
+    With neither the variable nor "host_slots" set there is no limit.
+    """
+    counts = parse_slot_counts(os.getenv("ORCHESTRATOR_HOST_SLOTS", ""))
+    if cli in counts:
+        return counts[cli]
+    return int(config.get("host_slots") or counts.get("*", 0))
+
+
+def _host_semaphore(cli: str, config: dict) -> Optional[HostSemaphore]:
+    with _HOST_LOCK:
+        if cli not in _HOST_SEMAPHORES:
+            slots = _host_slot_count(cli, config)
+            use = slots > 0 and HostSemaphore.supported()
+            _HOST_SEMAPHORES[cli] = HostSemaphore(_host_slot_dir() / cli, slots) if use else None
+        return _HOST_SEMAPHORES[cli]
+
+
+def host_slot_status() -> dict[str, dict]:
+    """
+    {backend: {"slots": configured count (0 = unlimited), "rows": HostSemaphore.status()}}
+    for every configured backend and every slot directory left by another process.
+    """
+    root = _host_slot_dir()
+    names = {p.name for p in root.iterdir() if p.is_dir()} if root.is_dir() else set()
+    names.update(cli for cli, config in CLI_CONFIGS.items() if _host_slot_count(cli, config) > 0)
+    status = {}
+    for name in sorted(names):
+        slots = _host_slot_count(name, CLI_CONFIGS.get(name, {}))
+        status[name] = {"slots": slots, "rows": HostSemaphore(root / name, slots).status()}
+    return status
+
+
+def _slot_holder(cli: str, usage_label: str) -> dict:
+    return {"cli": cli, "label": usage_label, "command": " ".join(sys.argv[1:3])}
+
+
+def _slot_acquired(waited: float, cli: str, usage_label: str) -> tuple[_CallContext, Optional[contextvars.Token]]:
+    METRICS.observe("host_slot_wait_seconds", waited, cli=cli)
+    if waited >= 1:
+        print(f"  {Colors.GRAY}[slots]{Colors.RESET} {usage_label}: waited {waited:.1f}s for a {cli} host slot")
+    call = _CALL.get()
+    token = None
+    if call is None:
+        call = _CallContext()
+        token = _CALL.set(call)
+    call.host_wait_sec = round(waited, 3)
+    return call, token
+
+
+@contextmanager
+def _host_slot(cli: str, config: dict, usage_label: str):
+    """Hold one of the host-wide slots for `cli` around a backend call."""
+    semaphore = _host_semaphore(cli, config)
+    if semaphore is None:
+        yield
+        return
+    lease = semaphore.acquire(_slot_holder(cli, usage_label))
+    try:
+        _, token = _slot_acquired(lease.waited, cli, usage_label)
+        try:
+            yield
+        finally:
+            if token is not None:
+                _CALL.reset(token)
+    finally:
+        lease.release()
+
+
+@asynccontextmanager
+async def _ahost_slot(cli: str, config: dict, usage_label: str):
+    """_host_slot for coroutines."""
+    semaphore = _host_semaphore(cli, config)
+    if semaphore is None:
+        yield
+        return
+    lease = await semaphore.aacquire(_slot_holder(cli, usage_label))
+    try:
+        _, token = _slot_acquired(lease.waited, cli, usage_label)
+        try:
+            yield
+        finally:
+            if token is not None:
+                _CALL.reset(token)
+    finally:
+        lease.release()
+
+
+# ============================================================================
+# BATCH SUBMISSION
+# ============================================================================
+
+DEFAULT_BATCH_WORKERS = 4
+DEFAULT_BATCH_POLL_SEC = 30.0
+BATCH_MAX_ITEMS = 10000
+
+
+@dataclass
+class BatchRequest:
+    """One prompt for run_cli_batch; the label defaults to the batch's."""
+    prompt: str
+    usage_label: Optional[str] = None
+    cache_key: Optional[str] = None
+    depends_on: Optional[list] = None
+
+
+@dataclass
+class BatchResult:
+    """One finished item; `index` is its position in the prompts given."""
+    index: int
+    output: str
+    code: int
+    source: str  # "cache", "batch" (a backend batch API) or "local"
+
+
+@dataclass
+class _BatchCall:
+    index: int
+    prompt: str
+    usage_label: str
+    cache_key: str
+    cache_fields: Optional[dict]
+    done: bool = False
+
+
+def run_cli_batch(
+    cli: str,
+    prompts: list,
+    timeout: int = 3600,
+    workspace: Path = WORKSPACE,
+    usage_label: Optional[str] = None,
+) -> Iterator[BatchResult]:
+    """
+    Run many small independent prompts, yielding results as they complete.
+
+    Every item is looked up in the cache first; hits come back at once. The
+    misses are grouped per (backend, model). A group on an "http" entry
+    whose API has batches (the "api" entry) is submitted as one message
+    batch and polled every ORCHESTRATOR_BATCH_POLL_SEC (default: 30);
+    ORCHESTRATOR_BATCH_API=0 keeps it local. Every other group runs through
+    its backend on ORCHESTRATOR_BATCH_WORKERS threads (default: 4). Either
+    way each answer is cached and usage-logged like a run_cli call; nothing
+    is echoed. Closing the generator early (or dropping it) stops the
+    groups: queued calls are skipped, pending remote batches cancelled, and
+    close() returns once the calls already running have finished.
+
+    Args:
+        cli: CLI_CONFIGS entry (ORCHESTRATOR_API_ROUTE applies per item label)
+        prompts: Prompt strings or BatchRequest items
+        timeout: Deadline in seconds for the whole batch
+        workspace: Working directory
+        usage_label: Label for items that don't carry their own
+
+    Yields:
+        BatchResult per item, in completion order
+    """
+    usage_label = usage_label or "batch"
+    deadline = time.monotonic() + timeout
+    ready: list[BatchResult] = []
+    groups: dict[tuple, list[_BatchCall]] = {}
+
+    for index, item in enumerate(prompts):
+        if not isinstance(item, BatchRequest):
+            item = BatchRequest(item)
+        label = item.usage_label or usage_label
+        item_cli = _route_cli(cli, label)
+        config = CLI_CONFIGS.get(item_cli)
+        if not config or not _backend(config):
+            ready.append(BatchResult(index, f"[ERROR] Unknown CLI: {item_cli}", -1, "local"))
+            continue
+        model = _select_model(config, label)
+        cache_key = item.cache_key or _default_cache_key(item.prompt, model, label)
+        cache_mode = _cache_mode(label)
+        cached = _cached_output(cache_key, label, item_cli, model, item.prompt, workspace, cache_mode)
+        if cached is not None:
+            ready.append(BatchResult(index, cached, 0, "cache"))
+            continue
+        if cache_mode != "off":
+            METRICS.inc("cli_cache_misses_total", label=label)
+        groups.setdefault((item_cli, model), []).append(
+            _BatchCall(index, item.prompt, label, cache_key, _cache_inputs(item.depends_on, workspace, cache_mode)))
+
+    results: "queue.Queue[BatchResult]" = queue.Queue()
+    cancel = threading.Event()
+    threads = []
+    for (item_cli, model), calls in groups.items():
+        config = CLI_CONFIGS[item_cli]
+        runner = _run_remote_batch if _batch_capable(item_cli, config) else _run_local_batch
+        thread = threading.Thread(
+            target=_run_batch_group,
+            args=(runner, item_cli, config, model, calls, deadline, workspace, results, cancel),
+            name=f"batch:{item_cli}:{model}",
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+
+    try:
+        yield from ready
+        for _ in range(sum(len(calls) for calls in groups.values())):
+            yield results.get()
+    finally:
+        cancel.set()
+        for thread in threads:
+            thread.join()
+
+
+def _batch_capable(cli: str, config: dict) -> bool:
+    if config.get("backend") != "http" or os.getenv("ORCHESTRATOR_BATCH_API") == "0":
+        return False
+    return _http_backend(cli, config).supports_batches
+
+
+def _run_batch_group(runner: Callable, cli: str, config: dict, model: Optional[str], calls: list[_BatchCall],
+                     deadline: float, workspace: Path, results: queue.Queue, cancel: threading.Event):
+    """Run one group; whatever it leaves unanswered (it raised) fails with the error."""
+    def put(call: _BatchCall, output: str, code: int, source: str):
+        if not call.done:
+            call.done = True
+            results.put(BatchResult(call.index, output, code, source))
+
+    try:
+        runner(cli, config, model, calls, deadline, workspace, put, cancel)
     except Exception as e:
-        return f"[ERROR] {e}", -1
+        for call in calls:
+            put(call, f"[ERROR] {e}", -1, "batch")
+    finally:
+        for call in calls:
+            put(call, "[ERROR] no result", -1, "batch")
+
+
+def _run_local_batch(cli: str, config: dict, model: Optional[str], calls: list[_BatchCall],
+                     deadline: float, workspace: Path, put: Callable, cancel: threading.Event):
+    """Stand-in for a batch API: the group's calls on a few threads through its backend."""
+    execute = _backend(config)[0]
+    stall_timeout = _stall_timeout(None)
+
+    def run(call: _BatchCall) -> tuple:
+        if cancel.is_set():
+            return "[CANCELLED]", -1
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return "[TIMEOUT]", -1
+        with _rate_limited(cli, config, model, call.prompt, call.usage_label), \
+                _host_slot(cli, config, call.usage_label), \
+                _workspace_call(workspace, call.cache_fields) as cache_fields:
+            return execute(cli, config, model, call.prompt, remaining, workspace, None, False,
+                           call.usage_label, call.cache_key, stall_timeout, cache_fields, None)
+
+    workers = max(1, _env_int("ORCHESTRATOR_BATCH_WORKERS", DEFAULT_BATCH_WORKERS))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"batch-{cli}") as executor:
+        futures = {executor.submit(run, call): call for call in calls}
+        for future in as_completed(futures):
+            output, code = future.result()
+            put(futures[future], as_text(output), code, "local")
+
+
+def _run_remote_batch(cli: str, config: dict, model: Optional[str], calls: list[_BatchCall],
+                      deadline: float, workspace: Path, put: Callable, cancel: threading.Event):
+    """Submit the group through the backend's batch API and collect the answers once it ends."""
+    backend = _http_backend(cli, config)
+    try:
+        poll = float(os.getenv("ORCHESTRATOR_BATCH_POLL_SEC", DEFAULT_BATCH_POLL_SEC))
+    except ValueError:
+        poll = DEFAULT_BATCH_POLL_SEC
+
+    for start in range(0, len(calls), BATCH_MAX_ITEMS):
+        if cancel.is_set():
+            return
+        chunk = {f"item-{call.index}": call for call in calls[start:start + BATCH_MAX_ITEMS]}
+        submitted = time.time()
+        batch = backend.submit_batch([(custom_id, call.prompt) for custom_id, call in chunk.items()], model)
+        print(f"  {Colors.GRAY}[batch]{Colors.RESET} {batch.get('id')}: {len(chunk)} {cli} request(s) submitted")
+        while batch.get("processing_status") != "ended":
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or cancel.is_set():
+                try:
+                    backend.cancel_batch(batch["id"])
+                except (HTTPBackendError, http.client.HTTPException, OSError):
+                    pass
+                reason = "cancelled" if remaining > 0 else "timeout"
+                for call in chunk.values():
+                    _log_usage(call.usage_label, cli, model, _estimate_tokens(call.prompt), 0,
+                               time.time() - submitted, kill_reason=reason, backend="http-batch")
+                    put(call, f"[{reason.upper()}]", -1, "batch")
+                return
+            cancel.wait(min(poll, remaining))
+            batch = backend.batch_status(batch["id"])
+
+        for item in backend.batch_results(batch):
+            call = chunk.get(item.custom_id)
+            if call is None:
+                continue
+            elapsed = time.time() - submitted
+            if item.error:
+                _observe_call(call.usage_label, elapsed, CallTimings(), exit_code=-1)
+                put(call, f"[ERROR] {item.error}", -1, "batch")
+                continue
+            cache_fields = _cache_effects(call.cache_fields, workspace)
+            _observe_call(call.usage_label, elapsed, CallTimings())
+            _record_output(call.cache_key, call.usage_label, cli, model, call.prompt, item.text, elapsed,
+                           cache_fields, reported=item.usage(), backend="http-batch", batch_id=batch.get("id"))
+            put(call, item.text, 0, "batch")
+
+
+# ============================================================================
+# PROCESS SUPERVISION
+# ============================================================================
+
+READ_CHUNK_SIZE = 64 * 1024
+PIPE_WRITE_SIZE = 64 * 1024
+KILL_GRACE_SEC = 2.0
+
+# Every CLI runs in its own session so a deadline can take down the agent's
+# whole tool tree; that also detaches it from terminal Ctrl-C, so live
+# processes are tracked here and torn down on exit.
+_ACTIVE_PROCESSES: set = set()
+
+
+class _LineAssembler:
+    """Cut decoded text at its last newline, carrying the unfinished line across chunks."""
+
+    def __init__(self):
+        self._partial: list[str] = []
+
+    def feed(self, text: str) -> str:
+        """Return the whole lines `text` completes, as one newline-terminated string."""
+        end = text.rfind("\n") + 1
+        if not end:
+            if text:
+                self._partial.append(text)
+            return ""
+        if self._partial:
+            self._partial.append(text[:end])
+            block = "".join(self._partial)
+            self._partial.clear()
+        else:
+            block = text[:end] if end < len(text) else text
+        if end < len(text):
+            self._partial.append(text[end:])
+        return block
+
+    def flush(self) -> str:
+        partial = "".join(self._partial)
+        self._partial.clear()
+        return partial
+
+
+def _deliver_text(text: str, on_text: Callable[[str], None], timings: Optional[CallTimings], now: float):
+    if not text:
+        return
+    if timings:
+        timings.mark_lines(text.count("\n") + (not text.endswith("\n")), now)
+    on_text(text)
+
+
+def _output_sink(parser: StreamParser, emit: Optional[Callable[[str], None]],
+                 publish: Optional[Callable[[str], None]]) -> Callable[[str], None]:
+    """
+    Feed output blocks to `parser`; split them into lines for `emit` only if
+    there is one. `publish` gets whole blocks and splits them itself once
+    the call has followers (see Flight.publish).
+    """
+    def _on_text(text: str):
+        shown = parser.feed(text)
+        if not shown:
+            return
+        if publish:
+            publish(shown)
+        if emit:
+            for line in split_lines(shown):
+                emit(line)
+
+    return _on_text
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _stall_timeout(stall_timeout: Optional[int]) -> float:
+    if stall_timeout is None:
+        try:
+            stall_timeout = float(os.getenv("ORCHESTRATOR_STALL_TIMEOUT", "0"))
+        except ValueError:
+            stall_timeout = 0
+    return max(0.0, float(stall_timeout))
+
+
+def _deadline_reason(now: float, deadline: float, last_output: float, stall_timeout: float) -> Optional[str]:
+    if now >= deadline:
+        return "timeout"
+    if stall_timeout and now - last_output >= stall_timeout:
+        return "stall"
+    return None
+
+
+def _next_wakeup(now: float, deadline: float, last_output: float, stall_timeout: float) -> float:
+    wait = deadline - now
+    if stall_timeout:
+        wait = min(wait, last_output + stall_timeout - now)
+    return max(wait, 0.0)
+
+
+def _read_process_output(process: subprocess.Popen, deadline: float, stall_timeout: float,
+                         on_text: Callable[[str], None], stdin_data: Optional[bytes] = None,
+                         timings: Optional[CallTimings] = None) -> Optional[str]:
+    """
+    Pump a child's stdout until EOF and exit, or until a deadline passes.
+
+    The pipes are non-blocking and multiplexed with a selector, so a CLI that
+    hangs mid-line cannot hold the caller past `deadline`. Output is read in
+    READ_CHUNK_SIZE blocks and decoded incrementally; `on_text` receives every
+    run of complete lines as one string (and any unterminated tail at EOF).
+    If `stdin_data` is given it is written to the child's stdin alongside
+    reading, then stdin is closed. `timings`, if given, receives
+    byte/line/EOF/exit timestamps.
+
+    Returns:
+        None on normal completion, otherwise the kill reason ("timeout" or "stall")
+    """
+    out_fd = process.stdout.fileno()
+    os.set_blocking(out_fd, False)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    lines = _LineAssembler()
+    last_output = time.monotonic()
+    pending_in = memoryview(stdin_data) if stdin_data is not None else None
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(out_fd, selectors.EVENT_READ)
+        if pending_in is not None:
+            in_fd = process.stdin.fileno()
+            os.set_blocking(in_fd, False)
+            selector.register(in_fd, selectors.EVENT_WRITE)
+        eof = False
+        while not eof:
+            now = time.monotonic()
+            reason = _deadline_reason(now, deadline, last_output, stall_timeout)
+            if reason:
+                return reason
+            for key, _ in selector.select(_next_wakeup(now, deadline, last_output, stall_timeout)):
+                if key.fd != out_fd:
+                    try:
+                        written = os.write(key.fd, pending_in[:PIPE_WRITE_SIZE])
+                        pending_in = pending_in[written:]
+                    except BlockingIOError:
+                        continue
+                    except BrokenPipeError:
+                        pending_in = pending_in[:0]
+                    if not pending_in:
+                        selector.unregister(key.fd)
+                        process.stdin.close()
+                    continue
+                try:
+                    chunk = os.read(out_fd, READ_CHUNK_SIZE)
+                except BlockingIOError:
+                    continue
+                if not chunk:
+                    eof = True
+                    break
+                last_output = time.monotonic()
+                if timings:
+                    timings.mark_bytes(last_output)
+                _deliver_text(lines.feed(decoder.decode(chunk)), on_text, timings, last_output)
+
+    tail = lines.feed(decoder.decode(b"", final=True)) + lines.flush()
+    _deliver_text(tail, on_text, timings, last_output)
+    if timings:
+        timings.mark_eof()
+
+    try:
+        process.wait(timeout=max(deadline - time.monotonic(), 0.1))
+    except subprocess.TimeoutExpired:
+        return "timeout"
+    if timings:
+        timings.mark_exited()
+    return None
+
+
+_BENCH_WRITER = """
+import sys
+line = ("x" * max(1, {line_bytes} - 8) + " é中\\n").encode("utf-8")
+block = line * max(1, (1 << 20) // len(line))
+write = sys.stdout.buffer.write
+for _ in range({mb}):
+    write(block)
+"""
+
+
+def benchmark_output_reader(mb: int = 64, line_bytes: int = 120, rounds: int = 3) -> list[dict]:
+    """
+    Throughput of the CLI output reader on a child that writes `mb` MB of lines.
+
+    Compares a text-mode readline loop collecting a list (how run_cli used to
+    read) against _read_process_output with and without a per-line callback,
+    and publishing to an unfollowed flight as a default cached call does.
+    Lines carry multi-byte UTF-8, so chunk boundaries regularly split a
+    character. Each row is the best of `rounds`.
+    """
+    script = _BENCH_WRITER.format(mb=mb, line_bytes=line_bytes)
+    command = [sys.executable, "-c", script]
+
+    def _readline():
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, encoding="utf-8", bufsize=1)
+        lines = []
+        for line in iter(process.stdout.readline, ""):
+            lines.append(line)
+        process.wait()
+        process.stdout.close()
+        return "".join(lines)
+
+    def _chunked(on_line, publish=None):
+        def run():
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       start_new_session=True)
+            parser = make_parser(None)
+            try:
+                _read_process_output(process, time.monotonic() + 600, 0,
+                                     _output_sink(parser, on_line, publish), timings=CallTimings())
+            finally:
+                process.stdout.close()
+            return parser.output_text
+        return run
+
+    readers = [
+        ("readline + list", _readline),
+        ("chunked", _chunked(None)),
+        ("chunked + flight", _chunked(None, Flight().publish)),
+        ("chunked + on_line", _chunked(lambda line: None)),
+    ]
+    expected = None
+    rows = []
+    for name, read in readers:
+        best = None
+        for _ in range(max(1, rounds)):
+            start = time.perf_counter()
+            text = read()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if expected is None:
+            expected = text
+        size = len(text.encode("utf-8"))
+        rows.append({
+            "reader": name,
+            "mb_per_sec": size / best / 1024 / 1024,
+            "lines_per_sec": text.count("\n") / best,
+            "identical": text == expected,
+        })
+    return rows
+
+
+def _kill_process_group(process: subprocess.Popen):
+    """Terminate the CLI and every process it spawned, escalating to SIGKILL."""
+    if process.poll() is not None:
+        return
+    if not hasattr(os, "killpg"):
+        process.kill()
+        process.wait()
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=KILL_GRACE_SEC)
+            return
+        except subprocess.TimeoutExpired:
+            pass
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+async def _akill(process: asyncio.subprocess.Process):
+    if process.returncode is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(process.wait(), KILL_GRACE_SEC)
+                return
+            except asyncio.TimeoutError:
+                os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        return
+    await process.wait()
+
+
+def _killed_result(kill_reason: str, usage_label: str, cli: str, model: Optional[str],
+                   prompt_tokens: int, elapsed: float, stall_timeout: float, **extra) -> tuple[str, int]:
+    _log_usage(usage_label, cli, model, prompt_tokens, 0, elapsed, kill_reason=kill_reason, **extra)
+    if kill_reason == "stall":
+        return f"[TIMEOUT] no output for {stall_timeout:g}s", -1
+    return "[TIMEOUT]", -1
+
+
+def terminate_active_processes():
+    """Kill every CLI process group still running (used on exit/interrupt)."""
+    for process in list(_ACTIVE_PROCESSES):
+        try:
+            _kill_process_group(process)
+        except Exception:
+            pass
+        _ACTIVE_PROCESSES.discard(process)
+
+
+atexit.register(terminate_active_processes)
+
+
+def _observe_call(usage_label: str, elapsed: float, timings: CallTimings, kill_reason: Optional[str] = None,
+                  exit_code: int = 0):
+    """Feed one finished CLI call into the in-process METRICS registry."""
+    METRICS.inc("cli_calls_total", label=usage_label)
+    if kill_reason:
+        METRICS.inc("cli_failures_total", label=usage_label, reason=kill_reason)
+        if kill_reason in ("timeout", "stall"):
+            METRICS.inc("cli_timeouts_total", label=usage_label, reason=kill_reason)
+    elif exit_code != 0:
+        METRICS.inc("cli_failures_total", label=usage_label, reason="exit")
+    METRICS.observe("cli_elapsed_seconds", elapsed, label=usage_label)
+    timings.observe(METRICS, usage_label)
+
+
+# ============================================================================
+# IN-FLIGHT COALESCING
+# ============================================================================
+
+# Identical calls issued while one is already running (fan-out bursts all
+# missing the cache at once) wait for that call instead of spawning their own.
+_FLIGHTS = FlightGroup()
+
+
+def _flight_key(cli: str, workspace: Path, cache_key: str, cache_mode: str) -> Optional[str]:
+    """Coalescing key for a call, or None when it must run on its own."""
+    if cache_mode == "off" or os.getenv("ORCHESTRATOR_COALESCE") == "0":
+        return None
+    return f"{cli}|{Path(workspace).resolve()}|{cache_key}"
+
+
+def _follow_flight(flight: Flight, usage_label: str, cli: str, model: Optional[str], prompt: str,
+                   timeout: int, on_line: Optional[Callable[[str], None]],
+                   line_policy: Optional[str] = None) -> tuple[str, int]:
+    """Wait for the leader of an identical call, streaming its lines to on_line."""
+    lines_out = _line_queue(on_line, line_policy, usage_label)
+    listener = lines_out.put if lines_out else _line_consumer(on_line, False)
+    if listener:
+        flight.subscribe(listener)
+    start_time = time.time()
+    print(f"  {Colors.GRAY}[coalesced]{Colors.RESET} waiting on identical in-flight {usage_label} call")
+    try:
+        finished = flight.wait(timeout)
+    finally:
+        if listener:
+            flight.unsubscribe(listener)
+        _close_line_queue(lines_out, usage_label)
+    return _flight_result(flight, finished, usage_label, cli, model, prompt, time.time() - start_time)
+
+
+async def _afollow_flight(flight: Flight, usage_label: str, cli: str, model: Optional[str], prompt: str,
+                          timeout: int, on_line: Optional[Callable[[str], None]],
+                          line_policy: Optional[str] = None) -> tuple[str, int]:
+    """
+    Async counterpart of _follow_flight; lines are delivered on the caller's loop.
+
+    A follower never holds up the leader, so under "block" its queue just
+    grows; drop and coalesce still cap what a backed-up on_line sees.
+    """
+    listener = None
+    lines_out = _aline_queue(on_line, line_policy)
+    if on_line:
+        loop = asyncio.get_running_loop()
+        deliver = lines_out.put if lines_out else _line_consumer(on_line, False)
+
+        def listener(line: str):
+            loop.call_soon_threadsafe(deliver, line)
+        flight.subscribe(listener)
+    start_time = time.time()
+    print(f"  {Colors.GRAY}[coalesced]{Colors.RESET} waiting on identical in-flight {usage_label} call")
+    try:
+        finished = await flight.wait_async(timeout)
+    finally:
+        if listener:
+            flight.unsubscribe(listener)
+        if lines_out:
+            # Let lines already posted to the loop reach the queue first.
+            await asyncio.sleep(0)
+            await _aclose_line_queue(lines_out, usage_label)
+    return _flight_result(flight, finished, usage_label, cli, model, prompt, time.time() - start_time)
+
+
+def _shared_result(result: tuple) -> tuple:
+    """What followers get: the text, never the leader's OutputHandle (closing it drops the spill file)."""
+    output, code = result
+    return as_text(output), code
+
+
+def _flight_result(flight: Flight, finished: bool, usage_label: str, cli: str, model: Optional[str],
+                   prompt: str, elapsed: float) -> tuple[str, int]:
+    if not finished:
+        _log_usage(usage_label, cli, model, _estimate_tokens(prompt), 0, elapsed,
+                   kill_reason="timeout", coalesced=True)
+        return "[TIMEOUT]", -1
+    output_text, returncode = flight.result
+    METRICS.inc("cli_coalesced_total", label=usage_label)
+    _log_usage(f"{usage_label}:cache", cli, model, _estimate_tokens(prompt), _estimate_tokens(output_text),
+               elapsed, coalesced=True)
+    return output_text, returncode
+
+
+# ============================================================================
+# WORKER POOL
+# ============================================================================
+
+_POOLS: dict[tuple, WorkerPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _pool_for(cli: str, config: dict, model: Optional[str], workspace: Path,
+              usage_label: str) -> Optional[WorkerPool]:
+    """
+    Return the warm-worker pool for this call, creating it on first use.
+
+    Pools are opt-in (ORCHESTRATOR_POOL_SIZE > 0), limited to CLIs that read
+    the prompt from stdin and to labels in ORCHESTRATOR_POOL_LABELS
+    (default: the cheap labels, where startup dominates the call).
+    """
+    size = _env_int("ORCHESTRATOR_POOL_SIZE", 0)
+    if size <= 0 or not config.get("stdin_prompt"):
+        return None
+    if not _label_matches(usage_label, "ORCHESTRATOR_POOL_LABELS", DEFAULT_CHEAP_LABELS):
+        return None
+
+    # The command depends on env-driven flags such as ORCHESTRATOR_STRUCTURED_OUTPUT,
+    # so a pool whose workers were started with a different one is replaced
+    # rather than handing out processes the parser does not match.
+    cmd = _build_command(config, model, None)
+    key = (cli, model, str(workspace))
+    stale = None
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is not None and pool.cmd != cmd:
+            stale, pool = pool, None
+        if pool is None:
+            pool = WorkerPool(
+                cmd,
+                cwd=workspace,
+                size=size,
+                max_age=_env_int("ORCHESTRATOR_POOL_MAX_AGE", 600),
+                max_uses=_env_int("ORCHESTRATOR_POOL_MAX_USES", 0),
+            )
+            _POOLS[key] = pool
+    if stale is not None:
+        stale.close()
+    return pool
+
+
+def pool_stats() -> dict[str, dict]:
+    """Hit/miss/recycle counters for every warm-worker pool, keyed by cli:model."""
+    with _POOLS_LOCK:
+        return {f"{cli}:{model}": pool.stats.to_dict() for (cli, model, _), pool in _POOLS.items()}
+
+
+def shutdown_pools():
+    """Kill all idle pooled workers."""
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(shutdown_pools)
+
+
+def _build_command(config: dict, model: Optional[str], prompt: Optional[str],
+                   prompt_file: Optional[Path] = None) -> list[str]:
+    """
+    Build the CLI argv.
+
+    With prompt=None the CLI is left to read it from stdin, unless
+    `prompt_file` is given: then the CLI's `prompt_file_flag` names it, or
+    the prompt argument asks the agent to read it.
+    """
+    cmd = [config["cmd"]] + config["args"]
+    if _structured_output(config):
+        cmd.extend(config["stream_args"])
+    if "model_flag" in config and model:
+        cmd.extend([config["model_flag"], model])
+    if prompt_file is not None:
+        if config.get("prompt_file_flag"):
+            cmd.extend([config["prompt_file_flag"], str(prompt_file)])
+        else:
+            template = config.get("prompt_file_template", DEFAULT_PROMPT_FILE_TEMPLATE)
+            cmd.extend([config["prompt_flag"], template.format(path=prompt_file)])
+    elif prompt is not None:
+        cmd.extend([config["prompt_flag"], prompt])
+    return cmd
+
+
+# ============================================================================
+# PROMPT TRANSPORT
+# ============================================================================
+
+# Linux caps a single argv string at MAX_ARG_STRLEN (128 KiB); anything
+# close to that fails to exec with E2BIG, so big prompts go another way.
+ARGV_PROMPT_MAX_BYTES = 96 * 1024
+PROMPT_TRANSPORTS = ("auto", "argv", "stdin", "file")
+PROMPT_FILE_DIR = STATE_DIR / "prompts"
+DEFAULT_PROMPT_FILE_TEMPLATE = (
+    "Your full instructions are in the file {path}. Read that whole file first and follow it exactly."
+)
+
+
+@dataclass
+class _PromptDelivery:
+    """How one prompt is handed to a spawned CLI."""
+    transport: str
+    argv_prompt: Optional[str] = None
+    stdin_data: Optional[bytes] = None
+    path: Optional[Path] = None
+
+    def cleanup(self):
+        if self.path is not None:
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+            self.path = None
+
+
+_NO_DELIVERY = _PromptDelivery("none")
+
+
+def _prompt_transport(config: dict, prompt_bytes: int) -> str:
+    """
+    Resolve the transport for a prompt of `prompt_bytes`.
+
+    ORCHESTRATOR_PROMPT_TRANSPORT overrides the per-CLI `prompt_transport`.
+    "auto" keeps small prompts on argv and sends large ones over stdin, or
+    through a temp file for CLIs that don't read stdin; "stdin" on such a
+    CLI also falls back to a file.
+    """
+    mode = os.getenv("ORCHESTRATOR_PROMPT_TRANSPORT") or config.get("prompt_transport", "auto")
+    if mode not in PROMPT_TRANSPORTS:
+        mode = "auto"
+    if mode == "auto":
+        if prompt_bytes <= ARGV_PROMPT_MAX_BYTES:
+            return "argv"
+        mode = "stdin"
+    if mode == "stdin" and not config.get("stdin_prompt"):
+        return "file"
+    return mode
+
+
+def _prepare_prompt(config: dict, prompt: str) -> _PromptDelivery:
+    data = prompt.encode("utf-8")
+    transport = _prompt_transport(config, len(data))
+    if transport == "stdin":
+        return _PromptDelivery(transport, stdin_data=data)
+    if transport == "file":
+        PROMPT_FILE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(prefix="prompt-", suffix=".md", dir=PROMPT_FILE_DIR)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return _PromptDelivery(transport, path=Path(name))
+    return _PromptDelivery(transport, argv_prompt=prompt)
+
+
+async def _afeed_stdin(process: asyncio.subprocess.Process, data: bytes):
+    """Write the prompt to an asyncio child's stdin, then close it."""
+    try:
+        for start in range(0, len(data), PIPE_WRITE_SIZE):
+            process.stdin.write(data[start:start + PIPE_WRITE_SIZE])
+            await process.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        process.stdin.close()
+
+
+def _structured_output(config: dict) -> bool:
+    """Whether to run this CLI in its JSON event-stream mode (ORCHESTRATOR_STRUCTURED_OUTPUT=1)."""
+    return bool(config.get("stream_args")) and os.getenv("ORCHESTRATOR_STRUCTURED_OUTPUT") == "1"
+
+
+def _stream_parser(config: dict, sink=None) -> StreamParser:
+    return make_parser(config.get("stream_format") if _structured_output(config) else None, sink)
+
+
+def _line_consumer(on_line: Optional[Callable[[str], None]], show_output: bool) -> Optional[Callable[[str], None]]:
+    """The per-line callback of a call: on_line, else the live display, else nothing."""
+    if on_line:
+        return lambda line: on_line(line.rstrip())
+    if show_output:
+        return _show_line
+    return None
+
+
+def _show_line(line: str):
+    display = line.rstrip()[:100]
+    print(f"  {Colors.GRAY}│{Colors.RESET} {display}")
 
 
-def _estimate_tokens(text: str) -> int:
+DEFAULT_LINE_QUEUE = 4096
+
+
+def _line_queue(on_line: Optional[Callable[[str], None]], policy: Optional[str],
+                usage_label: str) -> Optional[LineQueue]:
+    """
+    Queue that runs a caller's `on_line` off the pipe-reader thread.
+
+    Only caller callbacks get one (and with it a consumer thread): the live
+    display is a short print and stays inline on the reader.
+    ORCHESTRATOR_LINE_QUEUE bounds it (default: 4096 lines; 0 calls on_line
+    inline on the reader, as before); ORCHESTRATOR_LINE_POLICY is the
+    default policy when the call doesn't name one.
+    """
+    size, policy = _line_queue_settings(policy)
+    if on_line is None or size <= 0:
+        return None
+    return LineQueue(_line_consumer(on_line, False), maxsize=size, policy=policy, name=f"on-line:{usage_label}")
+
+
+def _aline_queue(on_line: Optional[Callable[[str], None]], policy: Optional[str]) -> Optional[AsyncLineQueue]:
+    """_line_queue for arun_cli: same settings, drained by a task on the running loop."""
+    size, policy = _line_queue_settings(policy)
+    if on_line is None or size <= 0:
+        return None
+    return AsyncLineQueue(_line_consumer(on_line, False), maxsize=size, policy=policy)
+
+
+def _line_queue_settings(policy: Optional[str]) -> tuple[int, str]:
+    size = _env_int("ORCHESTRATOR_LINE_QUEUE", DEFAULT_LINE_QUEUE)
+    policy = policy or os.getenv("ORCHESTRATOR_LINE_POLICY") or "block"
+    if policy not in LINE_POLICIES:
+        policy = "block"
+    return size, policy
+
+
+def _close_line_queue(queue: Optional[LineQueue], usage_label: str):
+    if queue is None:
+        return
+    queue.close()
+    if queue.dropped:
+        METRICS.inc("cli_lines_dropped_total", queue.dropped, label=usage_label, policy=queue.policy)
+
+
+async def _aclose_line_queue(queue: AsyncLineQueue, usage_label: str):
+    await queue.close()
+    if queue.dropped:
+        METRICS.inc("cli_lines_dropped_total", queue.dropped, label=usage_label, policy=queue.policy)
+
+
+OUTPUT_SPILL_DIR = STATE_DIR / "outputs"
+DEFAULT_OUTPUT_SPILL_KB = 1024
+_OUTPUTS_SWEPT = False
+
+
+def _new_output(text: str = "") -> OutputHandle:
+    """
+    Empty (or pre-filled) transcript handle for one call.
+
+    Transcripts past ORCHESTRATOR_OUTPUT_SPILL_KB (default: 1024) characters
+    move to state/outputs/, keeping only a head and tail in memory.
+    """
+    global _OUTPUTS_SWEPT
+    if not _OUTPUTS_SWEPT:
+        _OUTPUTS_SWEPT = True
+        sweep_stale(OUTPUT_SPILL_DIR)
+    handle = OutputHandle(OUTPUT_SPILL_DIR,
+                          spill_chars=_env_int("ORCHESTRATOR_OUTPUT_SPILL_KB", DEFAULT_OUTPUT_SPILL_KB) * 1024)
+    handle.write(text)
+    return handle
+
+
+def _as_output(output: "str | OutputHandle", code: int, as_handle: bool) -> tuple:
+    if as_handle:
+        return (_new_output(output) if isinstance(output, str) else output), code
+    return as_text(output), code
+
+
+def _cached_output(cache_key: str, usage_label: str, cli: str, model: Optional[str], prompt: str,
+                   workspace: Path = WORKSPACE, cache_mode: str = "on") -> Optional[str]:
+    if cache_mode == "off":
+        return None
+    entry = _load_entry(cache_key, workspace)
+    similar = None
+    if entry is None:
+        entry, similar = _near_duplicate(usage_label, cli, model, prompt, cache_key, workspace)
+    if entry is None:
+        return None
+    effects = entry.get("effects")
+    if effects:
+        if not apply_effects(effects, workspace):
+            return None
+        changed = len(effects.get("files", {})) + len(effects.get("deleted", {}))
+        print(f"  {Colors.GRAY}[cache]{Colors.RESET} replayed {changed} file change(s) for {usage_label}")
+    cached = entry.get("output", "")
+    METRICS.inc("cli_cache_hits_total", label=usage_label)
+    instant("cache hit", "cache", label=usage_label, similarity=similar)
+    _log_usage(f"{usage_label}:cache", cli, model, _estimate_tokens(prompt), _estimate_tokens(cached), 0.0,
+               similarity=similar)
+    print_usage(f"{usage_label}:cache", model, _estimate_tokens(prompt), _estimate_tokens(cached))
+    return cached
+
+
+def _record_output(cache_key: str, usage_label: str, cli: str, model: Optional[str],
+                   prompt: str, output: "str | OutputHandle", elapsed: float,
+                   cache_fields: Optional[dict] = None, reported: Optional[dict] = None, **extra):
+    reported = dict(reported or {})
+    prompt_tokens = reported.pop("in_tokens", None)
+    output_tokens = reported.pop("out_tokens", None)
+    exact = prompt_tokens is not None and output_tokens is not None
+    if not exact:
+        prompt_tokens = _estimate_tokens(prompt)
+        output_tokens = _estimate_tokens(output)
+    if cache_fields is not None:
+        _save_cache(cache_key, output, usage_label, **cache_fields)
+        if _near_dup_enabled(usage_label) and "effects" not in cache_fields:
+            get_neardup_index().add(_near_dup_scope(usage_label, cli, model), cache_key, prompt)
+    _log_usage(usage_label, cli, model, prompt_tokens, output_tokens, elapsed,
+               token_source="reported" if exact else "estimate", **reported, **extra)
+    print_usage(usage_label, model, prompt_tokens, output_tokens, exact=exact)
+
+
+def _estimate_tokens(text: "str | OutputHandle") -> int:
     if not text:
         return 0
     return max(1, int(len(text) / 4))
@@ -221,54 +1884,255 @@ def _default_cache_key(prompt: str, model: Optional[str], usage_label: str) -> s
     return f"{usage_label}:{model}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}"
 
 
-def _cache_path(cache_key: str) -> Path:
-    safe_key = re.sub(r'[^a-zA-Z0-9._-]', "_", cache_key)
-    return CACHE_DIR / f"{safe_key}.json"
+DEFAULT_CACHE_MAX_MB = 512
+DEFAULT_CACHE_MAX_ENTRIES = 10000
 
+# Labels whose answers don't depend on exact wording, so a near-identical
+# prompt may reuse a cached answer.
+DEFAULT_NEARDUP_LABELS = ("tracer:clarify:questions", "orch:locator")
+DEFAULT_NEARDUP_THRESHOLD = 0.9
+
+CACHE_MODES = ("on", "off", "read-only", "record-effects")
+
+# Phases that edit the workspace: replaying only their transcript would
+# leave the workspace behind, so their entries also carry the file changes.
+DEFAULT_CACHE_POLICY = {
+    "rpi:implement": "record-effects",
+    "tracer:execute:implement": "record-effects",
+    "tracer:execute:correct": "record-effects",
+}
 
-def _load_cache(cache_key: str) -> Optional[str]:
+_CACHE = None
+_NEARDUP = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    """
+    Return the workspace response cache.
+
+    ORCHESTRATOR_CACHE_BACKEND selects the layout ("file": one file per key,
+    "pack": single append-only pack file); ORCHESTRATOR_CACHE_MAX_MB and
+    ORCHESTRATOR_CACHE_MAX_ENTRIES bound it (0 disables a limit);
+    ORCHESTRATOR_CACHE_CODEC picks the compression ("zlib", "lzma", "none").
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = make_cache(
+                os.getenv("ORCHESTRATOR_CACHE_BACKEND", "file"),
+                CACHE_DIR,
+                max_bytes=_env_int("ORCHESTRATOR_CACHE_MAX_MB", DEFAULT_CACHE_MAX_MB) * 1024 * 1024,
+                max_entries=_env_int("ORCHESTRATOR_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES),
+                codec=os.getenv("ORCHESTRATOR_CACHE_CODEC", "zlib"),
+            )
+        return _CACHE
+
+
+def _load_entry(cache_key: str, workspace: Path = WORKSPACE) -> Optional[dict]:
     if os.getenv("ORCHESTRATOR_CACHE") == "0":
         return None
-    path = _cache_path(cache_key)
-    if not path.exists():
+    entry = get_cache().get(cache_key)
+    if entry is None:
+        return None
+    deps = entry.get("deps")
+    if deps and not snapshot_matches(deps, workspace):
+        return None
+    return entry
+
+
+def get_neardup_index() -> NearDupIndex:
+    """
+    Return the near-duplicate prompt index (second cache tier).
+
+    ORCHESTRATOR_NEARDUP_THRESHOLD sets the minimum estimated similarity
+    (default: 0.9) for a stored answer to be reused.
+    """
+    global _NEARDUP
+    with _CACHE_LOCK:
+        if _NEARDUP is None:
+            try:
+                threshold = float(os.getenv("ORCHESTRATOR_NEARDUP_THRESHOLD", DEFAULT_NEARDUP_THRESHOLD))
+            except ValueError:
+                threshold = DEFAULT_NEARDUP_THRESHOLD
+            _NEARDUP = NearDupIndex(CACHE_DIR / "neardup.jsonl", threshold=threshold)
+        return _NEARDUP
+
+
+def _near_dup_enabled(usage_label: str) -> bool:
+    return _label_matches(usage_label, "ORCHESTRATOR_NEARDUP_LABELS", DEFAULT_NEARDUP_LABELS)
+
+
+def _near_dup_scope(usage_label: str, cli: str, model: Optional[str]) -> str:
+    return f"{usage_label}|{cli}|{model}"
+
+
+def _near_duplicate(usage_label: str, cli: str, model: Optional[str], prompt: str, cache_key: str,
+                    workspace: Path) -> tuple[Optional[dict], Optional[float]]:
+    """Look up a cached answer to a near-identical prompt for labels marked safe."""
+    if not _near_dup_enabled(usage_label):
+        return None, None
+    match = get_neardup_index().lookup(_near_dup_scope(usage_label, cli, model), prompt)
+    if match is None or match[0] == cache_key:
+        return None, None
+    entry = _load_entry(match[0], workspace)
+    if entry is None or entry.get("effects"):
+        return None, None
+    return entry, round(match[1], 3)
+
+
+def _load_cache(cache_key: str, workspace: Path = WORKSPACE) -> Optional[str]:
+    entry = _load_entry(cache_key, workspace)
+    if entry is None:
+        return None
+    return entry.get("output", "")
+
+
+def _cache_mode(usage_label: str) -> str:
+    """
+    Cache mode for a label: DEFAULT_CACHE_POLICY overridden by
+    ORCHESTRATOR_CACHE_POLICY ("label=mode,..."), longest prefix wins.
+    """
+    if os.getenv("ORCHESTRATOR_CACHE") == "0":
+        return "off"
+    policy = dict(DEFAULT_CACHE_POLICY)
+    for item in os.getenv("ORCHESTRATOR_CACHE_POLICY", "").split(","):
+        if "=" not in item:
+            continue
+        label, mode = (part.strip() for part in item.split("=", 1))
+        if label and mode in CACHE_MODES:
+            policy[label] = mode
+    matches = [label for label in policy if usage_label.startswith(label)]
+    if not matches:
+        return "on"
+    return policy[max(matches, key=len)]
+
+
+def _cache_inputs(depends_on: Optional[list], workspace: Path, cache_mode: str) -> Optional[dict]:
+    """
+    Snapshot what an entry needs before the CLI runs.
+
+    Returns None when this call must not write the cache, otherwise the
+    fields to store (input fingerprint, and for record-effects the paths
+    whose changes to record: depends_on, else the whole workspace).
+    """
+    if cache_mode in ("off", "read-only"):
         return None
+    fields = {}
+    if depends_on:
+        ignore = FINGERPRINT_IGNORE | frozenset(ARTIFACT_DIRS)
+        fields["deps"] = snapshot_paths(depends_on, workspace, ignore=ignore)
+    if cache_mode == "record-effects":
+        fields["_effects_scope"] = [str(path) for path in depends_on or [workspace]]
+    return fields
+
+
+# CLI calls running per workspace in this process, and how many have started
+# there so far: a record-effects diff is only trusted if no other call
+# overlapped it. CallWindow does the same across processes (with fcntl).
+_WORKSPACE_RUNNING: dict[str, int] = {}
+_WORKSPACE_STARTS: dict[str, int] = {}
+_WORKSPACE_LOCK = threading.Lock()
+
+
+@contextmanager
+def _workspace_call(workspace: Path, cache_fields: Optional[dict]):
+    """
+    Mark a CLI call as running in `workspace`; yields the cache fields to run it with.
+
+    A record-effects call takes its before-snapshot here, so the window it
+    diffs over is the one tracked for overlapping calls, in this process and
+    (through lock files under the workspace's state/) in any other.
+    """
+    key = str(Path(workspace).resolve())
+    with _WORKSPACE_LOCK:
+        others = _WORKSPACE_RUNNING.get(key, 0)
+        _WORKSPACE_RUNNING[key] = others + 1
+        started = _WORKSPACE_STARTS[key] = _WORKSPACE_STARTS.get(key, 0) + 1
     try:
-        data = json.loads(path.read_text())
-        return data.get("output", "")
-    except Exception:
+        with CallWindow(Path(workspace) / "state") as window:
+            if cache_fields and "_effects_scope" in cache_fields:
+                cache_fields = dict(cache_fields, _effects_window=(key, others, started, window),
+                                    _effects_before=snapshot_paths(cache_fields["_effects_scope"], workspace))
+            yield cache_fields
+    finally:
+        with _WORKSPACE_LOCK:
+            _WORKSPACE_RUNNING[key] -= 1
+            if not _WORKSPACE_RUNNING[key]:
+                del _WORKSPACE_RUNNING[key]
+
+
+def _cache_effects(cache_fields: Optional[dict], workspace: Path) -> Optional[dict]:
+    """
+    Replace the pre-run snapshot with the diff the run produced.
+
+    Returns None (don't cache) when another call ran in the same workspace
+    during this one, since its edits would be recorded as this call's.
+    Calls that never took a snapshot (HTTP batches) record no effects.
+    """
+    if not cache_fields or "_effects_scope" not in cache_fields:
+        return cache_fields
+    fields = dict(cache_fields)
+    scope = fields.pop("_effects_scope")
+    before = fields.pop("_effects_before", None)
+    window = fields.pop("_effects_window", None)
+    if before is None:
+        return fields
+    key, others, started, call_window = window
+    with _WORKSPACE_LOCK:
+        overlapped = others or _WORKSPACE_STARTS.get(key) != started
+    if overlapped or call_window.overlapped():
+        print(f"  {Colors.YELLOW}[cache]{Colors.RESET} not caching: another call ran in this workspace "
+              f"meanwhile, so its file changes can't be told apart")
         return None
+    effects = capture_effects(before, snapshot_paths(scope, workspace), workspace)
+    if effects is None:
+        return None
+    fields["effects"] = effects
+    return fields
 
 
-def _save_cache(cache_key: str, output_text: str):
+def _save_cache(cache_key: str, output: "str | OutputHandle", usage_label: str, **fields):
+    """Store an entry; labels in ORCHESTRATOR_CACHE_DICT_LABELS compress against the trained dictionary."""
     if os.getenv("ORCHESTRATOR_CACHE") == "0":
         return
     try:
-        CACHE_DIR.mkdir(parents=True, exist_ok=True)
-        data = {"ts": datetime.now().isoformat(), "output": output_text}
-        _cache_path(cache_key).write_text(json.dumps(data, indent=2))
+        entry = {"ts": datetime.now().isoformat()}
+        entry.update(fields)
+        use_dict = _label_matches(usage_label, "ORCHESTRATOR_CACHE_DICT_LABELS", ())
+        if isinstance(output, OutputHandle) and output.spilled:
+            # Stream the spill file into the entry rather than reading it back whole.
+            get_cache().put(cache_key, entry, output=output.chunks(), use_dict=use_dict)
+        else:
+            entry["output"] = as_text(output)
+            get_cache().put(cache_key, entry, use_dict=use_dict)
     except Exception as e:
         print(f"  {Colors.YELLOW}[cache]{Colors.RESET} write failed: {e}")
 
 
+def _label_matches(usage_label: str, env_var: str, default: tuple[str, ...]) -> bool:
+    """Prefix-match a usage label against a comma-separated env list (or a default)."""
+    labels_raw = os.getenv(env_var)
+    if labels_raw is None:
+        labels = default
+    else:
+        labels = tuple(l.strip() for l in labels_raw.split(",") if l.strip())
+    return any(usage_label.startswith(label) for label in labels)
+
+
 def _select_model(config: dict, usage_label: str) -> Optional[str]:
     base_model = config.get("model")
     if "model_flag" not in config or not base_model:
         return base_model
 
-    labels_raw = os.getenv("ORCHESTRATOR_CHEAP_LABELS")
-    if labels_raw is None:
-        labels = DEFAULT_CHEAP_LABELS
-    else:
-        labels = tuple(l.strip() for l in labels_raw.split(",") if l.strip())
-
-    use_cheap = any(usage_label.startswith(label) for label in labels)
-    if not use_cheap:
+    if not _label_matches(usage_label, "ORCHESTRATOR_CHEAP_LABELS", DEFAULT_CHEAP_LABELS):
         return base_model
 
     return os.getenv("ORCHESTRATOR_CHEAP_MODEL") or config.get("cheap_model") or base_model
 
 
-def _log_usage(label: str, cli: str, model: Optional[str], in_tokens: int, out_tokens: int, elapsed: float):
+def _log_usage(label: str, cli: str, model: Optional[str], in_tokens: int, out_tokens: int, elapsed: float,
+               **extra):
     usage = {
         "ts": datetime.now().isoformat(),
         "label": label,
@@ -279,18 +2143,98 @@ def _log_usage(label: str, cli: str, model: Optional[str], in_tokens: int, out_t
         "total_tokens": in_tokens + out_tokens,
         "elapsed_sec": round(elapsed, 3),
     }
-    try:
-        USAGE_LOG.parent.mkdir(parents=True, exist_ok=True)
-        with USAGE_LOG.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(usage) + "\n")
-    except Exception as e:
-        print(f"  {Colors.YELLOW}[usage]{Colors.RESET} log write failed: {e}")
+    usage.update({k: v for k, v in extra.items() if v is not None})
+    call = _CALL.get()
+    if call is not None and not label.endswith(":cache"):
+        if call.queue_wait_sec is not None:
+            usage.setdefault("queue_wait_sec", call.queue_wait_sec)
+        if call.host_wait_sec is not None:
+            usage.setdefault("host_slot_wait_sec", call.host_wait_sec)
+        call.tokens = in_tokens + out_tokens
+    get_usage_writer().write(usage)
+
+    # Cache hits are logged with the tokens they would have cost.
+    tokens_metric = "cache_saved_tokens_total" if label.endswith(":cache") else "cli_tokens_total"
+    METRICS.inc(tokens_metric, in_tokens, label=label, model=model or "default", direction="in")
+    METRICS.inc(tokens_metric, out_tokens, label=label, model=model or "default", direction="out")
+    _touch_exporter()
+
 
+_USAGE_WRITER: Optional[UsageLogWriter] = None
+_USAGE_WRITER_LOCK = threading.Lock()
 
-def print_usage(label: str, model: Optional[str], in_tokens: int, out_tokens: int):
+
+def get_usage_writer() -> UsageLogWriter:
+    """
+    Return the background writer for state/usage.jsonl.
+
+    ORCHESTRATOR_USAGE_MAX_MB rotates the log past that size (default: 64,
+    0 disables), ORCHESTRATOR_USAGE_ROTATE_DAILY=0 stops the daily rotation,
+    ORCHESTRATOR_USAGE_GZIP=1 compresses rotated segments.
+    """
+    global _USAGE_WRITER
+    with _USAGE_WRITER_LOCK:
+        if _USAGE_WRITER is None:
+            _USAGE_WRITER = UsageLogWriter(
+                USAGE_LOG,
+                max_bytes=_env_int("ORCHESTRATOR_USAGE_MAX_MB", 64) * 1024 * 1024,
+                rotate_daily=os.getenv("ORCHESTRATOR_USAGE_ROTATE_DAILY", "1") != "0",
+                compress=os.getenv("ORCHESTRATOR_USAGE_GZIP") == "1",
+            )
+            atexit.register(_USAGE_WRITER.close)
+        return _USAGE_WRITER
+
+
+_PROM_EXPORTER: Optional[TextfileExporter] = None
+_PROM_LOCK = threading.Lock()
+DEFAULT_PROM_INTERVAL = 15.0
+
+
+def get_prom_exporter() -> Optional[TextfileExporter]:
+    """
+    Return the Prometheus textfile exporter, or None when it is off.
+
+    ORCHESTRATOR_PROM_FILE enables it: a path to the `.prom` file (point it
+    into node_exporter's --collector.textfile.directory), or 1 for
+    state/orchestrator.prom. Each process writes its own file, named after
+    its instance (`orchestrator-<instance>.prom`), and labels its series
+    instance_id="<instance>". ORCHESTRATOR_PROM_INSTANCE names the instance
+    and keeps its file after exit; by default it is the pid and the file is
+    removed at exit. ORCHESTRATOR_PROM_INTERVAL sets how often the file is
+    rewritten (default: 15 seconds).
+    """
+    global _PROM_EXPORTER
+    target = os.getenv("ORCHESTRATOR_PROM_FILE")
+    if not target or target == "0":
+        return None
+    with _PROM_LOCK:
+        if _PROM_EXPORTER is None:
+            path = STATE_DIR / "orchestrator.prom" if target == "1" else Path(target).expanduser()
+            instance = os.getenv("ORCHESTRATOR_PROM_INSTANCE") or str(os.getpid())
+            path = path.with_name(f"{path.stem}-{instance}{path.suffix or '.prom'}")
+            try:
+                interval = float(os.getenv("ORCHESTRATOR_PROM_INTERVAL", DEFAULT_PROM_INTERVAL))
+            except ValueError:
+                interval = DEFAULT_PROM_INTERVAL
+            _PROM_EXPORTER = TextfileExporter(path, METRICS, interval, labels={"instance_id": instance},
+                                              remove_on_close=not os.getenv("ORCHESTRATOR_PROM_INSTANCE"))
+            _PROM_EXPORTER.start()
+            atexit.register(_PROM_EXPORTER.close)
+        return _PROM_EXPORTER
+
+
+def _touch_exporter():
+    exporter = get_prom_exporter()
+    if exporter is not None:
+        exporter.touch()
+
+
+def print_usage(label: str, model: Optional[str], in_tokens: int, out_tokens: int, exact: bool = False):
     total = in_tokens + out_tokens
     model_note = f" model={model}" if model else ""
-    print(f"  {Colors.GRAY}[usage]{Colors.RESET} {label}:{model_note} in≈{in_tokens} out≈{out_tokens} total≈{total}")
+    sign = "=" if exact else "≈"
+    print(f"  {Colors.GRAY}[usage]{Colors.RESET} {label}:{model_note} "
+          f"in{sign}{in_tokens} out{sign}{out_tokens} total{sign}{total}")
 
 
 # ============================================================================
@@ -394,6 +2338,21 @@ def save_state(state: LoopState, state_file: Path):
     state_file.parent.mkdir(parents=True, exist_ok=True)
     state.last_activity = datetime.now().isoformat()
     state_file.write_text(json.dumps(state.to_dict(), indent=2))
+    _observe_state(state)
+
+
+def _observe_state(state: LoopState):
+    """Mirror loop progress into METRICS gauges for the textfile exporter."""
+    mode = state.mode
+    METRICS.set("loop_iteration", state.iteration, mode=mode)
+    METRICS.set("loop_version", state.version, mode=mode)
+    METRICS.set("loop_last_activity_timestamp_seconds", time.time(), mode=mode)
+    if mode == "rpi":
+        METRICS.set("rpi_score", state.score, story=state.current_story)
+    elif mode == "tracer":
+        METRICS.set("tracer_deviations_detected", state.deviations_detected)
+        METRICS.set("tracer_deviations_corrected", state.deviations_corrected)
+    _touch_exporter()
 
 
 # ============================================================================
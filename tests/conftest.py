@@ -0,0 +1,56 @@
+"""
+Shared test setup.
+
+controller.utils resolves the workspace (and with it state/, the cache and
+the usage log) from the working directory when it is imported, so the
+suite runs from a throwaway directory with the ORCHESTRATOR_* variables of
+the calling shell cleared.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+WORKSPACE = Path(tempfile.mkdtemp(prefix="orchestrator-tests-")).resolve()
+
+sys.path.insert(0, str(REPO_ROOT))
+
+
+def pytest_sessionstart(session):
+    # Runs after pytest has resolved its arguments, before test modules import controller.
+    os.chdir(WORKSPACE)
+    for name in list(os.environ):
+        if name.startswith(("ORCHESTRATOR_", "TRACER_")):
+            del os.environ[name]
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_CACHE", "0")
+
+
+@pytest.fixture
+def fake_cli(tmp_path, monkeypatch):
+    """
+    Register tests/fake_cli.py as the "fake" CLI, with a fresh cache.
+
+    Returns a function giving the number of times the CLI was spawned.
+    """
+    from controller import utils
+
+    log = tmp_path / "spawns.log"
+    monkeypatch.setenv("FAKE_CLI_LOG", str(log))
+    monkeypatch.setitem(utils.CLI_CONFIGS, "fake", {
+        "cmd": sys.executable,
+        "args": [str(REPO_ROOT / "tests" / "fake_cli.py")],
+        "prompt_flag": "-p",
+        "prompt_file_flag": "--prompt-file",
+        "stdin_prompt": True,
+    })
+    monkeypatch.setattr(utils, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(utils, "_CACHE", None)
+    monkeypatch.setattr(utils, "_NEARDUP", None)
+    return lambda: len(log.read_text().splitlines()) if log.exists() else 0
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Stand-in agent CLI for the run_cli tests.
+
+Takes the prompt after -p, from the file after --prompt-file, or from
+stdin, and acts on its first word:
+
+    echo ...     print how the prompt arrived and the prompt itself
+    sleep S ...  wait S seconds, then echo
+    lines N      print N numbered lines
+    write F ...  write the prompt to file F (in the working directory), then echo
+    hang         print one line, then go quiet for a minute
+    exit N ...   echo, then exit with status N
+
+With --stream-json it answers "echo" prompts as a claude stream-json event
+stream instead, reporting 12 input and 3 output tokens.
+
+Each run appends a line to $FAKE_CLI_LOG so tests can count spawns.
+"""
+import json
+import os
+import sys
+import time
+
+
+def read_prompt(argv):
+    if "-p" in argv:
+        return "argv", argv[argv.index("-p") + 1]
+    if "--prompt-file" in argv:
+        with open(argv[argv.index("--prompt-file") + 1], encoding="utf-8") as f:
+            return "file", f.read()
+    return "stdin", sys.stdin.read()
+
+
+def stream_json(prompt):
+    events = [
+        {"type": "system", "subtype": "init"},
+        {"type": "assistant", "message": {"content": [{"type": "tool_use", "name": "Read"}]}},
+        {"type": "assistant", "message": {"content": [{"type": "text", "text": f"thinking about {prompt}"}]}},
+        {"type": "result", "result": prompt, "total_cost_usd": 0.01,
+         "usage": {"input_tokens": 2, "cache_read_input_tokens": 10, "output_tokens": 3}},
+    ]
+    print("warning: not an event")
+    for event in events:
+        print(json.dumps(event), flush=True)
+
+
+def main():
+    via, prompt = read_prompt(sys.argv[1:])
+    if os.getenv("FAKE_CLI_LOG"):
+        with open(os.environ["FAKE_CLI_LOG"], "a") as log:
+            log.write(f"{via}\n")
+    words = prompt.split()
+    command = words[0] if words else "echo"
+    if "--stream-json" in sys.argv:
+        stream_json(prompt)
+        return
+    if command == "sleep":
+        time.sleep(float(words[1]))
+    elif command == "lines":
+        for i in range(int(words[1])):
+            print(f"line {i}")
+        return
+    elif command == "write":
+        with open(words[1], "w", encoding="utf-8") as f:
+            f.write(prompt)
+    elif command == "hang":
+        print("working...", flush=True)
+        time.sleep(60)
+    print(f"via={via}")
+    print(prompt)
+    if command == "exit":
+        sys.exit(int(words[1]))
+
+
+if __name__ == "__main__":
+    main()
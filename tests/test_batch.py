@@ -0,0 +1,25 @@
+"""run_cli_batch with local groups against tests/fake_cli.py."""
+import time
+
+from controller import utils
+
+
+def test_cache_hits_come_first_and_misses_run_locally(fake_cli):
+    utils.run_cli("fake", "echo cached", show_output=False, usage_label="batch")
+    results = list(utils.run_cli_batch("fake", ["echo one", "echo cached", "echo two"]))
+    assert results[0] == utils.BatchResult(1, "via=argv\necho cached\n", 0, "cache")
+    assert sorted((r.index, r.source, r.code) for r in results) == [(0, "local", 0), (1, "cache", 0),
+                                                                    (2, "local", 0)]
+    assert fake_cli() == 3
+
+
+def test_closing_the_generator_stops_the_group(fake_cli, no_cache, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_BATCH_WORKERS", "1")
+    batch = utils.run_cli_batch("fake", ["sleep 0.5 first"] + [f"echo {i}" for i in range(20)])
+    first = next(batch)
+    batch.close()
+    spawned = fake_cli()
+    time.sleep(0.5)
+    assert first.code == 0
+    assert spawned == fake_cli() < 21
+    assert not [t for t in utils.threading.enumerate() if t.name.startswith("batch:fake")]
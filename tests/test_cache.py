@@ -0,0 +1,158 @@
+"""Response cache backends and entry codecs."""
+import threading
+
+import pytest
+
+from controller import utils
+from controller.cache import EntryCodec, benchmark_codecs, make_cache
+from controller.output import OutputHandle
+
+TEXT = "".join(f"line {i} é中 \"quoted\" \\ tab\t\n" for i in range(5000))
+
+
+@pytest.mark.parametrize("codec", ["none", "zlib", "lzma"])
+def test_encode_stream_matches_encode(codec):
+    entry_codec = EntryCodec(codec)
+    entry = {"ts": "now", "inputs": {"a": 1}}
+    streamed = b"".join(entry_codec.encode_stream(entry, [TEXT[:100], TEXT[100:], ""]))
+    assert entry_codec.decode(streamed) == {**entry, "output": TEXT}
+    assert entry_codec.decode(entry_codec.encode({**entry, "output": TEXT})) == {**entry, "output": TEXT}
+
+
+@pytest.mark.parametrize("backend", ["file", "pack"])
+def test_put_streams_output(tmp_path, backend):
+    cache = make_cache(backend, tmp_path / backend)
+    cache.put("key", {"ts": "now"}, output=iter([TEXT[:7], TEXT[7:]]))
+    assert cache.get("key") == {"ts": "now", "output": TEXT}
+
+
+def test_spilled_output_is_streamed_into_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "_CACHE", None, raising=False)
+    handle = OutputHandle(spill_dir=tmp_path, spill_chars=1024)
+    handle.write(TEXT)
+    assert handle.spilled
+    monkeypatch.setattr(OutputHandle, "text", lambda self: pytest.fail("read the spill file back whole"))
+    utils._save_cache("spilled-key", handle, "test")
+    assert utils.get_cache().get("spilled-key")["output"] == "".join(handle.chunks())
+
+
+def test_dictionary_is_opt_in(tmp_path):
+    codec = EntryCodec("zlib", dict_dir=tmp_path)
+    assert codec.train([TEXT, TEXT[:5000]])
+    entry = {"output": TEXT}
+    plain, with_dict = codec.encode(entry), codec.encode(entry, use_dict=True)
+    assert plain.startswith(b"TC1 zlib -\n")
+    assert with_dict.startswith(b"TC1 zlib-dict ")
+    assert codec.decode(plain) == codec.decode(with_dict) == entry
+
+
+def test_pack_eviction_order_survives_a_restart(tmp_path):
+    cache = make_cache("pack", tmp_path, max_entries=3)
+    cache.put("a", {"output": "a"})
+    cache.put("b", {"output": "b"})
+    assert cache.get("a")
+    cache.put("c", {"output": "c"})  # also records the hit on "a"
+    reopened = make_cache("pack", tmp_path, max_entries=3)
+    reopened.put("d", {"output": "d"})
+    assert reopened.get("b") is None
+    assert reopened.get("a") and reopened.get("c") and reopened.get("d")
+
+
+def test_pack_compaction_keeps_writes_made_while_copying(tmp_path, monkeypatch):
+    cache = make_cache("pack", tmp_path, max_entries=3)
+    for key in "abcde":
+        cache.put(key, {"output": key * 1000})
+    copy_live = cache._copy_live
+
+    def copy_then_write(snapshot, pack_tmp):
+        moved = copy_live(snapshot, pack_tmp)
+        writer = make_cache("pack", tmp_path, max_entries=3)
+        writer.put("f", {"output": "f" * 1000})
+        return moved
+
+    monkeypatch.setattr(cache, "_copy_live", copy_then_write)
+    assert cache.compact() > 0
+    reopened = make_cache("pack", tmp_path, max_entries=3)
+    assert [reopened.get(key)["output"][0] for key in "def"] == ["d", "e", "f"]
+    assert reopened.get("a") is None and reopened.get("c") is None
+
+
+def test_pack_put_compacts_in_the_background(tmp_path, monkeypatch):
+    cache = make_cache("pack", tmp_path, max_entries=1)
+    monkeypatch.setattr(cache, "auto_compact_bytes", 0)
+    started = []
+    monkeypatch.setattr(cache, "compact", lambda: started.append(threading.current_thread().name))
+    cache.put("a", {"output": "a" * 10000})
+    cache.put("b", {"output": "b"})
+    cache._compactor.join(5)
+    assert started == ["cache-compact"]
+
+
+@pytest.mark.parametrize("cold", [False, True])
+def test_benchmark_reports_read_and_decode_per_codec(tmp_path, cold):
+    outputs = [f"[tool] Read file src/module_{i % 5}.py\nresult {i}\n" * 20 for i in range(40)]
+    rows = benchmark_codecs(outputs, dict_dir=tmp_path, rounds=1, cold=cold)
+    by_codec = {row["codec"]: row for row in rows}
+    assert list(by_codec)[:4] == ["file read (baseline)", "none", "zlib", "lzma"]
+    assert by_codec["file read (baseline)"]["ratio"] == 1.0
+    assert by_codec["zlib"]["bytes"] < by_codec["none"]["bytes"]
+    for row in rows:
+        assert row["hit_us"] == pytest.approx(row["read_us"] + row["decode_us"])
+
+
+@pytest.mark.parametrize("backend", ["file", "pack"])
+def test_entry_limit_evicts_least_recently_used(tmp_path, backend):
+    cache = make_cache(backend, tmp_path, max_entries=2)
+    cache.put("a", {"output": "a"})
+    cache.put("b", {"output": "b"})
+    assert cache.get("a")
+    cache.put("c", {"output": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.stats.evictions == 1
+
+
+@pytest.mark.parametrize("backend", ["file", "pack"])
+def test_size_limit_keeps_the_newest_entry(tmp_path, backend):
+    cache = make_cache(backend, tmp_path, max_bytes=3000, codec="none")
+    for key in "abc":
+        cache.put(key, {"output": key * 1000})
+    entries, size = cache.usage()
+    assert size <= 3000 and entries < 3
+    cache.put("big", {"output": "x" * 10000})
+    assert cache.get("big")["output"] == "x" * 10000
+    assert cache.usage()[0] == 1
+
+
+def test_file_cache_recency_survives_a_restart(tmp_path):
+    cache = make_cache("file", tmp_path)
+    for key in "abc":
+        cache.put(key, {"output": key})
+    assert cache.get("a")
+    reopened = make_cache("file", tmp_path, max_entries=2)
+    assert reopened.prune() == 1
+    assert reopened.get("b") is None
+    assert reopened.get("a") and reopened.get("c")
+
+
+def test_pack_sees_writes_and_evictions_from_another_instance(tmp_path):
+    writer = make_cache("pack", tmp_path, max_entries=2)
+    reader = make_cache("pack", tmp_path, max_entries=2)
+    writer.put("a", {"output": "a"})
+    assert reader.get("a") == {"output": "a"}
+    writer.put("b", {"output": "b"})
+    writer.put("c", {"output": "c"})
+    assert reader.get("a") is None
+    assert reader.get("c") == {"output": "c"}
+
+
+def test_pack_ignores_a_torn_index_line(tmp_path):
+    cache = make_cache("pack", tmp_path)
+    cache.put("a", {"output": "a"})
+    with open(tmp_path / "cache.idx", "a") as f:
+        f.write("b\t12")
+    reopened = make_cache("pack", tmp_path)
+    assert reopened.get("a") == {"output": "a"}
+    assert reopened.get("b") is None
+    reopened.put("b", {"output": "b"})
+    assert make_cache("pack", tmp_path).get("b") == {"output": "b"}
@@ -0,0 +1,59 @@
+"""Workspace fingerprints behind depends_on cache entries."""
+import os
+
+from controller import utils
+from controller.cache import snapshot_matches, snapshot_paths
+
+
+def make_tree(root):
+    (root / "src").mkdir()
+    (root / "src" / "a.py").write_text("a = 1\n")
+    (root / "state").mkdir()
+    (root / "state" / "log").write_text("")
+    return root
+
+
+def test_touching_a_file_keeps_the_snapshot(tmp_path):
+    root = make_tree(tmp_path)
+    snapshot = snapshot_paths([root / "src"], root)
+    st = (root / "src" / "a.py").stat()
+    os.utime(root / "src" / "a.py", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert snapshot_matches(snapshot, root)
+
+
+def test_edits_additions_and_removals_invalidate(tmp_path):
+    root = make_tree(tmp_path)
+    snapshot = snapshot_paths([root / "src", root / "missing.txt"], root)
+    assert snapshot_matches(snapshot, root)
+
+    (root / "src" / "a.py").write_text("a = 2\n")
+    assert not snapshot_matches(snapshot, root)
+    (root / "src" / "a.py").write_text("a = 1\n")
+    assert snapshot_matches(snapshot, root)
+
+    (root / "src" / "b.py").write_text("")
+    assert not snapshot_matches(snapshot, root)
+    (root / "src" / "b.py").unlink()
+
+    (root / "missing.txt").write_text("now here")
+    assert not snapshot_matches(snapshot, root)
+
+
+def test_ignored_directories_do_not_invalidate(tmp_path):
+    root = make_tree(tmp_path)
+    snapshot = snapshot_paths([root], root)
+    (root / "state" / "log").write_text("written on every call")
+    (root / "state" / "new").write_text("")
+    assert snapshot_matches(snapshot, root)
+
+
+def test_run_cli_recomputes_once_a_dependency_changes(fake_cli, tmp_path):
+    (tmp_path / "ws").mkdir()
+    root = make_tree(tmp_path / "ws")
+    call = dict(show_output=False, usage_label="test", workspace=root, depends_on=[root / "src"])
+    first = utils.run_cli("fake", "echo deps", **call)
+    assert utils.run_cli("fake", "echo deps", **call) == first
+    assert fake_cli() == 1
+    (root / "src" / "a.py").write_text("a = 2\n")
+    utils.run_cli("fake", "echo deps", **call)
+    assert fake_cli() == 2
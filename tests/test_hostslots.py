@@ -0,0 +1,93 @@
+"""Host-wide call slots shared across processes."""
+import json
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from controller import utils
+from controller.hostslots import HostSemaphore, parse_slot_counts
+from conftest import REPO_ROOT
+
+HOLDER = """
+import subprocess, sys, time
+sys.path.insert(0, sys.argv[1])
+from controller.hostslots import HostSemaphore
+lease = HostSemaphore(sys.argv[2], 1).acquire({"label": "holder"})
+if sys.argv[3] == "orphan":
+    child = subprocess.Popen(["sleep", "30"], pass_fds=[lease._fd])
+    print(child.pid, flush=True)
+else:
+    print("held", flush=True)
+    time.sleep(float(sys.argv[3]))
+"""
+
+pytestmark = pytest.mark.skipif(not HostSemaphore.supported(), reason="needs fcntl")
+
+
+def hold(directory, how):
+    process = subprocess.Popen([sys.executable, "-c", HOLDER, str(REPO_ROOT), str(directory), how],
+                               stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+def test_slots_are_exclusive_and_record_their_holder(tmp_path):
+    semaphore = HostSemaphore(tmp_path, 2)
+    first = semaphore.try_acquire({"label": "a"})
+    second = semaphore.try_acquire({"label": "b"})
+    assert first and second and first.path != second.path
+    assert semaphore.try_acquire({"label": "c"}) is None
+    rows = semaphore.status()
+    assert [row["state"] for row in rows] == ["held", "held"]
+    assert {row["label"] for row in rows} == {"a", "b"}
+    assert all(row["pid"] == os.getpid() for row in rows)
+    first.release()
+    assert semaphore.try_acquire({"label": "c"}) is not None
+    assert sorted(row["state"] for row in semaphore.status()) == ["held", "held"]
+
+
+def test_a_killed_holder_frees_its_slot(tmp_path):
+    process, _ = hold(tmp_path, "30")
+    semaphore = HostSemaphore(tmp_path, 1)
+    try:
+        assert semaphore.try_acquire({}) is None
+        assert semaphore.status()[0]["label"] == "holder"
+    finally:
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+    lease = semaphore.acquire({})
+    assert lease.waited < 1
+    lease.release()
+    assert semaphore.status() == [{"slot": 0, "state": "free"}]
+
+
+def test_a_lock_inherited_by_a_child_shows_as_orphaned(tmp_path):
+    process, child_pid = hold(tmp_path, "orphan")
+    process.wait()
+    try:
+        (row,) = HostSemaphore(tmp_path, 1).status()
+        assert row["state"] == "orphaned" and row["label"] == "holder"
+    finally:
+        os.kill(int(child_pid), signal.SIGKILL)
+
+
+def test_parse_slot_counts():
+    assert parse_slot_counts("8") == {"*": 8}
+    assert parse_slot_counts("claude=4, api=16,bad=x") == {"claude": 4, "api": 16}
+
+
+def test_run_cli_waits_for_a_slot_held_by_another_process(fake_cli, no_cache, monkeypatch, tmp_path):
+    monkeypatch.setenv("ORCHESTRATOR_HOST_SLOTS", "fake=1")
+    monkeypatch.setenv("ORCHESTRATOR_HOST_SLOTS_DIR", str(tmp_path))
+    monkeypatch.setattr(utils, "_HOST_SEMAPHORES", {})
+    process, _ = hold(tmp_path / "fake", "0.5")
+    try:
+        assert utils.run_cli("fake", "echo slot", show_output=False, usage_label="test:slots")[1] == 0
+    finally:
+        process.wait()
+    utils.get_usage_writer().flush()
+    record = [json.loads(line) for line in utils.USAGE_LOG.read_text().splitlines() if '"test:slots"' in line][-1]
+    assert record["host_slot_wait_sec"] >= 0.3
+    assert utils.host_slot_status()["fake"]["rows"] == [{"slot": 0, "state": "free"}]
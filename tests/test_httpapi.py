@@ -0,0 +1,147 @@
+"""HTTP backend against a local stand-in for the Messages API."""
+import asyncio
+import http.client
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from controller import utils
+from controller.httpapi import HTTPBackend, HTTPBackendError
+
+
+def _event(name: str, data: dict) -> bytes:
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Streams "Hello world\\ndone"; prompt "fail" gets a 429, "truncate" a cut-off stream."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][0]["content"]
+        if prompt == "fail":
+            detail = b'{"error": {"message": "rate limited"}}'
+            self.send_response(429)
+            self.send_header("Content-Length", str(len(detail)))
+            self.end_headers()
+            self.wfile.write(detail)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._chunk(_event("message_start", {"type": "message_start",
+                                             "message": {"usage": {"input_tokens": 7, "output_tokens": 1}}}))
+        if prompt == "truncate":
+            self.wfile.write(b"100\r\npartial")
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        for text in ("Hello", " world\n", "done"):
+            encoded = _event("content_block_delta", {"type": "content_block_delta",
+                                                     "delta": {"type": "text_delta", "text": text}})
+            # Split events across chunks so the parser has to reassemble them.
+            self._chunk(encoded[:9])
+            self._chunk(encoded[9:])
+        self._chunk(_event("message_delta", {"type": "message_delta", "usage": {"output_tokens": 3}}))
+        self._chunk(_event("message_stop", {"type": "message_stop"}))
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def backend(server_url):
+    backend = HTTPBackend(server_url, model="stub-model")
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def stub_entry(server_url, monkeypatch, no_cache):
+    monkeypatch.setitem(utils.CLI_CONFIGS, "stub-http", {"backend": "http", "url": server_url,
+                                                          "model": "stub-model"})
+    yield "stub-http"
+    utils.shutdown_http_backends()
+
+
+def test_stream_yields_text_and_usage(backend):
+    completion = backend.stream("hello", None, 5)
+    try:
+        assert "".join(completion) == "Hello world\ndone"
+        usage = completion.usage()
+    finally:
+        completion.close()
+    assert usage["in_tokens"] == 7
+    assert usage["out_tokens"] == 3
+
+
+def test_non_200_raises_backend_error(backend):
+    with pytest.raises(HTTPBackendError) as info:
+        backend.stream("fail", None, 5)
+    assert info.value.status == 429
+    assert "rate limited" in str(info.value)
+
+
+def test_truncated_stream_raises(backend):
+    completion = backend.stream("truncate", None, 5)
+    try:
+        with pytest.raises((http.client.HTTPException, HTTPBackendError)):
+            "".join(completion)
+    finally:
+        completion.close()
+
+
+def test_connection_is_reused(backend):
+    for _ in range(3):
+        completion = backend.stream("hello", None, 5)
+        "".join(completion)
+        completion.close()
+    stats = backend.pool.stats()
+    assert stats["created"] == 1
+    assert stats["reused"] == 2
+
+
+def test_run_cli_over_http(stub_entry):
+    output, code = utils.run_cli(stub_entry, "hello", show_output=False, usage_label="test:http")
+    assert (output, code) == ("Hello world\ndone", 0)
+
+
+def test_arun_cli_over_http_delivers_lines_on_the_loop(stub_entry):
+    seen = []
+
+    async def main():
+        loop_thread = threading.get_ident()
+        result = await utils.arun_cli(stub_entry, "hello", show_output=False, usage_label="test:http",
+                                      on_line=lambda line: seen.append((line, threading.get_ident() == loop_thread)),
+                                      line_policy="coalesce")
+        return result
+
+    assert asyncio.run(main()) == ("Hello world\ndone", 0)
+    assert seen == [("Hello world", True), ("done", True)]
+
+
+@pytest.mark.parametrize("prompt", ["fail", "truncate"])
+def test_run_cli_reports_http_failures(stub_entry, prompt):
+    output, code = utils.run_cli(stub_entry, prompt, show_output=False, usage_label="test:http")
+    assert code == -1
+    assert output.startswith("[ERROR]")
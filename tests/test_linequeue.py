@@ -0,0 +1,145 @@
+"""Bounded on_line delivery queues."""
+import asyncio
+import threading
+
+import pytest
+
+from controller import utils
+from controller.linequeue import AsyncLineQueue, LineQueue
+
+
+class GatedSink:
+    """Callback that holds the consumer thread on the first line until released."""
+
+    def __init__(self):
+        self.seen = []
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, line):
+        self.entered.set()
+        self.gate.wait(5)
+        self.seen.append(line)
+
+
+def fill(policy, count=10, maxsize=3):
+    sink = GatedSink()
+    queue = LineQueue(sink, maxsize=maxsize, policy=policy)
+    queue.put("0")
+    assert sink.entered.wait(5)
+    for i in range(1, count):
+        queue.put(str(i))
+    sink.gate.set()
+    queue.close(5)
+    return queue, sink.seen
+
+
+def test_drop_reports_what_it_discarded():
+    queue, seen = fill("drop")
+    assert seen == ["0", "1", "2", "3", "[... 6 line(s) dropped]"] and queue.dropped == 6
+
+
+def test_coalesce_keeps_the_newest():
+    queue, seen = fill("coalesce")
+    assert seen == ["0", "7", "8", "9"] and queue.dropped == 6
+
+
+def test_block_waits_for_room_and_loses_nothing():
+    sink = GatedSink()
+    queue = LineQueue(sink, maxsize=2, policy="block")
+    queue.put("0")
+    assert sink.entered.wait(5)
+    producer = threading.Thread(target=lambda: [queue.put(str(i)) for i in range(1, 6)])
+    producer.start()
+    producer.join(0.2)
+    assert producer.is_alive()
+    sink.gate.set()
+    producer.join(5)
+    queue.close(5)
+    assert sink.seen == [str(i) for i in range(6)] and queue.dropped == 0
+
+
+def test_a_failing_callback_does_not_stop_delivery():
+    seen = []
+
+    def callback(line):
+        if line == "bad":
+            raise RuntimeError(line)
+        seen.append(line)
+
+    queue = LineQueue(callback)
+    for line in ("a", "bad", "b"):
+        queue.put(line)
+    queue.close(5)
+    assert seen == ["a", "b"] and queue.errors == 1
+
+
+@pytest.mark.parametrize("policy", ["block", "drop", "coalesce"])
+def test_run_cli_line_policy(fake_cli, no_cache, monkeypatch, policy):
+    monkeypatch.setenv("ORCHESTRATOR_LINE_QUEUE", "10")
+    sink = GatedSink()
+    sink.gate.set()
+    output, code = utils.run_cli("fake", "lines 2000", show_output=False, usage_label="test",
+                                 on_line=sink, line_policy=policy)
+    assert code == 0 and output.count("\n") == 2000
+    if policy == "block":
+        assert sink.seen == [f"line {i}" for i in range(2000)]
+    elif policy == "drop":
+        assert sink.seen[0] == "line 0"
+        assert sink.seen[-1] == "line 1999" or sink.seen[-1].endswith("line(s) dropped]")
+    else:
+        assert sink.seen[-1] == "line 1999"
+
+
+def drain_async(policy, lines, maxsize=3):
+    seen = []
+
+    async def main():
+        queue = AsyncLineQueue(seen.append, maxsize=maxsize, policy=policy)
+        for line in lines:
+            queue.put(line)
+        await queue.close()
+        return queue
+
+    return asyncio.run(main()), seen
+
+
+def test_async_block_keeps_every_line():
+    queue, seen = drain_async("block", [str(i) for i in range(10)])
+    assert seen == [str(i) for i in range(10)] and queue.dropped == 0
+
+
+def test_async_drop_reports_what_it_discarded():
+    queue, seen = drain_async("drop", [str(i) for i in range(10)])
+    assert seen == ["0", "1", "2", "[... 7 line(s) dropped]"] and queue.dropped == 7
+
+
+def test_async_coalesce_keeps_the_newest():
+    queue, seen = drain_async("coalesce", [str(i) for i in range(10)])
+    assert seen == ["7", "8", "9"] and queue.dropped == 7
+
+
+def test_async_block_producer_waits_for_room():
+    seen = []
+
+    async def main():
+        queue = AsyncLineQueue(seen.append, maxsize=2)
+        queue.put("a")
+        queue.put("b")
+        waiting = asyncio.ensure_future(queue.room())
+        await asyncio.sleep(0)
+        assert seen == [] or waiting.done()
+        await asyncio.wait_for(waiting, 1)
+        await queue.close()
+
+    asyncio.run(main())
+    assert seen == ["a", "b"]
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        asyncio.run(_make("newest"))
+
+
+async def _make(policy):
+    AsyncLineQueue(print, policy=policy)
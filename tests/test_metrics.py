@@ -0,0 +1,64 @@
+"""Metrics registry and per-call phase timings."""
+import json
+
+import pytest
+
+from controller import utils
+from controller.metrics import CallTimings, Histogram, MetricsRegistry
+
+
+def test_histogram_buckets_and_quantiles():
+    hist = Histogram(buckets=(1, 2, 5))
+    for value in (0.5, 1.5, 1.5, 4, 9):
+        hist.observe(value)
+    assert hist.counts == [1, 2, 1, 1]
+    assert hist.quantile(0.5) == 2
+    assert hist.quantile(1.0) == 9
+    assert hist.mean == pytest.approx(16.5 / 5)
+
+
+def test_registry_keys_series_by_labels():
+    registry = MetricsRegistry()
+    registry.inc("calls", label="a")
+    registry.inc("calls", 2, label="a")
+    registry.inc("calls", label="b")
+    registry.add("in_flight", 1, label="a")
+    registry.add("in_flight", -1, label="a")
+    with registry.timer("block_seconds", label="a"):
+        pass
+    assert registry.counter("calls", label="a") == 3
+    assert registry.counter("calls", label="b") == 1
+    snapshot = registry.snapshot()
+    assert snapshot["gauges"] == [("in_flight", {"label": "a"}, 0)]
+    assert snapshot["histograms"][0][2]["count"] == 1
+    registry.reset()
+    assert registry.counter("calls", label="a") == 0
+
+
+def test_call_timings_phases_and_gaps():
+    timings = CallTimings()
+    timings.start = 100.0
+    timings.spawned = 100.5
+    timings.mark_bytes(102.0)
+    timings.mark_lines(3, 102.0)
+    timings.mark_bytes(106.0)
+    timings.mark_lines(1, 106.0)
+    timings.eof, timings.exited = 106.0, 106.25
+    assert timings.phases() == {"spawn_sec": 0.5, "first_byte_sec": 2.0, "last_byte_sec": 6.0,
+                                "exit_wait_sec": 0.25}
+    fields = timings.to_fields()
+    assert fields["lines"] == 4
+    assert fields["line_gap_max_sec"] == 4.0
+
+
+def test_run_cli_records_phases(fake_cli, no_cache):
+    utils.METRICS.reset()
+    utils.run_cli("fake", "sleep 0.3 phases", show_output=False, usage_label="test:phases")
+    utils.get_usage_writer().flush()
+    record = [json.loads(line) for line in utils.USAGE_LOG.read_text().splitlines()
+              if '"test:phases"' in line][-1]
+    assert record["lines"] == 2
+    assert 0 <= record["spawn_sec"] <= record["first_byte_sec"] <= record["last_byte_sec"]
+    assert record["first_byte_sec"] >= 0.3
+    assert utils.METRICS.counter("cli_calls_total", label="test:phases") == 1
+    assert utils.METRICS.histogram("cli_first_byte_seconds", label="test:phases").count == 1
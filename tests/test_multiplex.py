@@ -0,0 +1,90 @@
+"""Multiplexed prompts and the Tracer's spec + tasks call."""
+import json
+
+import pytest
+
+from controller import tracer
+from controller.metrics import METRICS
+from controller.multiplex import SubRequest, build_prompt, run_multiplexed, split_sections
+
+SPEC = {"title": "Retry budget", "requirements": ["cap retries"], "acceptance_criteria": ["tests"]}
+TASKS = [{"name": "Add budget", "type": "code"}]
+
+
+def section(key, text):
+    return f"<<<BEGIN {key}>>>\n{text}\n<<<END {key}>>>\n"
+
+
+def test_prompt_states_the_context_once_and_asks_for_every_section():
+    prompt = build_prompt("shared context", [SubRequest("a", "do a", str), SubRequest("b", "do b", str)])
+    assert prompt.count("shared context") == 1
+    for key in ("a", "b"):
+        assert f"[{key}] do {key}" in prompt and f"<<<BEGIN {key}>>>" in prompt
+
+
+def test_split_sections_ignores_unknown_and_unterminated_sections():
+    output = "preamble\n" + section("a", "one") + section("x", "other") + section("a", "dup") + "<<<BEGIN b>>>\ncut"
+    assert split_sections(output, ["a", "b"]) == {"a": "one"}
+
+
+def test_missing_or_unparseable_sections_fall_back():
+    METRICS.reset()
+    calls = []
+
+    def call(prompt):
+        calls.append(prompt)
+        return section("a", "1") + section("b", "not a number")
+
+    requests = [SubRequest("a", "", int, fallback=lambda: "fallback a"),
+                SubRequest("b", "", int, fallback=lambda: "fallback b"),
+                SubRequest("c", "", int, fallback=lambda: "fallback c"),
+                SubRequest("d", "", int)]
+    assert run_multiplexed(call, "ctx", requests, label="t") == {"a": 1, "b": "fallback b", "c": "fallback c"}
+    assert len(calls) == 1
+    assert METRICS.counter("multiplex_fallbacks_total", label="t", key="b") == 1
+    assert METRICS.counter("multiplex_fallbacks_total", label="t", key="d") == 1
+
+
+def test_a_single_request_is_not_multiplexed():
+    assert run_multiplexed(pytest.fail, "ctx", [SubRequest("a", "", int, fallback=lambda: 7)]) == {"a": 7}
+
+
+@pytest.fixture
+def cli_answers(monkeypatch):
+    """Stub tracer.run_cli: each label pops its next answer; returns the labels called."""
+    answers: dict[str, list] = {}
+    called = []
+
+    def run_cli(cli, prompt, usage_label, **kwargs):
+        called.append(usage_label)
+        return answers[usage_label].pop(0), 0
+
+    monkeypatch.setattr(tracer, "run_cli", run_cli)
+    return answers, called
+
+
+def new_spec():
+    return tracer.Spec(id="SPEC-1", title="", description="Add a retry budget",
+                       clarifications=[tracer.Clarification("Scope?", answer="utils")])
+
+
+def test_tracer_drafts_spec_and_tasks_in_one_call(cli_answers):
+    answers, called = cli_answers
+    answers["tracer:clarify:multiplex"] = [section("spec", json.dumps(SPEC)) + section("tasks", json.dumps(TASKS))]
+    t = tracer.Tracer("fake", multiplex=True)
+    spec = t._refine_spec(new_spec())
+    assert spec.title == "Retry budget" and spec.requirements == ["cap retries"]
+    assert t.create_ticket(spec).tasks == [{**TASKS[0], "done": False}]
+    assert called == ["tracer:clarify:multiplex"]
+
+
+def test_tracer_falls_back_to_separate_calls(cli_answers):
+    answers, called = cli_answers
+    answers["tracer:clarify:multiplex"] = ["I ignored the format: " + json.dumps(SPEC)]
+    answers["tracer:clarify:spec"] = [json.dumps(SPEC)]
+    answers["tracer:ticket:tasks"] = [json.dumps(TASKS)]
+    t = tracer.Tracer("fake", multiplex=True)
+    spec = t._refine_spec(new_spec())
+    assert spec.title == "Retry budget"
+    assert t.create_ticket(spec).tasks == [{**TASKS[0], "done": False}]
+    assert called == ["tracer:clarify:multiplex", "tracer:clarify:spec", "tracer:ticket:tasks"]
@@ -0,0 +1,60 @@
+"""Near-duplicate prompt tier."""
+from controller import utils
+from controller.neardup import NearDupIndex, normalize_prompt
+
+PROMPT = """## Task
+Find where **retry budgets** are enforced in the controller and list the files.
+
+```
+controller/utils.py
+controller/ratelimit.py
+```
+Answer with one path per line, most relevant first, and nothing else.
+"""
+REFORMATTED = """# Task
+
+Find where retry budgets are enforced in the controller and list the files.
+  controller/utils.py
+  controller/ratelimit.py
+
+Answer with one path per line, most relevant first, and nothing else.
+"""
+DIFFERENT = "Summarize the ticket backlog for the release notes and group the items by component."
+
+
+def test_formatting_does_not_change_the_normalized_prompt():
+    assert normalize_prompt(PROMPT) == normalize_prompt(REFORMATTED)
+
+
+def test_lookup_finds_reformatted_prompts_in_the_same_scope(tmp_path):
+    index = NearDupIndex(tmp_path / "neardup.jsonl")
+    index.add("orch:locator|claude|m", "key-1", PROMPT)
+    assert index.lookup("orch:locator|claude|m", REFORMATTED) == ("key-1", 1.0)
+    assert index.lookup("orch:locator|claude|other", REFORMATTED) is None
+    assert index.lookup("orch:locator|claude|m", DIFFERENT) is None
+
+
+def test_index_is_shared_through_its_file(tmp_path):
+    NearDupIndex(tmp_path / "neardup.jsonl").add("s", "key-1", PROMPT)
+    reader = NearDupIndex(tmp_path / "neardup.jsonl")
+    assert reader.lookup("s", REFORMATTED)[0] == "key-1"
+    NearDupIndex(tmp_path / "neardup.jsonl").add("s", "key-2", DIFFERENT)
+    assert reader.lookup("s", DIFFERENT)[0] == "key-2"
+
+
+def test_index_is_bounded(tmp_path):
+    index = NearDupIndex(tmp_path / "neardup.jsonl", max_entries=2)
+    for i in range(5):
+        index.add("s", f"key-{i}", f"prompt number {i} " + DIFFERENT)
+    assert len(index) == 2
+    assert len((tmp_path / "neardup.jsonl").read_text().splitlines()) <= 4
+
+
+def test_run_cli_reuses_answers_for_near_duplicates(fake_cli, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_NEARDUP_LABELS", "test")
+    first = utils.run_cli("fake", "echo " + PROMPT, show_output=False, usage_label="test")
+    again = utils.run_cli("fake", "echo " + REFORMATTED, show_output=False, usage_label="test")
+    assert again == first
+    assert fake_cli() == 1
+    utils.run_cli("fake", "echo " + REFORMATTED, show_output=False, usage_label="other")
+    assert fake_cli() == 2
@@ -0,0 +1,109 @@
+"""Warm CLI worker pool."""
+import sys
+import time
+
+import pytest
+
+from controller import utils
+from controller.pool import WorkerPool
+
+CAT = [sys.executable, "-c", "import sys; sys.stdout.write(sys.stdin.read())"]
+
+
+def wait_for_idle(pool, count):
+    deadline = time.monotonic() + 10
+    while len(pool._idle) < count:
+        assert time.monotonic() < deadline, "pool never filled"
+        time.sleep(0.02)
+
+
+def answer(process, prompt):
+    output, _ = process.communicate(prompt.encode(), timeout=10)
+    return output.decode()
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pools = []
+
+    def make(**kwargs):
+        pools.append(WorkerPool(CAT, cwd=tmp_path, **kwargs))
+        return pools[-1]
+
+    yield make
+    for p in pools:
+        p.close()
+
+
+def test_warm_worker_answers_one_prompt(pool):
+    p = pool(size=1)
+    wait_for_idle(p, 1)
+    process, warm = p.acquire()
+    assert warm
+    assert answer(process, "hello") == "hello"
+    wait_for_idle(p, 1)
+    assert p.stats.hits == 1 and p.stats.spawned == 2
+
+
+def test_empty_pool_spawns_cold(pool):
+    p = pool(size=0)
+    process, warm = p.acquire()
+    assert not warm
+    assert answer(process, "cold") == "cold"
+    assert p.stats.misses == 1
+
+
+def test_idle_workers_are_recycled_by_age(pool):
+    p = pool(size=1, max_age=0.2)
+    wait_for_idle(p, 1)
+    first = p._idle[0].process
+    time.sleep(0.3)
+    process, _ = p.acquire()
+    assert process is not first
+    assert p.stats.recycled >= 1
+    answer(process, "")
+
+
+def test_idle_set_is_respawned_after_max_uses(pool):
+    p = pool(size=2, max_uses=2)
+    wait_for_idle(p, 2)
+    process, warm = p.acquire()
+    assert warm
+    answer(process, "")
+    survivor = p._idle[0].process
+    process, warm = p.acquire()
+    answer(process, "")
+    assert p.stats.generations == 2
+    assert survivor.poll() is not None
+    wait_for_idle(p, 2)
+    assert survivor not in [w.process for w in p._idle]
+
+
+def test_run_cli_takes_pooled_workers(fake_cli, no_cache, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_POOL_SIZE", "1")
+    monkeypatch.setenv("ORCHESTRATOR_POOL_LABELS", "test")
+    try:
+        pool = utils._pool_for("fake", utils.CLI_CONFIGS["fake"], None, utils.WORKSPACE, "test")
+        wait_for_idle(pool, 1)
+        output, code = utils.run_cli("fake", "echo pooled", show_output=False, usage_label="test",
+                                     workspace=utils.WORKSPACE)
+        assert (output, code) == ("via=stdin\necho pooled\n", 0)
+        assert utils.pool_stats()["fake:None"]["hits"] == 1
+    finally:
+        utils.shutdown_pools()
+
+
+def test_pool_is_replaced_when_the_command_changes(fake_cli, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_POOL_SIZE", "1")
+    monkeypatch.setenv("ORCHESTRATOR_POOL_LABELS", "test")
+    config = {**utils.CLI_CONFIGS["fake"], "stream_args": ["--json"]}
+    try:
+        plain = utils._pool_for("fake", config, None, utils.WORKSPACE, "test")
+        assert utils._pool_for("fake", config, None, utils.WORKSPACE, "test") is plain
+        monkeypatch.setenv("ORCHESTRATOR_STRUCTURED_OUTPUT", "1")
+        structured = utils._pool_for("fake", config, None, utils.WORKSPACE, "test")
+        assert structured is not plain
+        assert structured.cmd[-1] == "--json" and "--json" not in plain.cmd
+        assert plain._closed
+    finally:
+        utils.shutdown_pools()
@@ -0,0 +1,56 @@
+"""Prometheus text exposition and the per-process textfile."""
+import os
+
+from controller import utils
+from controller.metrics import MetricsRegistry
+from controller.promexport import TextfileExporter, render_prometheus
+
+
+def test_exposition_format():
+    registry = MetricsRegistry()
+    registry.inc("cli_calls_total", 2, label='say "hi"\n')
+    registry.set("cache_entries", 1.5)
+    registry.observe("call_seconds", 0.3, buckets=(0.1, 1), label="x")
+    assert render_prometheus(registry, common={"instance_id": "a"}).splitlines() == [
+        "# TYPE orchestrator_cli_calls_total counter",
+        'orchestrator_cli_calls_total{instance_id="a",label="say \\"hi\\"\\n"} 2',
+        "# TYPE orchestrator_cache_entries gauge",
+        'orchestrator_cache_entries{instance_id="a"} 1.5',
+        "# TYPE orchestrator_call_seconds histogram",
+        'orchestrator_call_seconds_bucket{instance_id="a",label="x",le="0.1"} 0',
+        'orchestrator_call_seconds_bucket{instance_id="a",label="x",le="1"} 1',
+        'orchestrator_call_seconds_bucket{instance_id="a",label="x",le="+Inf"} 1',
+        'orchestrator_call_seconds_sum{instance_id="a",label="x"} 0.3',
+        'orchestrator_call_seconds_count{instance_id="a",label="x"} 1',
+    ]
+
+
+def test_exporter_writes_then_removes_a_per_run_file(tmp_path):
+    registry = MetricsRegistry()
+    registry.inc("cli_calls_total")
+    kept = TextfileExporter(tmp_path / "kept.prom", registry)
+    kept.close()
+    assert "orchestrator_cli_calls_total 1" in (tmp_path / "kept.prom").read_text()
+    per_run = TextfileExporter(tmp_path / "run.prom", registry, remove_on_close=True)
+    per_run.write()
+    per_run.close()
+    assert not (tmp_path / "run.prom").exists()
+
+
+def test_each_process_gets_its_own_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "_PROM_EXPORTER", None)
+    monkeypatch.setenv("ORCHESTRATOR_PROM_FILE", str(tmp_path / "orchestrator.prom"))
+    monkeypatch.setenv("ORCHESTRATOR_PROM_INSTANCE", "rpi-main")
+    exporter = utils.get_prom_exporter()
+    try:
+        assert exporter.path == tmp_path / "orchestrator-rpi-main.prom"
+        assert exporter.labels == {"instance_id": "rpi-main"} and not exporter.remove_on_close
+    finally:
+        exporter._stop.set()
+    monkeypatch.setattr(utils, "_PROM_EXPORTER", None)
+    monkeypatch.delenv("ORCHESTRATOR_PROM_INSTANCE")
+    exporter = utils.get_prom_exporter()
+    try:
+        assert exporter.path.name == f"orchestrator-{os.getpid()}.prom" and exporter.remove_on_close
+    finally:
+        exporter._stop.set()
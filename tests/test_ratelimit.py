@@ -0,0 +1,121 @@
+"""Rate limiter admission and its use in run_cli."""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from controller import utils
+from controller.ratelimit import RateLimiter, parse_limits
+
+
+def queue_in_order(limiter, tokens):
+    """Start one acquiring thread per entry, each queued before the next starts."""
+    admitted = []
+    threads = []
+    for name, count in tokens:
+        def take(name=name, count=count):
+            lease = limiter.acquire(count)
+            admitted.append(name)
+            lease.release()
+
+        threads.append(threading.Thread(target=take))
+        threads[-1].start()
+        deadline = time.monotonic() + 5
+        while limiter.stats()["queued"] < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.005)
+    return admitted, threads
+
+
+def test_concurrency_cap_admits_in_arrival_order():
+    limiter = RateLimiter(max_concurrent=1)
+    held = limiter.acquire()
+    admitted, threads = queue_in_order(limiter, [("a", 0), ("b", 0), ("c", 0)])
+    assert admitted == []
+    held.release()
+    for t in threads:
+        t.join(5)
+    assert admitted == ["a", "b", "c"]
+
+
+def test_small_requests_do_not_overtake_a_large_one():
+    limiter = RateLimiter(tpm=60000)  # 1000 tokens/s
+    limiter.acquire(60000).release(60000)
+    start = time.monotonic()
+    admitted, threads = queue_in_order(limiter, [("large", 300), ("small", 1), ("tiny", 1)])
+    for t in threads:
+        t.join(5)
+    assert admitted == ["large", "small", "tiny"]
+    assert time.monotonic() - start >= 0.25
+
+
+def test_requests_per_minute_refill():
+    limiter = RateLimiter(rpm=600)  # 10 requests/s, a minute's worth of burst
+    for _ in range(600):
+        limiter.acquire().release()
+    start = time.monotonic()
+    lease = limiter.acquire()
+    assert 0.05 <= lease.waited <= 0.5
+    assert time.monotonic() - start >= 0.05
+
+
+def test_underestimates_leave_the_bucket_in_debt():
+    limiter = RateLimiter(tpm=600)
+    limiter.acquire(10).release(used_tokens=1000)
+    assert limiter.stats()["tokens_left"] < 0
+
+
+def test_async_waiters_do_not_block_the_loop():
+    limiter = RateLimiter(max_concurrent=1)
+    order = []
+
+    async def call(name, hold):
+        lease = await limiter.aacquire()
+        order.append(name)
+        await asyncio.sleep(hold)
+        lease.release()
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        tick_task = asyncio.ensure_future(ticker())
+        await asyncio.gather(call("a", 0.2), call("b", 0), call("c", 0))
+        tick_task.cancel()
+        return ticks
+
+    assert asyncio.run(main()) >= 5
+    assert order == ["a", "b", "c"]
+
+
+def test_parse_limits():
+    assert parse_limits("claude:rpm=50,tpm=400000,concurrent=4;copilot@mini:rpm=x,foo=1;bad") == {
+        "claude": {"rpm": 50.0, "tpm": 400000.0, "max_concurrent": 4.0},
+    }
+
+
+@pytest.fixture
+def fresh_limiters(monkeypatch):
+    monkeypatch.setattr(utils, "_RATE_LIMITERS", {})
+
+
+def test_run_cli_queues_past_the_concurrency_cap(fake_cli, no_cache, fresh_limiters, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_RATE_LIMITS", "fake:concurrent=1")
+    threads = [threading.Thread(target=utils.run_cli, args=("fake", f"sleep 0.3 call {i}"),
+                                kwargs={"show_output": False, "usage_label": "test:rate"}) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    utils.get_usage_writer().flush()
+    waits = sorted(json.loads(line).get("queue_wait_sec", 0) for line in utils.USAGE_LOG.read_text().splitlines()
+                   if '"test:rate"' in line)
+    assert len(waits) == 3
+    assert waits[0] < 0.2 and waits[1] >= 0.25 and waits[2] >= 0.5
+    assert utils.rate_limit_stats()["fake@default"]["active"] == 0
@@ -0,0 +1,57 @@
+"""The selector-based output reader behind run_cli's deadlines."""
+import subprocess
+import sys
+import time
+
+import pytest
+
+from controller import utils
+
+
+def child(code):
+    return subprocess.Popen([sys.executable, "-c", code], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def read(process, timeout=30, stall_timeout=0, stdin_data=None):
+    seen = []
+    try:
+        reason = utils._read_process_output(process, time.monotonic() + timeout, stall_timeout, seen.append,
+                                            stdin_data=stdin_data)
+    finally:
+        utils._kill_process_group(process)
+    return reason, "".join(seen)
+
+
+def test_deadline_holds_when_the_cli_stops_mid_line():
+    process = child("import sys, time; sys.stdout.write('half a line'); sys.stdout.flush(); time.sleep(30)")
+    start = time.monotonic()
+    assert read(process, timeout=1)[0] == "timeout"
+    assert time.monotonic() - start < 5
+
+
+def test_partial_lines_count_as_output_for_the_stall_watchdog():
+    process = child("import sys, time\n"
+                    "for _ in range(8):\n    sys.stdout.write('.'); sys.stdout.flush(); time.sleep(0.25)\n"
+                    "print()")
+    assert read(process, stall_timeout=1) == (None, "........\n")
+
+
+def test_stall_watchdog_fires_on_silence():
+    process = child("import time; print('start', flush=True); time.sleep(30)")
+    assert read(process, stall_timeout=0.5) == ("stall", "start\n")
+
+
+def test_multibyte_characters_split_across_reads():
+    process = child("import sys, time\n"
+                    "data = 'é中\\n'.encode()\n"
+                    "for b in data:\n    sys.stdout.buffer.write(bytes([b])); sys.stdout.flush(); time.sleep(0.02)")
+    assert read(process) == (None, "é中\n")
+
+
+@pytest.mark.parametrize("size", [10, 4 * 1024 * 1024])
+def test_stdin_is_written_while_output_is_read(size):
+    # The child echoes as it reads, so a blocking write of a large prompt would deadlock.
+    process = child("import sys\nfor line in sys.stdin: sys.stdout.write(line)")
+    data = ("x" * 99 + "\n") * (size // 100 + 1)
+    assert read(process, stdin_data=data.encode()) == (None, data)
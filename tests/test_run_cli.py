@@ -0,0 +1,211 @@
+"""run_cli / arun_cli end to end against tests/fake_cli.py."""
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from controller import utils
+from controller.output import OutputHandle
+from conftest import REPO_ROOT
+
+
+def run(prompt, **kwargs):
+    kwargs.setdefault("show_output", False)
+    kwargs.setdefault("usage_label", "test")
+    return utils.run_cli("fake", prompt, **kwargs)
+
+
+def arun(prompt, **kwargs):
+    kwargs.setdefault("show_output", False)
+    kwargs.setdefault("usage_label", "test")
+    return utils.arun_cli("fake", prompt, **kwargs)
+
+
+@pytest.mark.parametrize("transport", ["argv", "stdin", "file"])
+def test_prompt_transports(fake_cli, monkeypatch, transport):
+    monkeypatch.setenv("ORCHESTRATOR_PROMPT_TRANSPORT", transport)
+    prompt = f"echo {transport} " + "x" * 1000
+    output, code = run(prompt)
+    assert code == 0
+    assert output == f"via={transport}\n{prompt}\n"
+    assert not list(utils.PROMPT_FILE_DIR.glob("prompt-*"))
+
+
+def test_large_prompt_leaves_argv(fake_cli):
+    prompt = "echo " + "x" * (utils.ARGV_PROMPT_MAX_BYTES + 1)
+    output, code = run(prompt)
+    assert code == 0
+    assert output.startswith("via=stdin\n")
+
+
+@pytest.mark.parametrize("mode, stdin_prompt, size, expected", [
+    ("auto", True, 10, "argv"),
+    ("auto", True, utils.ARGV_PROMPT_MAX_BYTES + 1, "stdin"),
+    ("auto", False, utils.ARGV_PROMPT_MAX_BYTES + 1, "file"),
+    ("stdin", False, 10, "file"),
+    ("bogus", True, 10, "argv"),
+])
+def test_transport_choice(monkeypatch, mode, stdin_prompt, size, expected):
+    monkeypatch.setenv("ORCHESTRATOR_PROMPT_TRANSPORT", mode)
+    assert utils._prompt_transport({"stdin_prompt": stdin_prompt}, size) == expected
+
+
+def test_megabyte_prompt_reaches_a_cli_without_stdin(fake_cli, no_cache, monkeypatch):
+    monkeypatch.setitem(utils.CLI_CONFIGS, "fake", {**utils.CLI_CONFIGS["fake"], "stdin_prompt": False})
+    prompt = "echo " + "x" * (1024 * 1024)
+    output, code = asyncio.run(arun(prompt))
+    assert code == 0
+    assert output == f"via=file\n{prompt}\n"
+    assert not list(utils.PROMPT_FILE_DIR.glob("prompt-*"))
+
+
+def test_prompt_file_is_removed_after_a_timeout(fake_cli, no_cache, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_PROMPT_TRANSPORT", "file")
+    assert run("hang", timeout=1) == ("[TIMEOUT]", -1)
+    assert not list(utils.PROMPT_FILE_DIR.glob("prompt-*"))
+
+
+def test_prompt_file_template_without_a_file_flag():
+    config = {"cmd": "agent", "args": [], "prompt_flag": "-p"}
+    cmd = utils._build_command(config, None, None, prompt_file=utils.PROMPT_FILE_DIR / "prompt-1.md")
+    assert cmd[:2] == ["agent", "-p"]
+    assert str(utils.PROMPT_FILE_DIR / "prompt-1.md") in cmd[2]
+
+
+def test_timeout_kills_the_cli(fake_cli, no_cache):
+    start = time.monotonic()
+    output, code = run("hang", timeout=1)
+    assert (output, code) == ("[TIMEOUT]", -1)
+    assert time.monotonic() - start < 10
+
+
+def test_stall_timeout_kills_a_quiet_cli(fake_cli, no_cache):
+    start = time.monotonic()
+    output, code = run("hang", timeout=60, stall_timeout=1)
+    assert (output, code) == ("[TIMEOUT] no output for 1s", -1)
+    assert time.monotonic() - start < 10
+
+
+def test_async_stall_timeout(fake_cli, no_cache):
+    output, code = asyncio.run(arun("hang", timeout=60, stall_timeout=1))
+    assert (output, code) == ("[TIMEOUT] no output for 1s", -1)
+
+
+def test_identical_threaded_calls_coalesce(fake_cli):
+    lines = []
+    results = []
+
+    def call(follow):
+        results.append(run("sleep 1 threads", on_line=lines.append if follow else None))
+
+    threads = [threading.Thread(target=call, args=(i == 3,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert fake_cli() == 1
+    assert results == [("via=argv\nsleep 1 threads\n", 0)] * 4
+    assert lines == ["via=argv", "sleep 1 threads"]
+
+
+def test_identical_async_calls_coalesce(fake_cli):
+    async def main():
+        return await asyncio.gather(*(arun("sleep 1 asyncio") for _ in range(4)))
+
+    assert asyncio.run(main()) == [("via=argv\nsleep 1 asyncio\n", 0)] * 4
+    assert fake_cli() == 1
+
+
+def test_coalesced_handles_are_independent(fake_cli, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_OUTPUT_SPILL_KB", "1")
+    expected = "via=argv\nsleep 1 " + "x" * 4000 + "\n"
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(run(expected.split("\n")[1], as_handle=True)))
+               for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert fake_cli() == 1
+    (first, _), (second, _) = results
+    assert first is not second
+    first.close()
+    assert str(second) == expected
+    assert "x" * 100 in second
+
+
+def test_cache_round_trip(fake_cli):
+    first = run("echo cached")
+    assert run("echo cached") == first
+    assert asyncio.run(arun("echo cached")) == first
+    assert fake_cli() == 1
+
+
+def test_cache_evicts_least_recently_used(fake_cli, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_CACHE_MAX_ENTRIES", "2")
+    for prompt in ("echo a", "echo b", "echo a", "echo c"):
+        run(prompt)
+    assert fake_cli() == 3
+    run("echo a")
+    assert fake_cli() == 3
+    run("echo b")
+    assert fake_cli() == 4
+
+
+def test_large_output_spills_to_disk(fake_cli, monkeypatch):
+    monkeypatch.setenv("ORCHESTRATOR_OUTPUT_SPILL_KB", "1")
+    expected = "".join(f"line {i}\n" for i in range(2000))
+    output, code = run("lines 2000", as_handle=True)
+    assert isinstance(output, OutputHandle) and output.spilled
+    assert code == 0
+    assert str(output) == expected
+    assert run("lines 2000") == (expected, 0)
+    assert fake_cli() == 1
+
+
+@pytest.mark.parametrize("policy", ["block", "drop", "coalesce"])
+def test_async_line_policy(fake_cli, no_cache, monkeypatch, policy):
+    monkeypatch.setenv("ORCHESTRATOR_LINE_QUEUE", "10")
+    seen = []
+    output, code = asyncio.run(arun("lines 2000", on_line=seen.append, line_policy=policy))
+    assert code == 0 and output.count("\n") == 2000
+    if policy == "block":
+        assert seen == [f"line {i}" for i in range(2000)]
+    elif policy == "drop":
+        assert seen[0] == "line 0" and any(line.endswith("line(s) dropped]") for line in seen)
+    else:
+        assert seen[-1] == "line 1999" and len(seen) < 2000
+
+
+def test_record_effects_replays_file_changes(fake_cli, monkeypatch, tmp_path):
+    monkeypatch.setenv("ORCHESTRATOR_CACHE_POLICY", "test=record-effects")
+    workspace = tmp_path / "ws"
+    workspace.mkdir()
+    assert run("write out.txt hello", workspace=workspace)[1] == 0
+    (workspace / "out.txt").unlink()
+    assert run("write out.txt hello", workspace=workspace)[1] == 0
+    assert fake_cli() == 1
+    assert (workspace / "out.txt").read_text() == "write out.txt hello"
+
+
+def test_record_effects_skips_runs_overlapping_another_process(fake_cli, monkeypatch, tmp_path):
+    monkeypatch.setenv("ORCHESTRATOR_CACHE_POLICY", "test=record-effects")
+    workspace = tmp_path / "ws"
+    workspace.mkdir()
+    holder = subprocess.Popen(
+        [sys.executable, "-c",
+         "import sys, time; sys.path.insert(0, sys.argv[1]); from controller.cache import CallWindow\n"
+         "with CallWindow(sys.argv[2]):\n    print('in', flush=True); time.sleep(30)",
+         str(REPO_ROOT), str(workspace / "state")],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline() == "in\n"
+        run("write out.txt hello", workspace=workspace)
+    finally:
+        holder.kill()
+        holder.wait()
+    run("write out.txt hello", workspace=workspace)
+    assert fake_cli() == 2
@@ -0,0 +1,51 @@
+"""Coalescing identical in-flight calls."""
+from controller import singleflight
+from controller.singleflight import Flight, FlightGroup
+
+
+def test_leader_without_followers_keeps_nothing():
+    group = FlightGroup()
+    flight, leader = group.join("key")
+    assert leader
+    flight.publish("one\ntwo\n")
+    seen = []
+    flight.subscribe(seen.append)
+    assert seen == []
+
+
+def test_follower_gets_replay_and_live_lines():
+    group = FlightGroup()
+    flight, _ = group.join("key")
+    flight.publish("before anyone follows\n")
+    follower, leader = group.join("key")
+    assert follower is flight and not leader
+    flight.publish("a\nb\n")
+    seen = []
+    flight.subscribe(seen.append)
+    flight.publish("c\n")
+    group.finish("key", flight, ("out", 0))
+    assert seen == ["a\n", "b\n", "c\n"]
+    assert flight.wait(0) and flight.result == ("out", 0)
+
+
+def test_replay_is_capped(monkeypatch):
+    monkeypatch.setattr(singleflight, "REPLAY_LINES", 3)
+    flight = Flight()
+    flight.followers = 1
+    flight.publish("".join(f"{i}\n" for i in range(10)))
+    seen = []
+    flight.subscribe(seen.append)
+    assert seen == ["7\n", "8\n", "9\n"]
+
+
+def test_share_only_runs_for_followed_flights():
+    group = FlightGroup()
+    alone, _ = group.join("alone")
+    group.finish("alone", alone, ["leader's"], share=lambda result: list(result))
+    assert alone.result == ["leader's"]
+
+    result = ["leader's"]
+    flight, _ = group.join("key")
+    group.join("key")
+    group.finish("key", flight, result, share=lambda r: list(r))
+    assert flight.result == result and flight.result is not result
@@ -0,0 +1,62 @@
+"""Structured (stream-json) CLI output."""
+import json
+
+from controller import utils
+from controller.streamjson import ClaudeStreamParser, StreamParser, make_parser, split_lines
+
+
+def event(**fields):
+    return json.dumps(fields) + "\n"
+
+
+def test_parser_shows_text_and_tools_and_keeps_the_result():
+    parser = ClaudeStreamParser()
+    shown = parser.feed(event(type="system", subtype="init")
+                        + event(type="assistant", message={"content": [
+                            {"type": "text", "text": "Looking\nat it"},
+                            {"type": "tool_use", "name": "Grep"}]}))
+    assert shown == "Looking\nat it\n[tool] Grep\n"
+    assert parser.output_text == "Looking\nat it\n"
+    parser.feed(event(type="result", result="final answer", total_cost_usd=0.5,
+                      usage={"input_tokens": 4, "cache_creation_input_tokens": 6,
+                             "cache_read_input_tokens": 20, "output_tokens": 9}))
+    assert parser.output_text == "final answer"
+    usage = parser.usage()
+    assert (usage["in_tokens"], usage["cached_in_tokens"], usage["out_tokens"]) == (30, 20, 9)
+    assert usage["cost_usd"] == 0.5
+    assert usage["ttft_sec"] is not None
+
+
+def test_non_json_lines_pass_through_as_text():
+    parser = ClaudeStreamParser()
+    assert parser.feed("Traceback (most recent call last):\n[1, 2]\n") == "Traceback (most recent call last):\n[1, 2]\n"
+    assert parser.output_text == "Traceback (most recent call last):\n[1, 2]\n"
+    assert parser.usage()["in_tokens"] is None
+
+
+def test_plain_parser_reports_nothing():
+    parser = make_parser(None)
+    assert type(parser) is StreamParser
+    parser.feed("text\n")
+    assert parser.output_text == "text\n"
+    assert set(parser.usage().values()) == {None}
+
+
+def test_split_lines_only_splits_on_newlines():
+    assert split_lines("a\rb\nc d\ne") == ["a\rb\n", "c d\n", "e"]
+
+
+def test_run_cli_logs_reported_tokens(fake_cli, no_cache, monkeypatch):
+    monkeypatch.setitem(utils.CLI_CONFIGS, "fake", {**utils.CLI_CONFIGS["fake"], "stream_args": ["--stream-json"],
+                                                     "stream_format": "claude-stream-json"})
+    monkeypatch.setenv("ORCHESTRATOR_STRUCTURED_OUTPUT", "1")
+    lines = []
+    output, code = utils.run_cli("fake", "echo structured", show_output=False, usage_label="test:stream",
+                                 on_line=lines.append)
+    assert (output, code) == ("echo structured", 0)
+    assert lines == ["warning: not an event", "[tool] Read", "thinking about echo structured"]
+    utils.get_usage_writer().flush()
+    records = [json.loads(line) for line in utils.USAGE_LOG.read_text().splitlines()]
+    record = [r for r in records if r["label"] == "test:stream"][-1]
+    assert record["token_source"] == "reported"
+    assert (record["in_tokens"], record["out_tokens"], record["cached_in_tokens"]) == (12, 3, 10)
@@ -0,0 +1,84 @@
+"""Chrome trace export."""
+import asyncio
+import json
+import threading
+
+import pytest
+
+from controller import tracing
+
+
+@pytest.fixture
+def traces(tmp_path):
+    tracing.enable_tracing(tmp_path)
+    yield tmp_path
+    tracing.enable_tracing(enabled=False)
+    tracing._TRACE_DIR = None
+    tracing._RUN = None
+
+
+def load(directory):
+    (path,) = directory.glob("*.json")
+    return json.loads(path.read_text())["traceEvents"]
+
+
+def test_disabled_spans_are_noops(tmp_path):
+    tracing.enable_tracing(tmp_path, enabled=False)
+    try:
+        assert tracing.span("x") is tracing._NOOP
+        with tracing.trace_run("off"):
+            with tracing.span("x"):
+                pass
+    finally:
+        tracing._TRACE_DIR = None
+    assert not list(tmp_path.iterdir())
+
+
+def test_run_writes_nested_spans_and_instants(traces):
+    @tracing.traced("decorated")
+    def work():
+        tracing.instant("cache_hit", key="k", missing=None)
+
+    with tracing.trace_run("rpi loop"):
+        with tracing.span("phase", cat="rpi", n=1) as s:
+            s.set(result="ok")
+            work()
+        with pytest.raises(ValueError):
+            with tracing.span("broken"):
+                raise ValueError
+
+    events = load(traces)
+    assert {"ph": "M", "name": "process_name", "pid": events[0]["pid"], "args": {"name": "rpi loop"}} == events[0]
+    spans = {e["name"]: e for e in events if e["ph"] == "X"}
+    assert set(spans) == {"rpi loop", "phase", "decorated", "broken"}
+    assert spans["phase"]["args"] == {"n": 1, "result": "ok"}
+    assert spans["broken"]["args"] == {"error": "ValueError"}
+    outer, inner = spans["rpi loop"], spans["decorated"]
+    assert outer["ts"] <= inner["ts"] and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    (hit,) = [e for e in events if e["ph"] == "i"]
+    assert hit["args"] == {"key": "k"}
+
+
+def test_threads_and_tasks_get_their_own_lanes(traces):
+    async def task_work():
+        with tracing.span("in task"):
+            await asyncio.sleep(0)
+
+    async def gather():
+        await asyncio.gather(task_work(), task_work())
+
+    def thread_work():
+        with tracing.span("in thread"):
+            pass
+
+    with tracing.trace_run("lanes"):
+        thread = threading.Thread(target=thread_work, name="worker-1")
+        thread.start()
+        thread.join()
+        asyncio.run(gather())
+
+    events = load(traces)
+    lanes = {e["tid"] for e in events if e["ph"] == "X" and e["name"].startswith("in ")}
+    assert len(lanes) == 3
+    names = [e["args"]["name"] for e in events if e["name"] == "thread_name"]
+    assert "worker-1" in names
@@ -0,0 +1,84 @@
+"""Buffered usage log writer and rotation."""
+import gzip
+import json
+import os
+import threading
+import time
+
+from controller.usagelog import UsageLogWriter, usage_log_files
+
+
+def read_records(path):
+    records = []
+    for segment in usage_log_files(path):
+        opener = gzip.open if segment.suffix == ".gz" else open
+        with opener(segment, "rt", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+def test_concurrent_writers_never_interleave(tmp_path):
+    log = tmp_path / "usage.jsonl"
+    writer = UsageLogWriter(log, flush_records=7)
+
+    def write(worker):
+        for i in range(200):
+            writer.write({"worker": worker, "i": i, "pad": "x" * 500})
+
+    threads = [threading.Thread(target=write, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.close()
+    records = read_records(log)
+    assert len(records) == 1600
+    for w in range(8):
+        assert [r["i"] for r in records if r["worker"] == w] == list(range(200))
+
+
+def test_partial_batches_are_flushed_on_the_interval(tmp_path):
+    log = tmp_path / "usage.jsonl"
+    writer = UsageLogWriter(log, flush_records=100, flush_interval=0.1)
+    writer.write({"n": 1})
+    deadline = time.monotonic() + 5
+    while not log.exists() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert read_records(log) == [{"n": 1}]
+    writer.close()
+
+
+def test_rotates_by_size_and_gzips_segments(tmp_path):
+    log = tmp_path / "usage.jsonl"
+    writer = UsageLogWriter(log, flush_records=1, max_bytes=2000, compress=True)
+    for i in range(50):
+        writer.write({"i": i, "pad": "x" * 100})
+        writer.flush()
+    writer.close()
+    files = usage_log_files(log)
+    assert len(files) > 2 and files[-1] == log
+    assert all(f.suffix == ".gz" for f in files[:-1])
+    assert all(f.stat().st_size <= 2000 for f in files if f.suffix != ".gz")
+    assert [r["i"] for r in read_records(log)] == list(range(50))
+
+
+def test_rotates_when_the_day_changes(tmp_path):
+    log = tmp_path / "usage.jsonl"
+    log.write_text(json.dumps({"day": "old"}) + "\n")
+    yesterday = time.time() - 86400
+    os.utime(log, (yesterday, yesterday))
+    writer = UsageLogWriter(log)
+    writer.write({"day": "new"})
+    writer.close()
+    files = usage_log_files(log)
+    assert len(files) == 2
+    assert json.loads(files[-1].read_text()) == {"day": "new"}
+    assert [r["day"] for r in read_records(log)] == ["old", "new"]
+
+
+def test_writes_after_close_go_straight_to_disk(tmp_path):
+    log = tmp_path / "usage.jsonl"
+    writer = UsageLogWriter(log)
+    writer.close()
+    writer.write({"late": True})
+    assert read_records(log) == [{"late": True}]
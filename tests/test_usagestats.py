@@ -0,0 +1,65 @@
+"""Usage log summaries."""
+import gzip
+import json
+
+from controller import utils
+from controller.usagestats import UsageReport, build_report
+
+
+def record(hour=0, day=1, **fields):
+    return {"ts": f"2026-01-{day:02d}T{hour:02d}:00:00", "label": "rpi:plan", "model": "m", "cli": "claude",
+            "in_tokens": 10, "out_tokens": 5, "elapsed_sec": 2.0, **fields}
+
+
+def write_log(path, records, mode="a"):
+    with open(path, mode, encoding="utf-8") as f:
+        for r in records:
+            f.write(json.dumps(r) + "\n")
+
+
+def test_failures_count_kills_and_non_zero_exits():
+    report = UsageReport()
+    for fields in ({}, {"exit_code": 0}, {"exit_code": 2}, {"kill_reason": "stall"}):
+        report.add(record(**fields))
+    assert report.totals.calls == 4
+    assert report.totals.failures == 2
+    assert report.groups["label"]["rpi:plan"].failures == 2
+
+
+def test_report_keeps_only_recent_hours(tmp_path):
+    log = tmp_path / "usage.jsonl"
+    write_log(log, [record(hour=h % 24, day=1 + h // 24) for h in range(48)])
+    report = build_report([log], active=log, index_path=tmp_path / "idx.json", keep_hours=12)
+    assert len(report.hours) == 12
+    assert min(report.hours) == "2026-01-02T12"
+    assert report.totals.calls == 48
+
+    write_log(log, [record(hour=0, day=3)])
+    report = build_report([log], active=log, index_path=tmp_path / "idx.json", keep_hours=12)
+    assert len(report.hours) == 12 and max(report.hours) == "2026-01-03T00"
+    assert report.totals.calls == 49
+
+
+def test_repeated_reports_read_only_new_lines(tmp_path):
+    log = tmp_path / "usage.jsonl"
+    index = tmp_path / "idx.json"
+    write_log(log, [record(hour=1)] * 3)
+    assert build_report([log], active=log, index_path=index).totals.calls == 3
+
+    # Rotated and gzipped: the segment is recognised by its first line.
+    rotated = tmp_path / "usage-20260101-000000.jsonl.gz"
+    with gzip.open(rotated, "wb") as f:
+        f.write(log.read_bytes())
+    log.unlink()
+    write_log(log, [record(hour=2, exit_code=1)])
+    report = build_report([rotated, log], active=log, index_path=index)
+    assert report.totals.calls == 4 and report.totals.failures == 1
+    assert report.scanned_bytes == log.stat().st_size
+    assert report.throughput() == [("2026-01-01T01", 3, 45, 6.0), ("2026-01-01T02", 1, 15, 2.0)]
+
+
+def test_run_cli_records_the_exit_code(fake_cli, no_cache):
+    assert utils.run_cli("fake", "exit 3 now", show_output=False, usage_label="test:exit")[1] == 3
+    utils.get_usage_writer().flush()
+    records = [json.loads(line) for line in utils.USAGE_LOG.read_text().splitlines()]
+    assert [r["exit_code"] for r in records if r["label"] == "test:exit"] == [3]